@@ -1,13 +1,26 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response, g
 import os
+import time
 import base64
-import numpy as np
 from datetime import datetime
 import secrets
+import numpy as np
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Import our custom modules
 from models.database import Database
-from models.face_recognition import FaceRecognitionSystem
+from models.face_recognition import FaceRecognitionSystem, FACE_CROP_SIZE, FACE_CROP_MARGIN, face_crop_box, get_detector
+from models.ann_index import create_gallery_from_env
+from models.face_gallery import ENCODING_SIZE
+from models.recognition_executor import RecognitionExecutor, TIMEOUT_MESSAGE
+from models.micro_batcher import MicroBatcher
+from models.encoding_cache import EncodingCache, frame_key
+from models.enrollment_store import EnrollmentStore
+from models.frame_stream import iter_frames, BestFrames
+from models.face_tracker import FaceTracker
+from models import metrics, profiler as request_profiler
+from models.lazy_import import preload
+from models.warmup import Warmup, synthetic_frame, jpeg_bytes
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)  # Generate a secure secret key
@@ -15,18 +28,261 @@ app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Initialize database and face recognition system
-db = Database()
-face_system = FaceRecognitionSystem()
+# Build the gallery snapshot with: python -m models.gallery_snapshot database/users.db database/face_gallery
+# Set FACE_MATCHER=ivf to use the approximate index for very large galleries; tune its
+# recall/latency trade-off with FACE_MATCHER_NPROBE (cells scanned per query, default 8),
+# FACE_MATCHER_NLIST (cells, default ~sqrt(N)), FACE_MATCHER_PQ_M (PQ sub-spaces, default off),
+# FACE_MATCHER_RERANK (PQ shortlist, default 64) and FACE_MATCHER_MIN_TRAIN_SIZE (default 10000)
+db = Database(snapshot_path='database/face_gallery', gallery=create_gallery_from_env())
+# Repeated uploads of the same frame reuse its analysis; ENCODING_CACHE_SIZE=0 disables the cache
+ENCODING_CACHE_SIZE = int(os.environ.get('ENCODING_CACHE_SIZE', '1024'))
+encoding_cache = EncodingCache(
+    max_entries=ENCODING_CACHE_SIZE,
+    max_bytes=int(float(os.environ.get('ENCODING_CACHE_MB', '16')) * 1024 * 1024),
+    ttl=float(os.environ.get('ENCODING_CACHE_TTL', '30'))
+) if ENCODING_CACHE_SIZE > 0 else None
+face_system = FaceRecognitionSystem(cache=encoding_cache)
+
+# Face detector backend per route: hog (default), cnn, haar, or cascade (Haar candidates confirmed by HOG)
+LOGIN_DETECTOR = os.environ.get('LOGIN_DETECTOR', 'hog')
+CAPTURE_DETECTOR = os.environ.get('CAPTURE_DETECTOR', 'hog')
+STREAM_DETECTOR = os.environ.get('STREAM_DETECTOR', LOGIN_DETECTOR)
+for detector_name in (LOGIN_DETECTOR, CAPTURE_DETECTOR, STREAM_DETECTOR):
+    get_detector(detector_name, face_system.detection_width)  # fail fast on unknown names
+
+# Set RECOGNITION_WORKERS to run detection/encoding in a pool of worker processes
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', '0'))
+recognition_executor = RecognitionExecutor(
+    workers=RECOGNITION_WORKERS,
+    queue_depth=int(os.environ.get('RECOGNITION_QUEUE_DEPTH', '8')),
+    task_timeout=float(os.environ.get('RECOGNITION_TIMEOUT', '5.0')),
+    detection_width=face_system.detection_width
+) if RECOGNITION_WORKERS > 0 else None
+
+# Streaming login detects on every Nth frame, tracks the face in between and stops
+# as soon as one encode is a confident match (or two agree on the same user)
+STREAM_DETECT_EVERY = int(os.environ.get('STREAM_DETECT_EVERY', '5'))
+STREAM_STABLE_FRAMES = int(os.environ.get('STREAM_STABLE_FRAMES', '2'))
+STREAM_MIN_SHARPNESS = float(os.environ.get('STREAM_MIN_SHARPNESS', '50'))
+STREAM_CONFIDENT_DISTANCE = float(os.environ.get('STREAM_CONFIDENT_DISTANCE', '0.45'))
+STREAM_MAX_ENCODES = int(os.environ.get('STREAM_MAX_ENCODES', '5'))
+
+# Registration captures are kept server-side; the session only holds their capture id
+enrollments = EnrollmentStore(ttl=float(os.environ.get('ENROLLMENT_TTL', '900')))
+
+# Registration completes once this many captures are folded into the enrollment
+REQUIRED_CAPTURES = 3
+
+# Streaming enrollment scores every frame of a burst but encodes only the best few
+STREAM_MAX_FRAMES = int(os.environ.get('STREAM_MAX_FRAMES', '30'))
+ENROLLMENT_BEST_FRAMES = int(os.environ.get('ENROLLMENT_BEST_FRAMES', '3'))
+
+# Browsers upload a face crop instead of the full frame once they know where the face is;
+# such crops are encoded from the box their geometry implies, skipping detection.
+# Trusting crops is off unless client cropping is enabled, and a crop upscaled more
+# than FACE_CROP_MAX_SCALE times is too small to hold a face and is detected instead
+CLIENT_FACE_CROP = os.environ.get('CLIENT_FACE_CROP', '0') == '1'
+TRUST_FACE_CROPS = os.environ.get('TRUST_FACE_CROPS', '1' if CLIENT_FACE_CROP else '0') == '1'
+FACE_CROP_MAX_SCALE = float(os.environ.get('FACE_CROP_MAX_SCALE', '4'))
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+REQUEST_SECONDS = metrics.histogram('http_request_duration_seconds', 'Request latency by endpoint', ('endpoint',))
+REQUESTS = metrics.counter('http_requests_total', 'Requests by endpoint and status', ('endpoint', 'status'))
+FACE_LOGIN_ATTEMPTS = metrics.counter('face_login_attempts_total', 'Face login attempts')
+FACE_LOGIN_MATCHES = metrics.counter('face_login_matches_total', 'Face logins that matched a user')
+metrics.callback('face_gallery_size', 'Encodings in the in-memory face gallery', lambda: len(db.gallery))
+if encoding_cache is not None:
+    metrics.callback('encoding_cache_lookups_total', 'Encoding cache lookups by result',
+                     lambda: {('hit',): encoding_cache.hits, ('miss',): encoding_cache.misses},
+                     ('result',), kind='counter')
+
+# Sampling profiler for selected requests; arm with PROFILE_EVERY / PROFILE_HEADER or /admin/profiler
+profiler = request_profiler.from_environment()
+PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN')
+
+# Models, DB connections and the gallery are warmed in the background at startup and /readyz
+# answers 503 until that finished; WARMUP=0 skips it and reports ready immediately
+warmup = Warmup(enabled=os.environ.get('WARMUP', '1') == '1')
+WARMUP_DB_CONNECTIONS = int(os.environ.get('WARMUP_DB_CONNECTIONS', '4'))
+WARMUP_WORKER_TIMEOUT = float(os.environ.get('WARMUP_WORKER_TIMEOUT', '60'))
+metrics.callback('app_ready', 'Whether startup warmup has finished (1) or not (0)', lambda: int(warmup.ready))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if profiler.armed and profiler.should_profile(request.endpoint, request.headers):
+        g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and status per endpoint (the route name, so paths with ids do not explode labels)"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish(profile, request.endpoint, request.method, response.status_code)
+    return response
+
+@app.teardown_request
+def discard_unfinished_profile(error=None):
+    """Stop sampling a request that ended without a response"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.cancel(profile)
+
+def decode_frame(image):
+    """Decode a base64 data URL or raw JPEG/PNG bytes; arrays pass straight through"""
+    if isinstance(image, str):
+        try:
+            return face_system.decode_base64_image(image), None
+        except Exception as e:
+            return None, f"Error processing base64 image: {str(e)}"
+    if isinstance(image, bytes):
+        try:
+            return face_system.decode_image_bytes(image), None
+        except Exception as e:
+            return None, f"Error processing image: {str(e)}"
+    return image, None
+
+def read_frame_bytes():
+    """Raw bytes of a frame posted as an image/* body or a multipart 'image' file"""
+    if request.mimetype.startswith('image/'):
+        image_bytes = request.get_data(cache=False)
+    elif 'image' in request.files:
+        image_bytes = request.files['image'].read()
+    else:
+        return None, 'No image provided'
+    
+    if not image_bytes:
+        return None, 'No image provided'
+    return image_bytes, None
+
+def read_face_crop(image_array):
+    """Known face box for a trusted client face crop sent with ?crop=x,y,w,h, else None"""
+    crop = request.values.get('crop')
+    if not crop or not TRUST_FACE_CROPS:
+        return None
+    try:
+        x, y, width, height = (float(value) for value in crop.split(','))
+    except ValueError:
+        return None
+    
+    # Only crops with the agreed geometry have a known face box: a square region of
+    # whole pixels inside the frame, resized to FACE_CROP_SIZE. Anything else is detected
+    if image_array.shape[:2] != (FACE_CROP_SIZE, FACE_CROP_SIZE):
+        return None
+    if width != height or min(x, y) < 0 or not all(value.is_integer() for value in (x, y, width)):
+        return None
+    if width * FACE_CROP_MAX_SCALE < FACE_CROP_SIZE:
+        return None
+    return [face_crop_box()]
+
+def extract_face(image, boxes=None, key=None, detector='hog'):
+    """Extract (encoding, error, face_box) from a frame, from the cache or the worker pool when enabled
+    
+    key identifies the uploaded bytes; it is derived from the image itself when not given.
+    """
+    if encoding_cache is None:
+        return analyze_frame(image, boxes, detector)
+    if key is None:
+        key = frame_key(image, boxes, detector)
+    return encoding_cache.get_or_compute(key, lambda: analyze_frame(image, boxes, detector))
+
+def analyze_frame(image, boxes=None, detector='hog'):
+    image_array, error = decode_frame(image)
+    if error:
+        return None, error, None
+    
+    if recognition_executor is None:
+        return face_system.extract_face(image_array, boxes, detector)
+    return recognition_executor.extract_face(image_array, boxes, detector)
+
+def identify_batch(frames):
+    """Match a batch of (image_array, boxes, key, result) login frames against the gallery together
+    
+    Frames whose result is None are encoded here, on the worker pool. Without workers
+    each request thread encodes its own frame in parallel and passes its
+    (encoding, error, face_box) result, so only the gallery match is batched.
+    """
+    results = [result for _, _, _, result in frames]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if pending:
+        extracted = recognition_executor.extract_many([frames[index][0] for index in pending],
+                                                      [frames[index][1] for index in pending], LOGIN_DETECTOR)
+        for index, result in zip(pending, extracted):
+            results[index] = result
+            key = frames[index][2]
+            if encoding_cache is not None and key is not None:
+                encoding_cache.put(key, result)
+    
+    valid = [index for index, (_, error, _) in enumerate(results) if not error]
+    matches = db.match_faces([results[index][0] for index in valid])
+    
+    outcomes = [(None, error, face_box) for _, error, face_box in results]
+    for index, match in zip(valid, matches):
+        outcomes[index] = (match[0] if match else None, None, results[index][2])
+    return outcomes
+
+# Set FACE_LOGIN_BATCH_WINDOW_MS to group concurrent face logins into one gallery match
+FACE_LOGIN_BATCH_WINDOW_MS = float(os.environ.get('FACE_LOGIN_BATCH_WINDOW_MS', '0'))
+face_login_batcher = MicroBatcher(
+    identify_batch,
+    window_ms=FACE_LOGIN_BATCH_WINDOW_MS,
+    max_batch=int(os.environ.get('FACE_LOGIN_MAX_BATCH', '16')),
+    timeout=float(os.environ.get('RECOGNITION_TIMEOUT', '5.0')) + 5.0
+) if FACE_LOGIN_BATCH_WINDOW_MS > 0 else None
+
+def identify_face(image, boxes=None, key=None):
+    """Find the user matching a frame; returns (user, error, face_box)"""
+    if face_login_batcher is None:
+        encoding, error, face_box = extract_face(image, boxes, key, LOGIN_DETECTOR)
+        if error:
+            return None, error, face_box
+        return db.get_user_by_face(encoding), None, face_box
+    
+    # A frame seen recently skips the batch: only its gallery match is left to do
+    if encoding_cache is not None:
+        if key is None:
+            key = frame_key(image, boxes, LOGIN_DETECTOR)
+        cached = encoding_cache.get(key)
+        if cached is not None:
+            encoding, error, face_box = cached
+            if error:
+                return None, error, face_box
+            return db.get_user_by_face(encoding), None, face_box
+    
+    if recognition_executor is None:
+        # Encode here so concurrent logins still run detection in parallel; only the match is batched
+        encoding, error, face_box = extract_face(image, boxes, key, LOGIN_DETECTOR)
+        if error:
+            return None, error, face_box
+        frame = (None, boxes, key, (encoding, None, face_box))
+    else:
+        image_array, error = decode_frame(image)
+        if error:
+            return None, error, None
+        frame = (image_array, boxes, key, None)
+    
+    try:
+        user_id, error, face_box = face_login_batcher.submit(frame)
+    except FutureTimeoutError:
+        return None, TIMEOUT_MESSAGE, None
+    if error:
+        return None, error, face_box
+    return (db.get_user_by_id(user_id) if user_id is not None else None), None, face_box
+
 @app.route('/')
 def index():
     """Main login page"""
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('index.html')
+    return render_template('index.html', client_face_crop=CLIENT_FACE_CROP,
+                           face_crop_size=FACE_CROP_SIZE, face_crop_margin=FACE_CROP_MARGIN)
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -60,24 +316,116 @@ def login():
 @app.route('/face-login', methods=['POST'])
 def face_login():
     """Handle face recognition login"""
+    data = request.get_json(silent=True) or {}
+    image_data = data.get('image')
+    
+    if not image_data:
+        return jsonify({'success': False, 'message': 'No image provided'})
+    
+    return face_login_with(image_data)
+
+@app.route('/face-login/frame', methods=['POST'])
+def face_login_frame():
+    """Handle face recognition login from a binary JPEG/PNG upload"""
+    image_bytes, error = read_frame_bytes()
+    if not error:
+        image_array, error = decode_frame(image_bytes)
+    if error:
+        return jsonify({'success': False, 'message': error})
+    
+    boxes = read_face_crop(image_array)
+    return face_login_with(image_array, boxes, frame_key(image_bytes, boxes, LOGIN_DETECTOR))
+
+def face_response(face_box, **fields):
+    """JSON response, with the detected face box so the browser can crop its next upload"""
+    if face_box is not None:
+        fields['face_box'] = [int(value) for value in face_box]
+    return jsonify(fields)
+
+def face_login_with(image, boxes=None, key=None):
+    """Log in the user matching a base64 frame or decoded image array"""
+    try:
+        # Extract the face encoding and find the matching user
+        FACE_LOGIN_ATTEMPTS.inc()
+        user, error, face_box = identify_face(image, boxes, key)
+        return face_login_result(user, error, face_box)
+    
+    except Exception as e:
+        print(f"Face login error: {e}")
+        return jsonify({'success': False, 'message': 'Face recognition system error'})
+
+@app.route('/face-login/stream', methods=['POST'])
+def face_login_stream():
+    """Log in from a continuous length-prefixed frame stream, answering as soon as the match is confident"""
+    started = time.perf_counter()
+    tracker = FaceTracker(STREAM_DETECT_EVERY, face_system.detection_width, detector=STREAM_DETECTOR)
+    encoded = 0
+    votes = {}
+    best = None  # (distance, user_id)
+    decided = None
+    early_exit = False
+    error = None
+    
+    try:
+        FACE_LOGIN_ATTEMPTS.inc()
+        for image_bytes in iter_frames(request.stream, STREAM_MAX_FRAMES):
+            image_array, frame_error = decode_frame(image_bytes)
+            if frame_error:
+                continue
+            
+            # Only a steady, sharp face is worth an encode
+            box = tracker.update(image_array)
+            if box is None or tracker.stable_frames < STREAM_STABLE_FRAMES:
+                continue
+            analysis = face_system.analyze(image_array, [box])
+            if analysis.sharpness < STREAM_MIN_SHARPNESS:
+                continue
+            
+            if recognition_executor is None:
+                encoding, error = analysis.encoding
+            else:
+                encoding, error = recognition_executor.extract_face_encoding(image_array, [box])
+            encoded += 1
+            if not error:
+                match = db.match_faces([encoding])[0]
+                if match is not None:
+                    user_id, distance = match
+                    votes[user_id] = votes.get(user_id, 0) + 1
+                    if best is None or distance < best[0]:
+                        best = (distance, user_id)
+                    if distance <= STREAM_CONFIDENT_DISTANCE or votes[user_id] >= 2:
+                        decided, early_exit = user_id, True
+                        break
+            if encoded >= STREAM_MAX_ENCODES:
+                break
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid frame stream: {str(e)}'})
+    except Exception as e:
+        print(f"Face login error: {e}")
+        return jsonify({'success': False, 'message': 'Face recognition system error'})
+    
+    # Stream ended without a confident match: fall back to the closest match within tolerance
+    if decided is None and best is not None:
+        decided = best[1]
+    if decided is None and not error and not encoded:
+        error = 'No steady face found in the video. Please look at the camera and try again.'
+    user = db.get_user_by_id(decided) if decided is not None else None
+    
+    stats = tracker.stats()
+    return face_login_result(user, None if user else error, None,
+                             frames_received=stats['frames'], frames_detected=stats['detections'],
+                             frames_encoded=encoded, early_exit=early_exit,
+                             decision_ms=round(1000 * (time.perf_counter() - started), 1))
+
+def face_login_result(user, error, face_box, **fields):
+    """Log the attempt and answer a face login; fields are added to the JSON response"""
     try:
-        data = request.get_json()
-        image_data = data.get('image')
-        
-        if not image_data:
-            return jsonify({'success': False, 'message': 'No image provided'})
-        
-        # Extract face encoding from the captured image
-        encoding, error = face_system.extract_face_encoding_from_base64(image_data)
-        
         if error:
             db.log_login_attempt('unknown', 'face', False, request.remote_addr)
-            return jsonify({'success': False, 'message': error})
-        
-        # Find user by face encoding
-        user = db.get_user_by_face(encoding)
+            return face_response(face_box, success=False, message=error, **fields)
         
         if user:
+            FACE_LOGIN_MATCHES.inc()
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['first_name'] = user['first_name']
@@ -87,10 +435,12 @@ def face_login():
             db.update_last_login(user['username'])
             db.log_login_attempt(user['username'], 'face', True, request.remote_addr)
             
-            return jsonify({'success': True, 'message': 'Face recognition login successful'})
+            return jsonify(dict(fields, success=True, message='Face recognition login successful'))
         else:
             db.log_login_attempt('unknown', 'face', False, request.remote_addr)
-            return jsonify({'success': False, 'message': 'Face not recognized. Please register first or use username/password login.'})
+            return face_response(face_box, success=False,
+                                 message='Face not recognized. Please register first or use username/password login.',
+                                 **fields)
     
     except Exception as e:
         print(f"Face login error: {e}")
@@ -108,50 +458,125 @@ def face_capture():
     """Face capture page for registration"""
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('face_capture.html')
+    return render_template('face_capture.html', client_face_crop=CLIENT_FACE_CROP,
+                           face_crop_size=FACE_CROP_SIZE, face_crop_margin=FACE_CROP_MARGIN)
 
 @app.route('/capture-face', methods=['POST'])
 def capture_face():
     """Handle face capture during registration"""
+    data = request.get_json(silent=True) or {}
+    image_data = data.get('image')
+    capture_count = data.get('capture_count', 1)
+    
+    if not image_data:
+        return jsonify({'success': False, 'message': 'No image provided'})
+    
+    return capture_face_with(image_data, capture_count)
+
+@app.route('/capture-face/frame', methods=['POST'])
+def capture_face_frame():
+    """Handle face capture from a binary upload; capture_count comes as a query or form field"""
+    image_bytes, error = read_frame_bytes()
+    if not error:
+        image_array, error = decode_frame(image_bytes)
+    if error:
+        return jsonify({'success': False, 'message': error})
+    
+    boxes = read_face_crop(image_array)
+    return capture_face_with(image_array, request.values.get('capture_count', 1, type=int),
+                             boxes, frame_key(image_bytes, boxes, CAPTURE_DETECTOR))
+
+@app.route('/capture-face/stream', methods=['POST'])
+def capture_face_stream():
+    """Enroll from a burst of length-prefixed frames, encoding only the best-scoring ones"""
+    best = BestFrames(ENROLLMENT_BEST_FRAMES)
+    received = 0
+    try:
+        for image_bytes in iter_frames(request.stream, STREAM_MAX_FRAMES):
+            received += 1
+            image_array, error = decode_frame(image_bytes)
+            if error:
+                continue
+            try:
+                analysis = face_system.analyze(image_array, detector=CAPTURE_DETECTOR)
+                score = analysis.frame_score
+            except Exception as e:
+                print(f"Frame scoring error: {e}")
+                continue
+            if score > 0:
+                best.add(score, analysis)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid frame stream: {str(e)}'})
+    
+    if not len(best):
+        return jsonify({'success': False, 'frames_received': received,
+                        'message': 'No clear single face found. Please face the camera and try again.'})
+    
+    # Full encodes for the winners only, reusing the face boxes found while scoring
+    selected = best.best()
+    analyses = [analysis for _, analysis in selected]
+    if recognition_executor is None:
+        results = [analysis.encoding for analysis in analyses]
+    else:
+        results = [(encoding, error) for encoding, error, _ in
+                   recognition_executor.extract_many([analysis.image for analysis in analyses],
+                                                     [analysis.boxes for analysis in analyses])]
+    encodings = [encoding for encoding, error in results if not error]
+    if not encodings:
+        return jsonify({'success': False, 'message': results[0][1]})
+    
+    capture_id = enrollments.create()
+    for encoding in encodings:
+        enrollments.add(capture_id, encoding)
+    enrollments.complete(capture_id)
+    session['capture_id'] = capture_id
+    
+    return jsonify({
+        'success': True,
+        'completed': True,
+        'message': 'Face capture completed successfully!',
+        'frames_received': received,
+        'frames_usable': best.offered,
+        'frames_encoded': len(encodings),
+        'scores': [round(score, 3) for score, _ in selected]
+    })
+
+def capture_face_with(image, capture_count, boxes=None, key=None):
+    """Store the encoding of one registration capture in the session"""
     try:
-        data = request.get_json()
-        image_data = data.get('image')
-        capture_count = data.get('capture_count', 1)
-        
-        if not image_data:
-            return jsonify({'success': False, 'message': 'No image provided'})
-        
         # Extract face encoding
-        encoding, error = face_system.extract_face_encoding_from_base64(image_data)
+        encoding, error, face_box = extract_face(image, boxes, key, CAPTURE_DETECTOR)
         
         if error:
-            return jsonify({'success': False, 'message': error})
-        
-        # Store encoding in session temporarily
-        if 'face_encodings' not in session:
-            session['face_encodings'] = []
+            return face_response(face_box, success=False, message=error)
         
-        session['face_encodings'].append(encoding.tolist())  # Convert numpy array to list for JSON serialization
-        session.modified = True
+        # Fold the capture into this registration's running mean; the first capture starts afresh
+        capture_id = session.get('capture_id')
+        enrollment = enrollments.add(capture_id, encoding) if capture_count > 1 else None
+        restarted = enrollment is None and capture_count > 1
+        if enrollment is None:
+            capture_id = enrollments.create()
+            session['capture_id'] = capture_id
+            enrollment = enrollments.add(capture_id, encoding)
         
-        if capture_count >= 3:
-            # Average the encodings
-            encodings_array = np.array(session['face_encodings'])
-            average_encoding = np.mean(encodings_array, axis=0)
-            session['final_face_encoding'] = average_encoding.tolist()
-            session.modified = True
+        # Completion counts the captures the server holds, not the client's capture_count
+        if enrollment.count >= REQUIRED_CAPTURES:
+            enrollments.complete(capture_id)
             
             return jsonify({
                 'success': True, 
                 'message': 'Face capture completed successfully!',
-                'completed': True
+                'completed': True,
+                'captured': enrollment.count
             })
+        
+        remaining = REQUIRED_CAPTURES - enrollment.count
+        if restarted:
+            message = f'Earlier captures expired, so capture has started again. Please capture {remaining} more.'
         else:
-            return jsonify({
-                'success': True, 
-                'message': f'Face {capture_count} captured. Please capture {3 - capture_count} more.',
-                'completed': False
-            })
+            message = f'Face {enrollment.count} captured. Please capture {remaining} more.'
+        return face_response(face_box, success=True, message=message, completed=False,
+                             captured=enrollment.count, restarted=restarted)
     
     except Exception as e:
         print(f"Face capture error: {e}")
@@ -184,21 +609,17 @@ def complete_registration():
         if db.username_exists(username):
             return jsonify({'success': False, 'message': 'Username already exists'})
         
-        # Get face encoding from session
-        face_encoding = session.get('final_face_encoding')
-        if not face_encoding:
+        # Get the averaged face encoding of the completed capture
+        enrollment = enrollments.get(session.get('capture_id'))
+        if enrollment is None or not enrollment.completed:
             return jsonify({'success': False, 'message': 'Face capture not completed. Please capture your face first.'})
         
-        # Convert back to numpy array
-        face_encoding = np.array(face_encoding)
-        
         # Create user
-        user_id = db.create_user(username, password, first_name, last_name, gender, face_encoding)
+        user_id = db.create_user(username, password, first_name, last_name, gender, enrollment.mean)
         
         if user_id:
-            # Clear face data from session
-            session.pop('face_encodings', None)
-            session.pop('final_face_encoding', None)
+            # Clear face data
+            enrollments.discard(session.pop('capture_id'))
             
             # Log the user in automatically
             session['user_id'] = user_id
@@ -249,6 +670,91 @@ def user_stats():
     
     return jsonify({'error': 'User not found'}), 404
 
+@app.route('/api/recognition-stats')
+def recognition_stats():
+    """Recognition worker pool, face-login batching, encoding cache and enrollment statistics"""
+    if recognition_executor is None:
+        stats = {'enabled': False}
+    else:
+        stats = dict(recognition_executor.stats(), enabled=True)
+    stats['micro_batching'] = face_login_batcher.stats() if face_login_batcher is not None else {'enabled': False}
+    stats['encoding_cache'] = encoding_cache.stats() if encoding_cache is not None else {'enabled': False}
+    stats['enrollments'] = enrollments.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage latencies, request counters, pool and gallery gauges"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@warmup.step('vision_stack')
+def warm_vision_stack():
+    """Import cv2, face_recognition (dlib) and PIL now rather than on the first face request"""
+    preload()
+
+@warmup.step('database')
+def warm_database():
+    """Open pooled connections and pull the users table into the page cache"""
+    db.prime(WARMUP_DB_CONNECTIONS)
+
+@warmup.step('gallery')
+def warm_gallery():
+    """Catch the gallery up with SQLite and run one match so the matcher's first call is paid here"""
+    db.match_faces([np.zeros(ENCODING_SIZE, dtype=np.float32)])
+
+@warmup.step('face_pipeline')
+def warm_face_pipeline():
+    """Decode, detect and encode a synthetic frame on every configured detector backend"""
+    image, box = synthetic_frame()
+    frame_bytes = jpeg_bytes(image)
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(frame_bytes).decode()
+    for image_data in (frame_bytes, data_url):
+        image_array, error = decode_frame(image_data)
+        if error:
+            raise RuntimeError(error)
+    for detector in dict.fromkeys((LOGIN_DETECTOR, CAPTURE_DETECTOR, STREAM_DETECTOR)):
+        face_system.extract_face(image_array, None, detector)
+    # The drawn face may not be detected; a known box runs the landmark and encoder models anyway
+    _, error, _ = face_system.extract_face(image_array, [box], LOGIN_DETECTOR)
+    if error:
+        raise RuntimeError(error)
+
+@warmup.step('recognition_workers')
+def warm_recognition_workers():
+    if recognition_executor is not None:
+        recognition_executor.warm_up(WARMUP_WORKER_TIMEOUT, LOGIN_DETECTOR)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 only once warmup finished, so load balancers skip cold workers"""
+    return jsonify(warmup.status()), (200 if warmup.ready else 503)
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def profiler_admin():
+    """Show, arm or disarm the request profiler (token-protected, or localhost only without PROFILER_TOKEN)"""
+    if PROFILER_TOKEN:
+        allowed = secrets.compare_digest(request.headers.get('X-Profiler-Token', ''), PROFILER_TOKEN)
+    else:
+        allowed = request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if data.get('armed') is False:
+            profiler.disarm()
+        else:
+            try:
+                profiler.arm(every=data.get('every', 0), header=data.get('header'), endpoints=data.get('endpoints'))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'every must be an integer'}), 400
+    return jsonify(profiler.status())
+
 @app.route('/test-camera')
 def test_camera():
     """Test camera functionality"""
@@ -264,6 +770,15 @@ def internal_error(error):
     """Handle 500 errors"""
     return render_template('500.html'), 500
 
+def start_warmup():
+    """Warm up in the background
+    
+    Importing this module starts nothing: call this once in the process that
+    serves requests, as the __main__ block below does (a WSGI server would call
+    it from its worker start hook, e.g. gunicorn's post_worker_init).
+    """
+    warmup.start()
+
 if __name__ == '__main__':
     print("="*50)
     print("FACE RECOGNITION LOGIN SYSTEM")
@@ -280,5 +795,9 @@ if __name__ == '__main__':
     # Create database tables if they don't exist
     db.init_database()
     
+    # Under the debug reloader this block also runs in the file-watching parent; only the serving child warms up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
+    
     # Run the application
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,26 +1,92 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import os
 import base64
 import hashlib
 import json
-import pickle
 from datetime import datetime
-import face_recognition
 import numpy as np
-from PIL import Image
 import io
+import threading
+from models.ann_index import create_gallery_from_env
+from models.face_gallery import ENCODING_SIZE
+from models import gallery_snapshot
+from models.encoding_codec import encode_encoding, decode_valid
+from models import connection_pool
+from models.face_recognition import locate_faces, get_detector, analysis_outcome, NO_FACE_MESSAGE, MULTIPLE_FACES_MESSAGE
+from models.recognition_executor import RecognitionExecutor
+from models.audit_log import AuditLogWriter, utc_timestamp
+from models import metrics
+from models.encoding_cache import EncodingCache, frame_key
+from models.lazy_import import lazy_import, preload
+from models.warmup import Warmup, synthetic_frame, jpeg_bytes
+
+# dlib and PIL load with the first face request, so page views start fast
+face_recognition = lazy_import('face_recognition')
+Image = lazy_import('PIL.Image')
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this to a random secret key
 
+# Database file; connections come from a shared, tuned pool
+DATABASE = 'face_login_advanced.db'
+
+def get_db_connection():
+    """Get a pooled connection to the app database"""
+    return connection_pool.connect(DATABASE)
+
+# Login attempts are written in batches off the request thread
+audit_log = AuditLogWriter(connection_pool.get_pool(DATABASE), '''
+    INSERT INTO login_attempts (username, user_id, attempt_type, success, confidence, ip_address, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+''')
+
 # Face encodings database
-FACE_ENCODINGS_FILE = 'face_encodings.pkl'
+FACE_ENCODINGS_FILE = 'face_gallery_advanced'  # Memory-mapped gallery snapshot directory
+SNAPSHOT_REFRESH_ROWS = 1000  # Rewrite the snapshot once this many rows had to be caught up
+
+# Enrolled encodings; the high-water mark is the last face_enrollments.seq seen
+# Set FACE_MATCHER=ivf to use the approximate index for very large galleries; tune its
+# recall/latency trade-off with FACE_MATCHER_NPROBE (cells scanned per query, default 8),
+# FACE_MATCHER_NLIST (cells, default ~sqrt(N)), FACE_MATCHER_PQ_M (PQ sub-spaces, default off),
+# FACE_MATCHER_RERANK (PQ shortlist, default 64) and FACE_MATCHER_MIN_TRAIN_SIZE (default 10000)
+face_gallery = create_gallery_from_env()
+face_gallery_loaded = False
+face_gallery_lock = threading.Lock()  # Held while loading, so concurrent first requests load once
+
+# Set RECOGNITION_WORKERS to run detection/encoding in a pool of worker processes
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', '0'))
+recognition_executor = RecognitionExecutor(
+    workers=RECOGNITION_WORKERS,
+    queue_depth=int(os.environ.get('RECOGNITION_QUEUE_DEPTH', '8')),
+    task_timeout=float(os.environ.get('RECOGNITION_TIMEOUT', '5.0'))
+) if RECOGNITION_WORKERS > 0 else None
+
+# Detector backend for login and registration frames: hog, cnn, haar or cascade
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'hog')
+get_detector(FACE_DETECTOR)  # fail fast on unknown names
+
+# Repeated uploads of the same frame reuse its analysis; ENCODING_CACHE_SIZE=0 disables the cache
+ENCODING_CACHE_SIZE = int(os.environ.get('ENCODING_CACHE_SIZE', '1024'))
+encoding_cache = EncodingCache(
+    max_entries=ENCODING_CACHE_SIZE,
+    max_bytes=int(float(os.environ.get('ENCODING_CACHE_MB', '16')) * 1024 * 1024),
+    ttl=float(os.environ.get('ENCODING_CACHE_TTL', '30'))
+) if ENCODING_CACHE_SIZE > 0 else None
+
+FACE_LOGIN_ATTEMPTS = metrics.counter('face_login_attempts_total', 'Face login attempts')
+FACE_LOGIN_MATCHES = metrics.counter('face_login_matches_total', 'Face logins that matched a user')
+metrics.callback('face_gallery_size', 'Encodings in the in-memory face gallery', lambda: len(face_gallery))
+
+# /readyz answers 503 until models, DB connections and the gallery are warm; WARMUP=0 skips it
+warmup = Warmup(enabled=os.environ.get('WARMUP', '1') == '1')
+WARMUP_DB_CONNECTIONS = int(os.environ.get('WARMUP_DB_CONNECTIONS', '4'))
+WARMUP_WORKER_TIMEOUT = float(os.environ.get('WARMUP_WORKER_TIMEOUT', '60'))
+metrics.callback('app_ready', 'Whether startup warmup has finished (1) or not (0)', lambda: int(warmup.ready))
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('face_login_advanced.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -49,105 +115,170 @@ def init_db():
         )
     ''')
     
+    # Append-only log of face registrations, so workers can catch up by sequence number
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS face_enrollments (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
 def load_face_encodings():
-    """Load all face encodings from file"""
-    if os.path.exists(FACE_ENCODINGS_FILE):
-        with open(FACE_ENCODINGS_FILE, 'rb') as f:
-            return pickle.load(f)
-    return {}
+    """Map the gallery snapshot and catch up on faces registered since it was written"""
+    global face_gallery_loaded
+    with face_gallery_lock:
+        # Another request or the warmup may have loaded it while this one waited
+        if face_gallery_loaded:
+            return face_gallery
+        
+        if not gallery_snapshot.load_into_gallery(face_gallery, FACE_ENCODINGS_FILE):
+            # No usable snapshot: build one from every stored encoding
+            save_face_encodings()
+            gallery_snapshot.load_into_gallery(face_gallery, FACE_ENCODINGS_FILE)
+        
+        # Snapshot again after a long catch-up, or when loading had to train an index the snapshot lacks
+        header = gallery_snapshot.read_header(FACE_ENCODINGS_FILE) or {}
+        retrained = getattr(face_gallery, 'is_trained', False) and 'index' not in header
+        if sync_face_encodings() >= SNAPSHOT_REFRESH_ROWS or retrained:
+            snapshot_face_gallery()
+        face_gallery_loaded = True
+        return face_gallery
 
-def save_face_encodings(encodings_dict):
-    """Save face encodings to file"""
-    with open(FACE_ENCODINGS_FILE, 'wb') as f:
-        pickle.dump(encodings_dict, f)
+def save_face_encodings():
+    """Write a fresh gallery snapshot from the database, with the matcher's trained index"""
+    return gallery_snapshot.build_from_database(
+        DATABASE, FACE_ENCODINGS_FILE,
+        high_water_query='SELECT COALESCE(MAX(seq), 0) FROM face_enrollments',
+        gallery=create_gallery_from_env())
+
+def snapshot_face_gallery():
+    """Write the in-memory gallery, including any trained index, as the new snapshot"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, username FROM users WHERE face_encoding IS NOT NULL')
+    usernames = dict(cursor.fetchall())
+    conn.close()
+    return gallery_snapshot.save_gallery(face_gallery, FACE_ENCODINGS_FILE, usernames)
+
+def sync_face_encodings():
+    """Add faces registered after the gallery's high-water mark; returns the row count"""
+    return face_gallery.catch_up(fetch_enrolled_encodings)
+
+def fetch_enrolled_encodings(high_water):
+    """(marks, user_ids, encodings, high_water, row_count) of faces registered after high_water"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT e.seq, u.id, u.face_encoding
+        FROM face_enrollments e JOIN users u ON u.id = e.user_id
+        WHERE e.seq > ? AND u.face_encoding IS NOT NULL
+        ORDER BY e.seq
+    ''', (high_water,))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    if not rows:
+        return [], [], [], high_water, 0
+    positions, encodings = decode_valid([row[2] for row in rows])
+    return ([rows[position][0] for position in positions], [rows[position][1] for position in positions],
+            encodings, rows[-1][0], len(rows))
+
+def decode_face_image(image_data):
+    """Decode a base64 image into an RGB numpy array"""
+    # Remove data URL prefix if present
+    if 'data:image' in image_data:
+        image_data = image_data.split(',')[1]
+    
+    # Decode base64 image
+    image_bytes = base64.b64decode(image_data)
+    image = Image.open(io.BytesIO(image_bytes))
+    
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Convert PIL image to numpy array
+    return np.array(image)
 
 def process_face_image(image_data):
-    """Process base64 image and extract face encoding"""
+    """Process base64 image and extract face encoding (memoized by image content)"""
+    if encoding_cache is None:
+        return analyze_face_image(image_data)
+    
+    encoding, error, _ = encoding_cache.get_or_compute(
+        frame_key(image_data, detector=FACE_DETECTOR), lambda: analyze_face_image(image_data) + (None,))
+    return encoding, error
+
+def analyze_face_image(image_data):
     try:
-        # Remove data URL prefix if present
-        if 'data:image' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert PIL image to numpy array
-        image_array = np.array(image)
-        
-        # Find face locations and encodings
-        face_locations = face_recognition.face_locations(image_array, model="hog")
+        image_array = decode_face_image(image_data)
         
-        if len(face_locations) == 0:
-            return None, "No face detected in the image"
-        
-        if len(face_locations) > 1:
-            return None, "Multiple faces detected. Please ensure only one face is visible"
-        
-        # Get face encoding
-        face_encodings = face_recognition.face_encodings(image_array, face_locations)
-        
-        if len(face_encodings) == 0:
-            return None, "Could not encode the face"
-        
-        return face_encodings[0], None
+        # Hand detection and encoding to the worker pool when it is enabled
+        if recognition_executor is not None:
+            return recognition_executor.extract_face_encoding(image_array, detector=FACE_DETECTOR)
         
+        encoding, error = encode_single_face(image_array)
     except Exception as e:
-        return None, f"Error processing image: {str(e)}"
+        encoding, error = None, f"Error processing image: {str(e)}"
+    metrics.FACE_ANALYSES.inc(outcome=analysis_outcome(error))
+    return encoding, error
+
+def encode_single_face(image_array):
+    """Encode the only face in a frame; returns (encoding, error)"""
+    # Find face locations on a downscaled copy, encode at full resolution
+    face_locations = locate_faces(image_array, model=FACE_DETECTOR)
+    
+    if len(face_locations) == 0:
+        return None, NO_FACE_MESSAGE
+    
+    if len(face_locations) > 1:
+        return None, MULTIPLE_FACES_MESSAGE
+    
+    # Get face encoding
+    with metrics.span('encode'):
+        face_encodings = face_recognition.face_encodings(image_array, face_locations)
+    
+    if len(face_encodings) == 0:
+        return None, "Could not encode the face"
+    
+    return face_encodings[0], None
 
 def find_matching_user(face_encoding, tolerance=0.6):
     """Find matching user based on face encoding"""
-    conn = sqlite3.connect('face_login_advanced.db')
-    cursor = conn.cursor()
+    if not face_gallery_loaded:
+        init_db()
+        load_face_encodings()
+    else:
+        sync_face_encodings()
     
-    cursor.execute('SELECT id, username, face_encoding FROM users WHERE face_encoding IS NOT NULL')
-    users = cursor.fetchall()
-    conn.close()
+    with metrics.span('match'):
+        match = face_gallery.match(face_encoding, tolerance=tolerance)
+    if match is None:
+        return None
     
-    best_match = None
-    best_distance = float('inf')
+    user_id, face_distance = match
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+    conn.close()
     
-    for user_id, username, stored_encoding_blob in users:
-        if stored_encoding_blob:
-            try:
-                # Deserialize the stored encoding
-                stored_encoding = pickle.loads(stored_encoding_blob)
-                
-                # Calculate face distance
-                face_distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-                
-                # Check if this is the best match so far
-                if face_distance < tolerance and face_distance < best_distance:
-                    best_distance = face_distance
-                    best_match = {
-                        'user_id': user_id,
-                        'username': username,
-                        'distance': face_distance,
-                        'confidence': 1 - face_distance
-                    }
-                    
-            except Exception as e:
-                print(f"Error processing stored encoding for user {username}: {e}")
-                continue
+    if not user:
+        return None
     
-    return best_match
+    return {
+        'user_id': user_id,
+        'username': user[0],
+        'distance': face_distance,
+        'confidence': 1 - face_distance
+    }
 
 def log_login_attempt(username, user_id, attempt_type, success, confidence, ip_address):
-    conn = sqlite3.connect('face_login_advanced.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO login_attempts (username, user_id, attempt_type, success, confidence, ip_address)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (username, user_id, attempt_type, success, confidence, ip_address))
-    conn.commit()
-    conn.close()
+    """Queue a login attempt for the background audit log writer"""
+    audit_log.submit((username, user_id, attempt_type, success, confidence, ip_address, utc_timestamp()))
 
 @app.route('/')
 def index():
@@ -166,7 +297,7 @@ def register():
             return render_template('register_advanced.html')
         
         # Check if user already exists
-        conn = sqlite3.connect('face_login_advanced.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
         if cursor.fetchone():
@@ -207,16 +338,17 @@ def register_face():
             return jsonify({'success': False, 'message': error})
         
         # Store face encoding in database
-        conn = sqlite3.connect('face_login_advanced.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Serialize the face encoding
-        encoding_blob = pickle.dumps(face_encoding)
+        encoding_blob = encode_encoding(face_encoding)
         
         cursor.execute('''
             UPDATE users SET face_encoding = ?, face_images = ? 
             WHERE id = ?
         ''', (encoding_blob, face_data, session['user_id']))
+        cursor.execute('INSERT INTO face_enrollments (user_id) VALUES (?)', (session['user_id'],))
         conn.commit()
         conn.close()
         
@@ -238,7 +370,7 @@ def login():
             return jsonify({'success': False, 'message': 'Username and password are required'})
         
         # Get user from database
-        conn = sqlite3.connect('face_login_advanced.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,))
         user = cursor.fetchone()
@@ -264,6 +396,7 @@ def login():
             return jsonify({'success': False, 'message': 'No face data provided'})
         
         # Process the face image and get encoding
+        FACE_LOGIN_ATTEMPTS.inc()
         face_encoding, error = process_face_image(face_data)
         
         if error:
@@ -274,6 +407,7 @@ def login():
         match = find_matching_user(face_encoding)
         
         if match:
+            FACE_LOGIN_MATCHES.inc()
             session['user_id'] = match['user_id']
             session['username'] = match['username']
             log_login_attempt(match['username'], match['user_id'], 'face', True, match['confidence'], request.remote_addr)
@@ -292,8 +426,9 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('index'))
     
-    # Get user's login history
-    conn = sqlite3.connect('face_login_advanced.db')
+    # Get user's login history, including the attempt that just logged them in
+    audit_log.flush()
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT attempt_type, success, confidence, timestamp
@@ -309,11 +444,84 @@ def dashboard():
                          username=session['username'],
                          login_history=login_history)
 
+@app.route('/api/recognition-stats')
+def recognition_stats():
+    """Recognition worker pool and encoding cache statistics"""
+    if recognition_executor is None:
+        stats = {'enabled': False}
+    else:
+        stats = dict(recognition_executor.stats(), enabled=True)
+    stats['encoding_cache'] = encoding_cache.stats() if encoding_cache is not None else {'enabled': False}
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/logout')
 def logout():
     session.clear()
     return redirect(url_for('index'))
 
+@warmup.step('vision_stack')
+def warm_vision_stack():
+    """Import cv2, face_recognition (dlib) and PIL now rather than on the first face request"""
+    preload()
+
+@warmup.step('database')
+def warm_database():
+    """Create the tables, open pooled connections and pull the users table into the page cache"""
+    init_db()
+    connection_pool.get_pool(DATABASE).prime(WARMUP_DB_CONNECTIONS)
+    conn = get_db_connection()
+    conn.execute('SELECT COUNT(*), SUM(LENGTH(face_encoding)) FROM users').fetchone()
+    conn.close()
+
+@warmup.step('gallery')
+def warm_gallery():
+    """Load the gallery before the first face login instead of during it"""
+    if not face_gallery_loaded:
+        load_face_encodings()
+    face_gallery.match(np.zeros(ENCODING_SIZE, dtype=np.float32))
+
+@warmup.step('face_pipeline')
+def warm_face_pipeline():
+    """Decode, detect and encode a synthetic frame in this process"""
+    image, box = synthetic_frame()
+    image_array = decode_face_image('data:image/jpeg;base64,' + base64.b64encode(jpeg_bytes(image)).decode())
+    encode_single_face(image_array)
+    # The drawn face may not be detected; a known box runs the landmark and encoder models anyway
+    face_recognition.face_encodings(image_array, [box])
+
+@warmup.step('recognition_workers')
+def warm_recognition_workers():
+    if recognition_executor is not None:
+        recognition_executor.warm_up(WARMUP_WORKER_TIMEOUT, FACE_DETECTOR)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 only once warmup finished, so load balancers skip cold workers"""
+    return jsonify(warmup.status()), (200 if warmup.ready else 503)
+
+def start_warmup():
+    """Create the tables, then warm up in the background
+    
+    Importing this module starts nothing: call this once in the process that
+    serves requests, as the __main__ block below does (a WSGI server would call
+    it from its worker start hook, e.g. gunicorn's post_worker_init).
+    """
+    init_db()
+    warmup.start()
+
 if __name__ == '__main__':
     init_db()
+    # Under the debug reloader this block also runs in the file-watching parent; only the serving child warms up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5001)
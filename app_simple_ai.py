@@ -1,23 +1,46 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import os
 import base64
 import hashlib
-import json
 import pickle
+import threading
 from datetime import datetime
-import numpy as np
-from PIL import Image, ImageStat
 import io
 # import cv2  # Not needed for this simple version
 
+from models import connection_pool
+from models.audit_log import AuditLogWriter, utc_timestamp
+from models.lazy_import import lazy_import
+
+# numpy and PIL are only needed for face features; password traffic never loads them
+Image = lazy_import('PIL.Image')
+features = lazy_import('models.feature_gallery')
+
+# Enrolled feature vectors, loaded on the first face login; the high-water mark is
+# the last face_enrollments.seq seen, so other workers' registrations are caught up
+face_gallery = None
+face_gallery_lock = threading.Lock()  # Held while loading or syncing, so rows are read and added once
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this to a random secret key
 
+# Database file; connections come from a shared, tuned pool
+DATABASE = 'face_login_simple_ai.db'
+
+def get_db_connection():
+    """Get a pooled connection to the app database"""
+    return connection_pool.connect(DATABASE)
+
+# Login attempts are written in batches off the request thread
+audit_log = AuditLogWriter(connection_pool.get_pool(DATABASE), '''
+    INSERT INTO login_attempts (username, user_id, attempt_type, success, confidence, ip_address, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+''')
+
 # Simple face recognition using image features
 def extract_simple_features(image_data):
-    """Extract simple features from face image for comparison"""
+    """Extract the feature vector of a face image for comparison"""
     try:
         # Remove data URL prefix if present
         if 'data:image' in image_data:
@@ -32,102 +55,16 @@ def extract_simple_features(image_data):
             image = image.convert('RGB')
         
         # Resize to standard size for comparison
-        image = image.resize((128, 128))
-        
-        # Convert to numpy array
-        img_array = np.array(image)
-        
-        # Extract various features
-        features = {}
-        
-        # Average color values
-        features['avg_r'] = np.mean(img_array[:, :, 0])
-        features['avg_g'] = np.mean(img_array[:, :, 1])
-        features['avg_b'] = np.mean(img_array[:, :, 2])
-        
-        # Standard deviation of colors
-        features['std_r'] = np.std(img_array[:, :, 0])
-        features['std_g'] = np.std(img_array[:, :, 1])
-        features['std_b'] = np.std(img_array[:, :, 2])
-        
-        # Image brightness and contrast
-        gray = np.mean(img_array, axis=2)
-        features['brightness'] = np.mean(gray)
-        features['contrast'] = np.std(gray)
-        
-        # Center region features (face area)
-        center_h, center_w = 64, 64
-        center_region = img_array[32:96, 32:96]
-        features['center_avg'] = np.mean(center_region)
-        features['center_std'] = np.std(center_region)
-        
-        # Edge detection features
-        edges = np.abs(np.diff(gray, axis=0)).sum() + np.abs(np.diff(gray, axis=1)).sum()
-        features['edge_density'] = edges / (128 * 128)
+        image = image.resize((features.IMAGE_SIZE, features.IMAGE_SIZE))
         
-        # Histogram features
-        hist_r = np.histogram(img_array[:, :, 0], bins=8)[0]
-        hist_g = np.histogram(img_array[:, :, 1], bins=8)[0]
-        hist_b = np.histogram(img_array[:, :, 2], bins=8)[0]
-        
-        features['hist_r'] = hist_r.tolist()
-        features['hist_g'] = hist_g.tolist()
-        features['hist_b'] = hist_b.tolist()
-        
-        return features, None
+        return features.feature_vector(image), None
         
     except Exception as e:
         return None, f"Error processing image: {str(e)}"
 
-def calculate_similarity(features1, features2):
-    """Calculate similarity between two feature sets"""
-    try:
-        similarity_score = 0
-        total_weights = 0
-        
-        # Color similarity
-        color_features = ['avg_r', 'avg_g', 'avg_b', 'std_r', 'std_g', 'std_b']
-        for feature in color_features:
-            if feature in features1 and feature in features2:
-                diff = abs(features1[feature] - features2[feature])
-                sim = max(0, 1 - diff / 255)  # Normalize to 0-1
-                similarity_score += sim * 0.1
-                total_weights += 0.1
-        
-        # Brightness and contrast similarity
-        structural_features = ['brightness', 'contrast', 'center_avg', 'center_std', 'edge_density']
-        for feature in structural_features:
-            if feature in features1 and feature in features2:
-                diff = abs(features1[feature] - features2[feature])
-                max_val = max(features1[feature], features2[feature], 1)
-                sim = max(0, 1 - diff / max_val)
-                similarity_score += sim * 0.15
-                total_weights += 0.15
-        
-        # Histogram similarity
-        hist_features = ['hist_r', 'hist_g', 'hist_b']
-        for feature in hist_features:
-            if feature in features1 and feature in features2:
-                hist1 = np.array(features1[feature])
-                hist2 = np.array(features2[feature])
-                # Normalized correlation
-                correlation = np.corrcoef(hist1, hist2)[0, 1]
-                if not np.isnan(correlation):
-                    similarity_score += max(0, correlation) * 0.1
-                    total_weights += 0.1
-        
-        if total_weights > 0:
-            return similarity_score / total_weights
-        else:
-            return 0.0
-            
-    except Exception as e:
-        print(f"Error calculating similarity: {e}")
-        return 0.0
-
 # Database setup
 def init_db():
-    conn = sqlite3.connect('face_login_simple_ai.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -156,9 +93,63 @@ def init_db():
         )
     ''')
     
+    # Append-only log of face registrations, so workers can catch up by sequence number
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS face_enrollments (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
+def decode_feature_rows(rows):
+    """(user_ids, vectors) of (id, username, face_features) rows, skipping unreadable ones"""
+    user_ids, vectors = [], []
+    for user_id, username, stored_features in rows:
+        try:
+            vectors.append(features.decode_features(stored_features))
+            user_ids.append(user_id)
+        except Exception as e:
+            print(f"Error processing stored features for user {username}: {e}")
+    return user_ids, vectors
+
+def load_face_features():
+    """Build the feature gallery from every stored face, parsing each row once"""
+    global face_gallery
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    # Read the high-water mark first: a face registered during the load is then caught up, not lost
+    cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM face_enrollments')
+    high_water = cursor.fetchone()[0]
+    cursor.execute('SELECT id, username, face_features FROM users WHERE face_features IS NOT NULL ORDER BY id')
+    rows = cursor.fetchall()
+    conn.close()
+    
+    gallery = features.FeatureGallery(initial_capacity=max(len(rows), 1024))
+    user_ids, vectors = decode_feature_rows(rows)
+    gallery.add_many(user_ids, vectors, high_water=high_water)
+    face_gallery = gallery
+    return face_gallery
+
+def sync_face_features():
+    """Add faces registered after the gallery's high-water mark"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT e.seq, u.id, u.username, u.face_features
+        FROM face_enrollments e JOIN users u ON u.id = e.user_id
+        WHERE e.seq > ? AND u.face_features IS NOT NULL
+        ORDER BY e.seq
+    ''', (face_gallery.high_water,))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    if rows:
+        user_ids, vectors = decode_feature_rows([row[1:] for row in rows])
+        face_gallery.add_many(user_ids, vectors, high_water=rows[-1][0])
+
 def find_matching_user(image_data, tolerance=0.7):
     """Find matching user based on face features"""
     # Extract features from input image
@@ -167,46 +158,38 @@ def find_matching_user(image_data, tolerance=0.7):
     if error:
         return None
     
-    conn = sqlite3.connect('face_login_simple_ai.db')
-    cursor = conn.cursor()
+    # Concurrent first logins wait for one load; later logins take turns catching up
+    with face_gallery_lock:
+        if face_gallery is None:
+            load_face_features()
+        else:
+            sync_face_features()
     
-    cursor.execute('SELECT id, username, face_features FROM users WHERE face_features IS NOT NULL')
-    users = cursor.fetchall()
-    conn.close()
+    # One pass of array operations scores every enrolled user
+    match = face_gallery.match(input_features, tolerance=tolerance)
+    if match is None:
+        return None
     
-    best_match = None
-    best_similarity = 0.0
+    user_id, similarity = match
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+    conn.close()
     
-    for user_id, username, stored_features_json in users:
-        if stored_features_json:
-            try:
-                stored_features = json.loads(stored_features_json)
-                similarity = calculate_similarity(input_features, stored_features)
-                
-                if similarity > tolerance and similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = {
-                        'user_id': user_id,
-                        'username': username,
-                        'similarity': similarity,
-                        'confidence': similarity
-                    }
-                    
-            except Exception as e:
-                print(f"Error processing stored features for user {username}: {e}")
-                continue
+    if not user:
+        return None
     
-    return best_match
+    return {
+        'user_id': user_id,
+        'username': user[0],
+        'similarity': similarity,
+        'confidence': similarity
+    }
 
 def log_login_attempt(username, user_id, attempt_type, success, confidence, ip_address):
-    conn = sqlite3.connect('face_login_simple_ai.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO login_attempts (username, user_id, attempt_type, success, confidence, ip_address)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (username, user_id, attempt_type, success, confidence, ip_address))
-    conn.commit()
-    conn.close()
+    """Queue a login attempt for the background audit log writer"""
+    audit_log.submit((username, user_id, attempt_type, success, confidence, ip_address, utc_timestamp()))
 
 @app.route('/')
 def index():
@@ -225,7 +208,7 @@ def register():
             return render_template('register_simple_ai.html')
         
         # Check if user already exists
-        conn = sqlite3.connect('face_login_simple_ai.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
         if cursor.fetchone():
@@ -266,15 +249,14 @@ def register_face():
             return jsonify({'success': False, 'message': error})
         
         # Store face features in database
-        conn = sqlite3.connect('face_login_simple_ai.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         
-        features_json = json.dumps(face_features)
-        
         cursor.execute('''
             UPDATE users SET face_features = ?, face_images = ? 
             WHERE id = ?
-        ''', (features_json, face_data, session['user_id']))
+        ''', (features.encode_features(face_features), face_data, session['user_id']))
+        cursor.execute('INSERT INTO face_enrollments (user_id) VALUES (?)', (session['user_id'],))
         conn.commit()
         conn.close()
         
@@ -296,7 +278,7 @@ def login():
             return jsonify({'success': False, 'message': 'Username and password are required'})
         
         # Get user from database
-        conn = sqlite3.connect('face_login_simple_ai.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,))
         user = cursor.fetchone()
@@ -343,8 +325,9 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('index'))
     
-    # Get user's login history
-    conn = sqlite3.connect('face_login_simple_ai.db')
+    # Get user's login history, including the attempt that just logged them in
+    audit_log.flush()
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT attempt_type, success, confidence, timestamp
@@ -1,17 +1,32 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import os
 import base64
 import hashlib
 from datetime import datetime
 
+from models import connection_pool
+from models.audit_log import AuditLogWriter, utc_timestamp
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this to a random secret key
 
+# Database file; connections come from a shared, tuned pool
+DATABASE = 'face_login.db'
+
+def get_db_connection():
+    """Get a pooled connection to the app database"""
+    return connection_pool.connect(DATABASE)
+
+# Login attempts are written in batches off the request thread
+audit_log = AuditLogWriter(connection_pool.get_pool(DATABASE), '''
+    INSERT INTO login_attempts (username, attempt_type, success, ip_address, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+''')
+
 # Database setup
 def init_db():
-    conn = sqlite3.connect('face_login.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -41,14 +56,8 @@ def init_db():
     conn.close()
 
 def log_login_attempt(username, attempt_type, success, ip_address):
-    conn = sqlite3.connect('face_login.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO login_attempts (username, attempt_type, success, ip_address)
-        VALUES (?, ?, ?, ?)
-    ''', (username, attempt_type, success, ip_address))
-    conn.commit()
-    conn.close()
+    """Queue a login attempt for the background audit log writer"""
+    audit_log.submit((username, attempt_type, success, ip_address, utc_timestamp()))
 
 @app.route('/')
 def index():
@@ -67,7 +76,7 @@ def register():
             return render_template('register_webcam.html')
         
         # Check if user already exists
-        conn = sqlite3.connect('face_login.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
         if cursor.fetchone():
@@ -102,7 +111,7 @@ def register_face():
             return jsonify({'success': False, 'message': 'No face data provided'})
         
         # Store face data for the logged-in user
-        conn = sqlite3.connect('face_login.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET face_data = ? WHERE id = ?', 
                       (face_data, session['user_id']))
@@ -126,7 +135,7 @@ def login():
         return jsonify({'success': False, 'message': 'Username is required'})
     
     # Get user from database
-    conn = sqlite3.connect('face_login.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id, username, password_hash, face_data FROM users WHERE username = ?', (username,))
     user = cursor.fetchone()
@@ -194,8 +203,9 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('index'))
     
-    # Get user's login history
-    conn = sqlite3.connect('face_login.db')
+    # Get user's login history, including the attempt that just logged them in
+    audit_log.flush()
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT attempt_type, success, timestamp
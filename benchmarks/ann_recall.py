@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Recall / latency report for the IVF face matcher against brute force.
+
+Generates a deterministic synthetic gallery of 128-d encodings, queries
+it with noisy copies of enrolled faces plus impostors, and compares each
+IVFIndex configuration with the exact FaceGallery scan.
+
+Usage:
+    python benchmarks/ann_recall.py [--size 100000] [--queries 500] [--pq-m 8]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ann_index import IVFIndex
+from models.face_gallery import ENCODING_SIZE, FaceGallery
+
+
+def synthetic_gallery(size, seed=0):
+    """Clustered encodings with roughly the spread of real dlib encodings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.12, (max(1, size // 500), ENCODING_SIZE))
+    members = centers[rng.integers(0, len(centers), size)]
+    return (members + rng.normal(0, 0.06, (size, ENCODING_SIZE))).astype(np.float32)
+
+
+def timed_matches(matcher, queries, tolerance, **kwargs):
+    """Run every query, returning (results, per-query latencies in ms)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(matcher.match(query, tolerance=tolerance, **kwargs))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--pq-m', type=int, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    gallery_matrix = synthetic_gallery(args.size)
+    ids = np.arange(1, args.size + 1)
+
+    # Half genuine probes (noisy copies of enrolled faces), half impostors
+    genuine = gallery_matrix[rng.integers(0, args.size, args.queries // 2)]
+    genuine = genuine + rng.normal(0, 0.02, genuine.shape).astype(np.float32)
+    impostors = synthetic_gallery(args.queries - len(genuine), seed=2)
+    queries = np.concatenate([genuine, impostors])
+
+    exact = FaceGallery()
+    exact.add_many(ids, gallery_matrix)
+    expected, exact_latency = timed_matches(exact, queries, args.tolerance)
+
+    start = time.perf_counter()
+    index = IVFIndex(nlist=args.nlist, pq_m=args.pq_m, min_train_size=1)
+    index.add_many(ids, gallery_matrix)
+    build_seconds = time.perf_counter() - start
+
+    print(f"Gallery: {args.size} encodings, {len(queries)} queries, tolerance {args.tolerance}")
+    print(f"IVF: nlist={len(index.centroids)} pq_m={args.pq_m} built in {build_seconds:.1f}s")
+    print()
+    print(f"{'matcher':<16}{'recall':>8}{'agree':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    print(f"{'brute force':<16}{1.0:>8.3f}{1.0:>8.3f}{np.percentile(exact_latency, 50):>10.3f}"
+          f"{np.percentile(exact_latency, 95):>10.3f}{exact_latency.mean():>10.3f}")
+
+    matched = [e for e in expected if e is not None]
+    for nprobe in args.nprobe:
+        results, latency = timed_matches(index, queries, args.tolerance, nprobe=nprobe)
+        # recall: brute-force matches the index also found; agree: identical decision overall
+        hits = sum(1 for e, r in zip(expected, results) if e is not None and r is not None and e[0] == r[0])
+        agree = sum(1 for e, r in zip(expected, results) if (e and e[0]) == (r and r[0]))
+        recall = hits / len(matched) if matched else 1.0
+        print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>8.3f}{agree / len(queries):>8.3f}"
+              f"{np.percentile(latency, 50):>10.3f}{np.percentile(latency, 95):>10.3f}{latency.mean():>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
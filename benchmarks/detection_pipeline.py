@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Per-stage timings and encoding drift of downscaled face detection.
+
+For every image in a directory, runs the full-resolution pipeline
+(HOG on the original frame) and the downscale-detect pipeline (HOG on a
+copy `--width` pixels wide, boxes mapped back, encoding on the original
+pixels), then reports per-stage timings, box IoU and the distance between
+the two encodings. Drift well under the 0.6 match tolerance means the
+cheaper detector does not change login decisions.
+
+Usage:
+    python benchmarks/detection_pipeline.py <image_dir> [--width 320 240] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_recognition
+from models.face_recognition import locate_faces
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def timed(function, *args, repeat=1, **kwargs):
+    """Best-of-repeat wall time in ms, plus the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    intersection = max(0, bottom - top) * max(0, right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    union = area(a) + area(b) - intersection
+    return intersection / union if union else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir')
+    parser.add_argument('--width', type=int, nargs='+', default=[320])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return 1
+
+    rows = {width: [] for width in [None] + args.width}
+    for path in paths:
+        decode_ms, image = timed(lambda: np.array(Image.open(path).convert('RGB')), repeat=args.repeat)
+        reference_boxes = None
+        reference_encoding = None
+
+        for width in rows:
+            detect_ms, boxes = timed(locate_faces, image, width, repeat=args.repeat)
+            if len(boxes) != 1:
+                rows[width].append({'decode': decode_ms, 'detect': detect_ms, 'encode': np.nan,
+                                    'faces': len(boxes), 'iou': np.nan, 'drift': np.nan})
+                continue
+
+            encode_ms, encodings = timed(face_recognition.face_encodings, image, boxes, repeat=args.repeat)
+            if width is None:
+                reference_boxes, reference_encoding = boxes, encodings[0]
+
+            iou = drift = np.nan
+            if reference_encoding is not None:
+                iou = box_iou(reference_boxes[0], boxes[0])
+                drift = float(np.linalg.norm(reference_encoding - encodings[0]))
+            rows[width].append({'decode': decode_ms, 'detect': detect_ms, 'encode': encode_ms,
+                                'faces': 1, 'iou': iou, 'drift': drift})
+
+    print(f"{len(paths)} images, best of {args.repeat} runs per stage")
+    print()
+    print(f"{'detector':<14}{'decode ms':>10}{'detect ms':>10}{'encode ms':>10}"
+          f"{'1-face':>8}{'mean IoU':>10}{'mean drift':>12}{'max drift':>11}")
+    for width, results in rows.items():
+        label = 'full-res' if width is None else f'{width}px'
+        column = lambda key: np.array([result[key] for result in results], dtype=float)
+        drift = column('drift')
+        print(f"{label:<14}{np.nanmean(column('decode')):>10.1f}{np.nanmean(column('detect')):>10.1f}"
+              f"{np.nanmean(column('encode')):>10.1f}{int(np.sum(column('faces') == 1)):>8}"
+              f"{np.nanmean(column('iou')):>10.3f}{np.nanmean(drift):>12.4f}"
+              f"{np.nanmax(drift) if np.any(~np.isnan(drift)) else np.nan:>11.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Throughput and miss rate of the face detector backends.
+
+Every image in a directory is run through each backend (see
+models/face_recognition.DETECTOR_BACKENDS) at the given detection width
+and compared with a reference detector, by default HOG on the
+full-resolution image:
+
+    miss       reference found a face the backend did not (IoU < --iou)
+    extra      backend box matching no reference face (false positive)
+    rejected   frames with no reference face the backend also found empty
+
+A cheap backend is worth using on a route when its miss rate is close
+to HOG's while its detect time is a fraction of it.
+
+Usage:
+    python benchmarks/detector_backends.py <image_dir> [--backends hog haar cascade] [--width 320] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.face_recognition import DETECTOR_BACKENDS, get_detector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    intersection = max(0, bottom - top) * max(0, right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    union = area(a) + area(b) - intersection
+    return intersection / union if union else 0.0
+
+
+def best_ms(detector, image, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        boxes = detector.detect(image)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir')
+    parser.add_argument('--backends', nargs='+', default=['hog', 'haar', 'cascade'], choices=sorted(DETECTOR_BACKENDS))
+    parser.add_argument('--width', type=int, default=320, help='detection width for the backends (0 = full resolution)')
+    parser.add_argument('--reference', default='hog', choices=sorted(DETECTOR_BACKENDS))
+    parser.add_argument('--iou', type=float, default=0.3, help='minimum IoU for a box to count as the same face')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return 1
+
+    reference = get_detector(args.reference, None)
+    detectors = {name: get_detector(name, args.width or None) for name in args.backends}
+    rows = {name: {'ms': [], 'faces': 0, 'missed': 0, 'extra': 0, 'empty': 0, 'rejected': 0} for name in detectors}
+
+    for path in paths:
+        image = np.array(Image.open(path).convert('RGB'))
+        expected = reference.detect(image)
+        for name, detector in detectors.items():
+            ms, boxes = best_ms(detector, image, args.repeat)
+            row = rows[name]
+            row['ms'].append(ms)
+            row['faces'] += len(expected)
+            row['missed'] += sum(1 for face in expected if not any(box_iou(face, box) >= args.iou for box in boxes))
+            row['extra'] += sum(1 for box in boxes if not any(box_iou(face, box) >= args.iou for face in expected))
+            if not expected:
+                row['empty'] += 1
+                row['rejected'] += not boxes
+
+    width = f'{args.width}px' if args.width else 'full resolution'
+    print(f"{len(paths)} images, backends at {width}, reference {args.reference} at full resolution, "
+          f"best of {args.repeat} runs")
+    print()
+    print(f"{'backend':<10}{'mean ms':>9}{'p95 ms':>9}{'frames/s':>10}{'miss rate':>11}{'extra':>7}{'rejected':>10}")
+    for name, row in rows.items():
+        ms = np.array(row['ms'])
+        miss_rate = row['missed'] / row['faces'] if row['faces'] else float('nan')
+        rejected = f"{row['rejected']}/{row['empty']}"
+        print(f"{name:<10}{ms.mean():>9.2f}{np.percentile(ms, 95):>9.2f}{1000 / ms.mean():>10.1f}"
+              f"{miss_rate:>11.1%}{row['extra']:>7}{rejected:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
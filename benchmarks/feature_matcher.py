@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Parity and speed of the vectorized simple-AI feature matcher.
+
+The old app_simple_ai matcher extracted a dict of features per image and
+scored it against every stored user with calculate_similarity (three
+np.corrcoef calls per user). calculate_similarity is kept below verbatim
+and reference_features repeats extract_simple_features' computations on
+an already decoded, resized image; together they are the reference. For
+a set of smooth synthetic face images, including one whose histograms
+are constant (undefined correlation), this script checks that
+FeatureGallery.scores() reproduces the reference scores and best
+matches, then times a full match over --users enrolled vectors against
+the reference loop's per-user cost.
+
+Usage:
+    python benchmarks/feature_matcher.py [--users 100000] [--images 200] [--queries 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.feature_gallery import FEATURE_SIZE, IMAGE_SIZE, FeatureGallery, feature_vector
+
+
+def reference_features(img_array):
+    """The feature computations of the old extract_simple_features, after decoding and resizing"""
+    features = {}
+    features['avg_r'] = np.mean(img_array[:, :, 0])
+    features['avg_g'] = np.mean(img_array[:, :, 1])
+    features['avg_b'] = np.mean(img_array[:, :, 2])
+    features['std_r'] = np.std(img_array[:, :, 0])
+    features['std_g'] = np.std(img_array[:, :, 1])
+    features['std_b'] = np.std(img_array[:, :, 2])
+    gray = np.mean(img_array, axis=2)
+    features['brightness'] = np.mean(gray)
+    features['contrast'] = np.std(gray)
+    center_region = img_array[32:96, 32:96]
+    features['center_avg'] = np.mean(center_region)
+    features['center_std'] = np.std(center_region)
+    edges = np.abs(np.diff(gray, axis=0)).sum() + np.abs(np.diff(gray, axis=1)).sum()
+    features['edge_density'] = edges / (128 * 128)
+    features['hist_r'] = np.histogram(img_array[:, :, 0], bins=8)[0].tolist()
+    features['hist_g'] = np.histogram(img_array[:, :, 1], bins=8)[0].tolist()
+    features['hist_b'] = np.histogram(img_array[:, :, 2], bins=8)[0].tolist()
+    return features
+
+
+def calculate_similarity(features1, features2):
+    """Calculate similarity between two feature sets"""
+    try:
+        similarity_score = 0
+        total_weights = 0
+        
+        # Color similarity
+        color_features = ['avg_r', 'avg_g', 'avg_b', 'std_r', 'std_g', 'std_b']
+        for feature in color_features:
+            if feature in features1 and feature in features2:
+                diff = abs(features1[feature] - features2[feature])
+                sim = max(0, 1 - diff / 255)  # Normalize to 0-1
+                similarity_score += sim * 0.1
+                total_weights += 0.1
+        
+        # Brightness and contrast similarity
+        structural_features = ['brightness', 'contrast', 'center_avg', 'center_std', 'edge_density']
+        for feature in structural_features:
+            if feature in features1 and feature in features2:
+                diff = abs(features1[feature] - features2[feature])
+                max_val = max(features1[feature], features2[feature], 1)
+                sim = max(0, 1 - diff / max_val)
+                similarity_score += sim * 0.15
+                total_weights += 0.15
+        
+        # Histogram similarity
+        hist_features = ['hist_r', 'hist_g', 'hist_b']
+        for feature in hist_features:
+            if feature in features1 and feature in features2:
+                hist1 = np.array(features1[feature])
+                hist2 = np.array(features2[feature])
+                # Normalized correlation
+                correlation = np.corrcoef(hist1, hist2)[0, 1]
+                if not np.isnan(correlation):
+                    similarity_score += max(0, correlation) * 0.1
+                    total_weights += 0.1
+        
+        if total_weights > 0:
+            return similarity_score / total_weights
+        else:
+            return 0.0
+            
+    except Exception as e:
+        print(f"Error calculating similarity: {e}")
+        return 0.0
+
+
+def face_images(count, seed=0):
+    """Smooth random 128x128 RGB frames, the last one with perfectly flat histograms"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count - 1):
+        small = (rng.random((8, 8, 3)) * 255).astype(np.uint8)
+        image = Image.fromarray(small).resize((320, 240), Image.BICUBIC).resize((IMAGE_SIZE, IMAGE_SIZE))
+        images.append(np.asarray(image))
+    # Eight evenly spaced levels, 2048 pixels each: every histogram bin is equal
+    levels = np.repeat(np.linspace(0, 255, 8).astype(np.uint8), IMAGE_SIZE * IMAGE_SIZE // 8)
+    images.append(np.stack([levels.reshape(IMAGE_SIZE, IMAGE_SIZE)] * 3, axis=2))
+    return images
+
+
+def noisy(image, rng, scale=6):
+    return np.clip(image + rng.normal(0, scale, image.shape), 0, 255).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    enrolled = face_images(args.images)
+    queries = [noisy(enrolled[index], rng) for index in rng.integers(0, len(enrolled), args.queries // 2)]
+    queries += face_images(args.queries - len(queries) + 1, seed=2)[:-1] + [enrolled[-1]]
+
+    reference = [reference_features(image) for image in enrolled]
+    gallery = FeatureGallery()
+    gallery.add_many(np.arange(1, len(enrolled) + 1), [feature_vector(image) for image in enrolled])
+
+    worst, agree, reference_seconds = 0.0, 0, 0.0
+    for query in queries:
+        query_features = reference_features(query)
+        start = time.perf_counter()
+        # The old code let np.corrcoef warn on constant histograms
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = np.array([calculate_similarity(query_features, stored) for stored in reference])
+        reference_seconds += time.perf_counter() - start
+        _, scores = gallery.scores(feature_vector(query))
+        worst = max(worst, float(np.abs(scores - expected).max()))
+
+        best = int(np.argmax(expected))
+        expected_match = (best + 1, expected[best]) if expected[best] > args.tolerance else None
+        match = gallery.match(feature_vector(query), tolerance=args.tolerance)
+        agree += (match is None) == (expected_match is None) and (match is None or match[0] == expected_match[0])
+
+    print(f"parity over {len(queries)} queries x {len(enrolled)} users: "
+          f"max |score difference| {worst:.2e}, same match decision {agree}/{len(queries)}")
+
+    vectors = np.array([feature_vector(image) for image in enrolled])
+    large = FeatureGallery(initial_capacity=args.users)
+    picks = rng.integers(0, len(vectors), args.users)
+    large.add_many(np.arange(1, args.users + 1), vectors[picks] + rng.normal(0, 2, (args.users, FEATURE_SIZE))
+                   .astype(np.float32) * (np.arange(FEATURE_SIZE) < 11))
+    probe = feature_vector(queries[0])
+    large.match(probe)
+    timings = []
+    for _ in range(20):
+        start = time.perf_counter()
+        large.match(probe, tolerance=args.tolerance)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    per_user_ms = reference_seconds * 1000 / (len(queries) * len(enrolled))
+    print(f"{args.users} users: vectorized match p50 {np.median(timings):.2f} ms, "
+          f"reference loop ~{per_user_ms * args.users:.0f} ms ({per_user_ms * 1000:.1f} us per user)")
+    return 0 if agree == len(queries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Payload size and server-side decode cost of base64 JSON vs binary frame uploads.
+
+For every frame, builds the request body each client would send -- a JSON
+document wrapping a base64 data URL (what /face-login accepts) and the raw
+JPEG bytes (what /face-login/frame accepts) -- then times how long the
+server takes to turn each body into the image array handed to the
+recognizer, and checks that both paths yield identical pixels.
+
+Without an image directory, synthetic 640x480 frames are used.
+
+Usage:
+    python benchmarks/frame_upload.py [image_dir] [--frames 20] [--quality 80] [--repeat 20]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def legacy_decode(body):
+    """The JSON/base64 route: parse, split, b64decode, PIL decode, array copy, channel swap"""
+    image_data = json.loads(body)['image']
+    image = Image.open(io.BytesIO(base64.b64decode(image_data.split(',')[1])))
+    image_array = np.array(image)
+    if len(image_array.shape) == 3 and image_array.shape[2] == 3:
+        image_array = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+    return image_array
+
+
+def binary_decode(body):
+    """The binary route: one decode straight from the request buffer"""
+    return cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def synthetic_frames(count, seed=0):
+    """Smooth random 640x480 frames that compress like camera images"""
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        noise = (rng.random((60, 80, 3)) * 255).astype(np.uint8)
+        yield cv2.resize(noise, (640, 480), interpolation=cv2.INTER_CUBIC)
+
+
+def load_frames(image_dir):
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield np.array(Image.open(os.path.join(image_dir, name)).convert('RGB'))
+
+
+def best_ms(function, body, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(body)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir', nargs='?')
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    frames = load_frames(args.image_dir) if args.image_dir else synthetic_frames(args.frames)
+    rows = []
+    for frame in frames:
+        buffer = io.BytesIO()
+        Image.fromarray(frame).save(buffer, 'JPEG', quality=args.quality)
+        jpeg = buffer.getvalue()
+        json_body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()}).encode()
+
+        identical = np.array_equal(legacy_decode(json_body), binary_decode(jpeg))
+        rows.append((len(json_body), len(jpeg), best_ms(legacy_decode, json_body, args.repeat),
+                     best_ms(binary_decode, jpeg, args.repeat), identical))
+
+    if not rows:
+        print("No frames to measure")
+        return 1
+
+    json_bytes, jpeg_bytes, legacy_ms, binary_ms, identical = (np.array(column) for column in zip(*rows))
+    print(f"{len(rows)} frames, JPEG quality {args.quality}, best of {args.repeat} decodes")
+    print()
+    print(f"{'upload':<16}{'mean bytes':>12}{'mean decode ms':>16}{'p95 decode ms':>15}")
+    print(f"{'json + base64':<16}{json_bytes.mean():>12.0f}{legacy_ms.mean():>16.3f}{np.percentile(legacy_ms, 95):>15.3f}")
+    print(f"{'binary jpeg':<16}{jpeg_bytes.mean():>12.0f}{binary_ms.mean():>16.3f}{np.percentile(binary_ms, 95):>15.3f}")
+    print()
+    print(f"payload -{100 * (1 - jpeg_bytes.sum() / json_bytes.sum()):.1f}%, "
+          f"decode -{100 * (1 - binary_ms.sum() / legacy_ms.sum()):.1f}%, "
+          f"identical pixels in {int(identical.sum())}/{len(rows)} frames")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
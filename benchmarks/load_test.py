@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Load generator and frame-replay harness for the Flask login routes.
+
+Drives password logins, face logins and registration captures with a
+configurable mix, replaying a corpus of recorded JPEG frames (or
+synthetic ones), and reports throughput, latency percentiles, error
+rates and CPU time per route.
+
+Targets:
+    --app app|app_advanced     in-process through Flask's test client, in a
+                               throwaway working directory (the default)
+    --spawn app|app_advanced   a local threaded server started for the run
+    --url http://host:port     an already running server
+
+Arrivals:
+    --rate R [R ...]   open loop: Poisson arrivals at R requests/s, one run per
+                       rate. Latency is measured from the scheduled arrival
+                       time, so queueing shows up instead of being hidden by
+                       a slow client; arrivals beyond --max-in-flight are
+                       counted as dropped.
+    --concurrency N    closed loop: N clients issuing back-to-back requests
+
+CPU time per route is the request thread's CPU time and is only available
+in-process; work done in recognition worker processes is not included.
+With --spawn, the server process's total CPU time is reported instead.
+
+Usage:
+    python benchmarks/load_test.py --app app --mix password=0.5,face=0.5 --rate 5 10 20 40
+    python benchmarks/load_test.py --spawn app_advanced --port 5001 --concurrency 8 --frames recorded/
+"""
+
+import argparse
+import base64
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+USERNAME = 'loadtest'
+PASSWORD = 'loadtest-password'
+
+
+def json_request(path, payload):
+    return path, json.dumps(payload).encode(), 'application/json'
+
+
+# Scenario name -> builder(frame, sequence) returning (path, body, content type)
+PROFILES = {
+    'app': {
+        'password': lambda frame, n: json_request('/login', {'username': USERNAME, 'password': PASSWORD}),
+        'face': lambda frame, n: json_request('/face-login', {'image': frame['data_url']}),
+        'face_frame': lambda frame, n: ('/face-login/frame', frame['jpeg'], 'image/jpeg'),
+        'capture': lambda frame, n: json_request('/capture-face', {'image': frame['data_url'],
+                                                                   'capture_count': n % 3 + 1}),
+        'capture_frame': lambda frame, n: (f'/capture-face/frame?capture_count={n % 3 + 1}',
+                                           frame['jpeg'], 'image/jpeg'),
+    },
+    'app_advanced': {
+        'password': lambda frame, n: json_request('/login', {'username': USERNAME, 'password': PASSWORD,
+                                                             'type': 'password'}),
+        'face': lambda frame, n: json_request('/login', {'type': 'face', 'face_data': frame['data_url']}),
+    },
+}
+
+
+def load_corpus(frames_dir, count=16, seed=0):
+    """Recorded JPEG frames from a directory, or smooth synthetic 640x480 frames"""
+    if frames_dir:
+        blobs = [open(os.path.join(frames_dir, name), 'rb').read() for name in sorted(os.listdir(frames_dir))
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+    else:
+        rng = np.random.default_rng(seed)
+        blobs = []
+        for _ in range(count):
+            small = Image.fromarray((rng.random((12, 16, 3)) * 255).astype(np.uint8))
+            buffer = io.BytesIO()
+            small.resize((640, 480), Image.BICUBIC).save(buffer, 'JPEG', quality=80)
+            blobs.append(buffer.getvalue())
+    return [{'jpeg': blob, 'data_url': 'data:image/jpeg;base64,' + base64.b64encode(blob).decode()}
+            for blob in blobs]
+
+
+def parse_mix(text, profile):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in profile:
+            raise SystemExit(f"Unknown scenario '{name}'; this app supports: {', '.join(profile)}")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    return list(mix), np.array([weight / total for weight in mix.values()])
+
+
+def prepare_app(module_name, workdir):
+    """Import the app inside a throwaway working directory and seed the load-test user"""
+    os.chdir(workdir)
+    os.makedirs('database', exist_ok=True)
+    module = __import__(module_name)
+
+    if module_name == 'app':
+        module.db.create_user(USERNAME, PASSWORD, 'Load', 'Test', 'other')
+    else:
+        from werkzeug.security import generate_password_hash
+        module.init_db()
+        conn = module.get_db_connection()
+        conn.execute('INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)',
+                     (USERNAME, generate_password_hash(PASSWORD)))
+        conn.commit()
+        conn.close()
+    # Warm up as the apps' __main__ blocks do; importing them starts nothing
+    module.start_warmup()
+    return module.app
+
+
+class InProcessTarget:
+    """Requests through Flask's test client, one fresh client (and session) per request"""
+
+    measures_cpu = True
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    def send(self, path, body, content_type):
+        response = self.app.test_client().post(path, data=body, content_type=content_type)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTarget:
+    """Requests over HTTP to a running server"""
+
+    measures_cpu = False
+
+    def __init__(self, url, timeout=30.0):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+
+    def send(self, path, body, content_type):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request('POST', path, body, {'Content-Type': content_type})
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+def spawn_server(module_name, port, workdir):
+    """Start a threaded server for the app in the background; returns the process"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', module_name,
+                                '--port', str(port), '--workdir', workdir],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server for {module_name} exited with code {process.returncode}")
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            conn.close()
+    process.kill()
+    raise SystemExit(f"Server for {module_name} did not start on port {port}")
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU time of a process from /proc, or None where unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Recorder:
+    """Collects one record per request from many threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+        self.dropped = 0
+
+    def request(self, target, scenario, request, scheduled):
+        path, body, content_type = request
+        started = time.perf_counter()
+        cpu_start = time.thread_time()
+        error = None
+        status, payload = None, None
+        try:
+            status, payload = target.send(path, body, content_type)
+            if status >= 500:
+                error = f'HTTP {status}'
+            elif not isinstance(payload, dict):
+                error = 'non-JSON response'
+            elif 'system error' in str(payload.get('message', '')).lower():
+                error = payload['message']
+        except Exception as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        record = {
+            'scenario': scenario,
+            'latency': finished - scheduled,
+            'service': finished - started,
+            'cpu': time.thread_time() - cpu_start,
+            'error': error,
+            'success': bool(isinstance(payload, dict) and payload.get('success')),
+            'finished': finished,
+        }
+        with self.lock:
+            self.records.append(record)
+
+
+def run_open_loop(target, profile, scenarios, weights, corpus, rate, duration, max_in_flight, seed):
+    recorder = Recorder()
+    rng = np.random.default_rng(seed)
+    slots = threading.BoundedSemaphore(max_in_flight)
+
+    def task(scenario, request, scheduled):
+        try:
+            recorder.request(target, scenario, request, scheduled)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        start = time.perf_counter()
+        arrival = start
+        sequence = 0
+        while arrival < start + duration:
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            scenario = scenarios[rng.choice(len(scenarios), p=weights)]
+            request = profile[scenario](corpus[sequence % len(corpus)], sequence)
+            if slots.acquire(blocking=False):
+                pool.submit(task, scenario, request, arrival)
+            else:
+                recorder.dropped += 1
+            sequence += 1
+            arrival += rng.exponential(1.0 / rate)
+    return recorder, time.perf_counter() - start
+
+
+def run_closed_loop(target, profile, scenarios, weights, corpus, concurrency, duration, seed):
+    recorder = Recorder()
+    start = time.perf_counter()
+
+    def client(index):
+        rng = np.random.default_rng(seed + index)
+        sequence = index
+        while time.perf_counter() < start + duration:
+            scenario = scenarios[rng.choice(len(scenarios), p=weights)]
+            request = profile[scenario](corpus[sequence % len(corpus)], sequence)
+            recorder.request(target, scenario, request, time.perf_counter())
+            sequence += concurrency
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - start
+
+
+def summarize(records, elapsed, measures_cpu):
+    latency = np.array([record['latency'] for record in records]) * 1000
+    errors = sum(1 for record in records if record['error'])
+    return {
+        'requests': len(records),
+        'throughput_rps': len(records) / elapsed if elapsed else 0.0,
+        'p50_ms': float(np.percentile(latency, 50)) if len(latency) else None,
+        'p95_ms': float(np.percentile(latency, 95)) if len(latency) else None,
+        'p99_ms': float(np.percentile(latency, 99)) if len(latency) else None,
+        'max_ms': float(latency.max()) if len(latency) else None,
+        'error_rate': errors / len(records) if records else 0.0,
+        'success_rate': sum(record['success'] for record in records) / len(records) if records else 0.0,
+        'cpu_ms_per_request': (1000 * sum(record['cpu'] for record in records) / len(records)
+                               if measures_cpu and records else None),
+    }
+
+
+def print_report(label, recorder, elapsed, measures_cpu, server_cpu=None):
+    print(f"\n{label}: {len(recorder.records)} requests in {elapsed:.1f}s, {recorder.dropped} dropped"
+          + (f", server CPU {server_cpu:.2f}s" if server_cpu is not None else ''))
+    print(f"{'route':<15}{'n':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+          f"{'errors':>8}{'success':>9}{'cpu ms':>9}")
+    scenarios = sorted({record['scenario'] for record in recorder.records})
+    rows = {}
+    for name in scenarios + ['all']:
+        records = [record for record in recorder.records if name == 'all' or record['scenario'] == name]
+        summary = rows[name] = summarize(records, elapsed, measures_cpu)
+        if not records:
+            continue
+        cpu = f"{summary['cpu_ms_per_request']:>9.1f}" if summary['cpu_ms_per_request'] is not None else f"{'-':>9}"
+        print(f"{name:<15}{summary['requests']:>7}{summary['throughput_rps']:>9.1f}{summary['p50_ms']:>10.1f}"
+              f"{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}{summary['max_ms']:>10.1f}"
+              f"{summary['error_rate']:>8.1%}{summary['success_rate']:>9.1%}{cpu}")
+    return rows
+
+
+def serve(module_name, port, workdir):
+    """Child process entry point for --spawn"""
+    flask_app = prepare_app(module_name, workdir)
+    flask_app.run(host='127.0.0.1', port=port, threaded=True, debug=False, use_reloader=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument('--app', choices=sorted(PROFILES), default='app')
+    target_group.add_argument('--spawn', choices=sorted(PROFILES))
+    target_group.add_argument('--url')
+    target_group.add_argument('--serve', choices=sorted(PROFILES), help=argparse.SUPPRESS)
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='route profile for --url (default: app)')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--mix', default='password=0.5,face=0.4,capture=0.1')
+    parser.add_argument('--frames', help='directory of recorded JPEG frames to replay')
+    arrivals = parser.add_mutually_exclusive_group()
+    arrivals.add_argument('--rate', type=float, nargs='+')
+    arrivals.add_argument('--concurrency', type=int)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per run')
+    parser.add_argument('--max-in-flight', type=int, default=64)
+    parser.add_argument('--workdir', default=None, help='working directory for in-process or spawned apps')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the per-run summaries as JSON')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='login-load-')
+    if args.serve:
+        serve(args.serve, args.port, workdir)
+        return 0
+
+    profile_name = args.profile or (args.spawn if args.spawn else 'app' if args.url else args.app)
+    profile = PROFILES[profile_name]
+    scenarios, weights = parse_mix(args.mix, profile)
+    corpus = load_corpus(args.frames)
+    if not corpus:
+        raise SystemExit(f"No JPEG frames found in {args.frames}")
+
+    server = None
+    if args.url:
+        target = HttpTarget(args.url)
+    elif args.spawn:
+        server = spawn_server(args.spawn, args.port, workdir)
+        target = HttpTarget(f'http://127.0.0.1:{args.port}')
+    else:
+        target = InProcessTarget(prepare_app(args.app, workdir))
+
+    print(f"Target: {args.url or args.spawn or args.app} ({profile_name} routes), mix {dict(zip(scenarios, weights.round(3).tolist()))}, "
+          f"{len(corpus)} frames")
+    runs = []
+    try:
+        plans = [('rate', rate) for rate in args.rate] if args.rate else [('concurrency', args.concurrency or 4)]
+        for kind, value in plans:
+            cpu_before = process_cpu_seconds(server.pid) if server else None
+            if kind == 'rate':
+                recorder, elapsed = run_open_loop(target, profile, scenarios, weights, corpus, value,
+                                                  args.duration, args.max_in_flight, args.seed)
+                label = f"open loop {value:g} req/s"
+            else:
+                recorder, elapsed = run_closed_loop(target, profile, scenarios, weights, corpus, value,
+                                                    args.duration, args.seed)
+                label = f"closed loop, {value} clients"
+            cpu_after = process_cpu_seconds(server.pid) if server else None
+            server_cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+            routes = print_report(label, recorder, elapsed, target.measures_cpu, server_cpu)
+            runs.append({kind: value, 'elapsed_seconds': elapsed, 'dropped': recorder.dropped,
+                         'server_cpu_seconds': server_cpu, 'routes': routes})
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'target': args.url or args.spawn or args.app, 'profile': profile_name,
+                       'mix': dict(zip(scenarios, weights.tolist())), 'runs': runs}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
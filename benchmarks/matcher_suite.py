@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+End-to-end microbenchmarks of the face matchers on synthetic galleries.
+
+For every gallery size, populates throwaway SQLite files with
+deterministic synthetic users and times each matcher exactly as the apps
+call it, so the SQLite fetch, BLOB/JSON deserialization and comparison are
+all included:
+
+    database     models.database.Database.get_user_by_face   (app.py)
+    advanced     app_advanced.find_matching_user
+    simple_ai    app_simple_ai.find_matching_user             (feature vectors)
+
+The first lookup (gallery load / snapshot build) is reported as cold_ms;
+p50/p95/p99 cover the warm lookups that follow. Half of the probes are
+noisy copies of enrolled users, half are impostors. Each (matcher, size)
+runs until --queries lookups or --budget seconds, whichever comes first,
+so every matcher stays tractable at 1M users.
+
+Results go to JSON (with commit and environment metadata) and optionally
+CSV, so runs can be compared across commits and matcher backends.
+
+Usage:
+    python benchmarks/matcher_suite.py [--sizes 1000 10000 100000 1000000]
+        [--matchers database advanced simple_ai] [--backend exact ivf]
+        [--queries 200] [--budget 30] [--output matcher_results.json] [--csv matcher_results.csv]
+"""
+
+import argparse
+import base64
+import csv
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.ann_recall import synthetic_gallery
+from models import connection_pool
+from models.encoding_codec import encode_encoding
+from models.feature_gallery import encode_features, features_to_vector
+
+MATCHERS = ('database', 'advanced', 'simple_ai')
+INSERT_CHUNK = 10000
+PASSWORD_HASH = 'x' * 64  # Never checked; the matchers only read face data
+
+
+def probe_encodings(gallery_matrix, count, seed=1):
+    """Half noisy copies of enrolled encodings, half impostors"""
+    rng = np.random.default_rng(seed)
+    genuine = gallery_matrix[rng.integers(0, len(gallery_matrix), count // 2)]
+    genuine = genuine + rng.normal(0, 0.02, genuine.shape).astype(np.float32)
+    impostors = synthetic_gallery(count - len(genuine), seed=seed + 1)
+    return np.concatenate([genuine, impostors]).astype(np.float64)
+
+
+def synthetic_features(size, seed=0):
+    """Deterministic feature vectors from 14-field feature sets like the legacy JSON ones"""
+    rng = np.random.default_rng(seed)
+    avg = rng.uniform(60, 200, (size, 3))
+    std = rng.uniform(20, 70, (size, 3))
+    scalars = rng.uniform([60, 20, 60, 20, 5], [200, 70, 200, 70, 40], (size, 5))
+    hists = rng.multinomial(128 * 128, np.full(8, 1 / 8), (size, 3))
+    for row in range(size):
+        features = {
+            'avg_r': avg[row, 0], 'avg_g': avg[row, 1], 'avg_b': avg[row, 2],
+            'std_r': std[row, 0], 'std_g': std[row, 1], 'std_b': std[row, 2],
+            'brightness': scalars[row, 0], 'contrast': scalars[row, 1],
+            'center_avg': scalars[row, 2], 'center_std': scalars[row, 3], 'edge_density': scalars[row, 4],
+            'hist_r': hists[row, 0].tolist(), 'hist_g': hists[row, 1].tolist(), 'hist_b': hists[row, 2].tolist(),
+        }
+        yield features_to_vector(features)
+
+
+def probe_images(count, seed=3):
+    """Smooth random frames as base64 data URLs, the input simple-AI login receives"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        small = (rng.random((8, 8, 3)) * 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(small).resize((320, 240), Image.BICUBIC).save(buffer, 'JPEG', quality=85)
+        images.append('data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+def insert_chunked(conn, sql, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            conn.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(sql, chunk)
+    conn.commit()
+
+
+def run_queries(lookup, probes, limit, budget):
+    """Cold first lookup, then warm lookups until the limit or time budget"""
+    start = time.perf_counter()
+    first = lookup(probes[0])
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies, hits = [], [first is not None]
+    deadline = time.perf_counter() + budget
+    for index in range(limit):
+        probe = probes[index % len(probes)]
+        start = time.perf_counter()
+        result = lookup(probe)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(result is not None)
+        if time.perf_counter() > deadline and len(latencies) >= 3:
+            break
+    return cold_ms, np.array(latencies), float(np.mean(hits))
+
+
+def bench_database(workdir, size, backend, probes, args):
+    """app.py path: Database.get_user_by_face with a snapshot-less gallery"""
+    from models.ann_index import create_gallery
+    from models.database import Database
+
+    db_path = os.path.join(workdir, 'users.db')
+    gallery_matrix = synthetic_gallery(size)
+    start = time.perf_counter()
+    db = Database(db_path=db_path, gallery=create_gallery(backend))
+    conn = db.get_connection()
+    insert_chunked(conn, '''
+        INSERT INTO users (username, password_hash, first_name, last_name, gender, face_encoding)
+        VALUES (?, ?, 'Synthetic', 'User', 'other', ?)
+    ''', ((f'user{row}', PASSWORD_HASH, encode_encoding(encoding))
+          for row, encoding in enumerate(gallery_matrix)))
+    conn.close()
+    populate_seconds = time.perf_counter() - start
+
+    queries = probe_encodings(gallery_matrix, min(args.queries, 1000))
+    del gallery_matrix
+    return populate_seconds, run_queries(db.get_user_by_face, queries, args.queries, args.budget)
+
+
+def bench_advanced(workdir, size, backend, probes, args):
+    """app_advanced path: find_matching_user with snapshot build on first use"""
+    import app_advanced
+    from models.ann_index import create_gallery
+
+    app_advanced.DATABASE = os.path.join(workdir, 'advanced.db')
+    app_advanced.FACE_ENCODINGS_FILE = os.path.join(workdir, 'face_gallery_advanced')
+    app_advanced.face_gallery = create_gallery(backend)
+    app_advanced.face_gallery_loaded = False
+
+    gallery_matrix = synthetic_gallery(size)
+    start = time.perf_counter()
+    app_advanced.init_db()
+    conn = app_advanced.get_db_connection()
+    insert_chunked(conn, 'INSERT INTO users (username, password_hash, face_encoding) VALUES (?, ?, ?)',
+                   ((f'user{row}', PASSWORD_HASH, encode_encoding(encoding))
+                    for row, encoding in enumerate(gallery_matrix)))
+    conn.execute('INSERT INTO face_enrollments (user_id) SELECT id FROM users ORDER BY id')
+    conn.commit()
+    conn.close()
+    populate_seconds = time.perf_counter() - start
+
+    queries = probe_encodings(gallery_matrix, min(args.queries, 1000))
+    del gallery_matrix
+    return populate_seconds, run_queries(app_advanced.find_matching_user, queries, args.queries, args.budget)
+
+
+def bench_simple_ai(workdir, size, backend, probes, args):
+    """app_simple_ai path: find_matching_user over the in-memory feature matrix"""
+    import app_simple_ai
+
+    app_simple_ai.DATABASE = os.path.join(workdir, 'simple_ai.db')
+    app_simple_ai.face_gallery = None
+    start = time.perf_counter()
+    app_simple_ai.init_db()
+    conn = app_simple_ai.get_db_connection()
+    insert_chunked(conn, 'INSERT INTO users (username, password_hash, face_features) VALUES (?, ?, ?)',
+                   ((f'user{row}', PASSWORD_HASH, encode_features(vector))
+                    for row, vector in enumerate(synthetic_features(size))))
+
+    # Enroll half of the probe images so those lookups are genuine matches
+    rng = np.random.default_rng(4)
+    genuine = probes[:len(probes) // 2]
+    rows = rng.choice(size, min(len(genuine), size), replace=False) + 1
+    conn.executemany('UPDATE users SET face_features = ? WHERE id = ?',
+                     [(encode_features(app_simple_ai.extract_simple_features(image)[0]), int(row))
+                      for image, row in zip(genuine, rows)])
+    conn.commit()
+    conn.close()
+    populate_seconds = time.perf_counter() - start
+
+    return populate_seconds, run_queries(app_simple_ai.find_matching_user, probes, args.queries, args.budget)
+
+
+BENCHES = {'database': bench_database, 'advanced': bench_advanced, 'simple_ai': bench_simple_ai}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--matchers', nargs='+', choices=MATCHERS, default=list(MATCHERS))
+    parser.add_argument('--backend', nargs='+', choices=['exact', 'ivf'], default=['exact'])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--budget', type=float, default=30.0, help='seconds of warm lookups per matcher and size')
+    parser.add_argument('--workdir', default=None, help='where throwaway databases go (default: system temp)')
+    parser.add_argument('--output', default='matcher_results.json')
+    parser.add_argument('--csv', default=None)
+    args = parser.parse_args()
+
+    probes = probe_images(20)
+    results = []
+    print(f"{'matcher':<12}{'backend':<8}{'users':>9}{'populate s':>12}{'cold ms':>10}"
+          f"{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'hit rate':>10}")
+
+    for size in args.sizes:
+        for matcher in args.matchers:
+            # The simple-AI matcher has no pluggable backend
+            for backend in (args.backend if matcher != 'simple_ai' else ['exact']):
+                workdir = tempfile.mkdtemp(prefix=f'matcher-{matcher}-{size}-', dir=args.workdir)
+                try:
+                    populate_seconds, (cold_ms, latencies, hit_rate) = BENCHES[matcher](
+                        workdir, size, backend, probes, args)
+                except ImportError as e:
+                    print(f"{matcher:<12}{backend:<8}{size:>9}  skipped: {e}")
+                    continue
+                finally:
+                    connection_pool.close_all_pools()
+                    shutil.rmtree(workdir, ignore_errors=True)
+
+                row = {
+                    'matcher': matcher, 'backend': backend, 'users': size,
+                    'populate_seconds': round(populate_seconds, 3), 'cold_ms': round(cold_ms, 3),
+                    'queries': len(latencies),
+                    'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+                    'p95_ms': round(float(np.percentile(latencies, 95)), 4),
+                    'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+                    'mean_ms': round(float(latencies.mean()), 4),
+                    'hit_rate': round(hit_rate, 3),
+                }
+                results.append(row)
+                print(f"{matcher:<12}{backend:<8}{size:>9}{row['populate_seconds']:>12.1f}{row['cold_ms']:>10.1f}"
+                      f"{row['queries']:>6}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+                      f"{row['hit_rate']:>10.2f}")
+
+    report = {
+        'revision': git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.csv and results:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    print(f"\nWrote {args.output}" + (f" and {args.csv}" if args.csv else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
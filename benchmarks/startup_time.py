@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Cold-start report for the app entry points.
+
+Each entry point is imported in a fresh interpreter (best of --repeat),
+then serves the password-only pages through the Flask test client. The
+report shows the import time, each page's first-request time, which
+parts of the vision stack (cv2, face_recognition/dlib, PIL, numpy) were
+loaded by then, and the slowest imports it makes directly, from one
+`python -X importtime` run. After the lazy-import change the vision
+stack should stay unloaded until the first face request.
+
+The apps create their SQLite files in the working directory, so they
+run in a throwaway directory.
+
+Usage:
+    python benchmarks/startup_time.py [--entries app app_simple app_simple_ai app_advanced] [--repeat 5] [--top 8]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VISION_MODULES = ('cv2', 'face_recognition', 'dlib', 'PIL.Image', 'numpy')
+PAGES = (('GET', '/'), ('GET', '/register'), ('POST', '/login'))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {entry} as entry
+result = {{'import_ms': (time.perf_counter() - start) * 1000}}
+loaded = lambda: [name for name in {vision!r} if name in sys.modules]
+result['loaded_after_import'] = loaded()
+getattr(entry, 'init_db', lambda: None)()  # the entry points that have one call it under __main__
+client = entry.app.test_client()
+result['pages'] = []
+for method, path in {pages!r}:
+    start = time.perf_counter()
+    response = client.open(path, method=method, json={{'username': 'startup-probe', 'password': 'startup-probe'}})
+    result['pages'].append([method, path, response.status_code, (time.perf_counter() - start) * 1000])
+result['loaded_after_pages'] = loaded()
+print(json.dumps(result))
+"""
+
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_probe(entry, workdir, import_time=False):
+    command = [sys.executable]
+    if import_time:
+        command += ['-X', 'importtime']
+    command += ['-c', PROBE.format(entry=entry, vision=VISION_MODULES, pages=PAGES)]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    env['WARMUP'] = '0'  # the startup warmup loads the vision stack on purpose; measure the imports alone
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'probe failed')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, completed.stderr
+
+
+def top_imports(stderr, count):
+    """(cumulative ms, module) of the slowest imports made directly by the entry point"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and len(match.group(3)) == 3:  # nesting depth 1: imported by the entry module itself
+            rows.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', nargs='+', default=['app', 'app_simple', 'app_simple_ai', 'app_advanced'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='slowest direct imports to list per entry point')
+    args = parser.parse_args()
+
+    print(f"{'entry':<15}{'import ms':>11}  {'first request ms (status)':<48}vision stack loaded")
+    breakdowns = {}
+    for entry in args.entries:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.makedirs(os.path.join(workdir, 'database'))
+            try:
+                runs = [run_probe(entry, workdir)[0] for _ in range(args.repeat)]
+                _, stderr = run_probe(entry, workdir, import_time=True)
+            except RuntimeError as e:
+                print(f"{entry:<15}failed: {e}")
+                continue
+
+        best = min(runs, key=lambda run: run['import_ms'])
+        pages = '  '.join(f"{path} {ms:.0f} ({status})" for _, path, status, ms in best['pages'])
+        loaded = ', '.join(best['loaded_after_pages']) or 'none'
+        print(f"{entry:<15}{best['import_ms']:>11.0f}  {pages:<48}{loaded}")
+        breakdowns[entry] = top_imports(stderr, args.top)
+
+    for entry, rows in breakdowns.items():
+        print()
+        print(f"{entry}: slowest direct imports (cumulative ms, -X importtime)")
+        for ms, module in rows:
+            print(f"  {ms:>8.1f}  {module}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
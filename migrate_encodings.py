@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Offline migration of pickled face encodings to the compact binary format.
+
+Converts users.face_encoding BLOBs written with pickle.dumps into the
+513-byte versioned float32 format from models/encoding_codec.py. Rows are
+streamed in id order in bounded batches, each committed on its own, so
+memory use stays flat and the migration can be interrupted and re-run.
+
+Usage:
+    python migrate_encodings.py [database ...] [--batch-size 1000] [--vacuum]
+
+With no arguments both database/users.db and face_login_advanced.db are
+migrated. Stop the apps first, and rebuild any gallery snapshots after.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from models.encoding_codec import decode_encoding, encode_encoding, is_legacy_blob
+
+DEFAULT_DATABASES = ['database/users.db', 'face_login_advanced.db']
+
+
+def migrate_database(db_path, batch_size=1000, vacuum=False):
+    """Convert every legacy encoding in db_path; returns (converted, skipped)"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    converted = 0
+    skipped = 0
+    last_id = 0
+    while True:
+        cursor.execute('''
+            SELECT id, face_encoding FROM users
+            WHERE face_encoding IS NOT NULL AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for user_id, blob in rows:
+            if not is_legacy_blob(blob):
+                continue
+            try:
+                updates.append((encode_encoding(decode_encoding(blob)), user_id))
+            except Exception as e:
+                print(f"  Skipping user {user_id}: {e}")
+                skipped += 1
+
+        if updates:
+            cursor.executemany('UPDATE users SET face_encoding = ? WHERE id = ?', updates)
+            conn.commit()
+            converted += len(updates)
+        print(f"  ... up to id {last_id}: {converted} converted")
+
+    if vacuum and converted:
+        print("  Reclaiming space with VACUUM")
+        conn.execute('VACUUM')
+
+    conn.close()
+    return converted, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('databases', nargs='*', default=DEFAULT_DATABASES)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM each database after migrating')
+    args = parser.parse_args()
+
+    failed = False
+    for db_path in args.databases:
+        if not os.path.exists(db_path):
+            print(f"Skipping {db_path}: not found")
+            continue
+
+        print(f"Migrating {db_path}")
+        converted, skipped = migrate_database(db_path, args.batch_size, args.vacuum)
+        print(f"Done: {converted} encodings converted, {skipped} skipped")
+        failed = failed or skipped > 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
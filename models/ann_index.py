@@ -0,0 +1,468 @@
+"""
+Approximate nearest-neighbour face matching for very large galleries.
+
+IVFIndex is a pure-NumPy inverted file index: k-means centroids split the
+gallery into `nlist` cells and a query only scans the `nprobe` cells
+closest to it. With product quantization enabled (`pq_m` sub-spaces of
+256 codes each) cells are scanned over compact uint8 codes and only a
+shortlist is re-ranked against the stored float32 encodings.
+
+The final decision is always made with the exact distance, against the
+same tolerance as face_recognition.compare_faces. The search itself is
+approximate, though: when the true nearest user's cell is not probed the
+index can miss the match, or return a different enrolled user who is also
+within tolerance. Raising nprobe trades latency for recall. IVFIndex exposes
+the same add_many / match / load_base / live_rows / index_state methods
+as FaceGallery and can be used wherever a gallery is expected. Its
+trained state is saved with gallery snapshots, so workers start without
+retraining.
+
+The apps pick the matcher with FACE_MATCHER=exact|ivf and tune the IVF
+index with FACE_MATCHER_NLIST, FACE_MATCHER_NPROBE, FACE_MATCHER_PQ_M,
+FACE_MATCHER_RERANK and FACE_MATCHER_MIN_TRAIN_SIZE (see
+create_gallery_from_env).
+"""
+
+import os
+import threading
+import numpy as np
+
+from models.face_gallery import ENCODING_SIZE, FaceGallery
+
+PQ_CODES = 256
+
+
+def _squared_distances(data, centroids):
+    """Squared distances between every row of data and every centroid"""
+    data_norms = np.einsum('ij,ij->i', data, data)[:, None]
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    return data_norms - 2.0 * (data @ centroids.T) + centroid_norms
+
+
+def _nearest(data, centroids, chunk_size=65536):
+    """Index of the nearest centroid for each row, computed in bounded-memory chunks"""
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmin(_squared_distances(chunk, centroids), axis=1)
+    return labels
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means; returns float32 centroids of shape (k, dim)"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _nearest(data, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        filled = counts > 0
+        sums = np.add.reduceat(data[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled][:, None]
+
+        # Re-seed empty cells from random points so every list stays usable
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), size=len(empty), replace=False)]
+
+    return centroids
+
+
+class ProductQuantizer:
+    """Splits encodings into m sub-vectors and encodes each as one byte"""
+
+    def __init__(self, m=8):
+        if ENCODING_SIZE % m:
+            raise ValueError(f"pq_m must divide {ENCODING_SIZE}")
+        self.m = m
+        self.sub_size = ENCODING_SIZE // m
+        self.codebooks = None  # (m, 256, sub_size)
+
+    def train(self, data, iterations=10, seed=0):
+        """Learn one 256-entry codebook per sub-space"""
+        data = np.asarray(data, dtype=np.float32)
+        self.codebooks = np.stack([
+            kmeans(data[:, j * self.sub_size:(j + 1) * self.sub_size], PQ_CODES, iterations, seed + j)
+            for j in range(self.m)
+        ])
+
+    def encode(self, data):
+        """Encode rows as (n, m) uint8 codes"""
+        data = np.asarray(data, dtype=np.float32)
+        codes = np.empty((len(data), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = data[:, j * self.sub_size:(j + 1) * self.sub_size]
+            codes[:, j] = _nearest(sub, self.codebooks[j])
+        return codes
+
+    def lookup_table(self, query):
+        """Squared distances from each query sub-vector to each code, shape (m, 256)"""
+        sub_queries = query.reshape(self.m, 1, self.sub_size)
+        return np.sum((self.codebooks - sub_queries) ** 2, axis=2)
+
+    def approximate_distances(self, table, codes):
+        """Approximate squared distances for a block of codes"""
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+
+class _InvertedList:
+    """Growable arrays holding one IVF cell"""
+
+    def __init__(self, capacity=16, pq_m=None):
+        self.count = 0
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        self.norms = np.empty(capacity, dtype=np.float32)
+        self.codes = np.empty((capacity, pq_m), dtype=np.uint8) if pq_m else None
+
+    @classmethod
+    def over(cls, ids, vectors, norms, codes=None):
+        """A full list over existing arrays, e.g. slices of a memory-mapped snapshot
+
+        The arrays are only read until the first append, which grows the
+        list into fresh memory. Norms must be writable for tombstoning.
+        """
+        inverted = cls(capacity=0)
+        inverted.ids, inverted.vectors, inverted.norms, inverted.codes = ids, vectors, norms, codes
+        inverted.count = len(ids)
+        return inverted
+
+    def compact(self):
+        """Drop tombstoned rows; returns how many were removed"""
+        live = np.isfinite(self.norms[:self.count])
+        removed = self.count - int(live.sum())
+        if removed:
+            self.ids = self.ids[:self.count][live]
+            self.vectors = self.vectors[:self.count][live]
+            self.norms = self.norms[:self.count][live]
+            if self.codes is not None:
+                self.codes = self.codes[:self.count][live]
+            self.count = len(self.ids)
+        return removed
+
+    def append(self, ids, vectors, norms, codes=None):
+        needed = self.count + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, len(self.ids) * 2)
+            self.ids = np.resize(self.ids, capacity)
+            self.vectors = np.resize(self.vectors, (capacity, ENCODING_SIZE))
+            self.norms = np.resize(self.norms, capacity)
+            if self.codes is not None:
+                self.codes = np.resize(self.codes, (capacity, self.codes.shape[1]))
+
+        start, end = self.count, needed
+        self.ids[start:end] = ids
+        self.vectors[start:end] = vectors
+        self.norms[start:end] = norms
+        if self.codes is not None:
+            self.codes[start:end] = codes
+        self.count = end
+
+
+class IVFIndex:
+    """Inverted file index with optional product quantization"""
+
+    def __init__(self, nlist=None, nprobe=8, pq_m=None, rerank=64, min_train_size=10000,
+                 kmeans_iterations=10, train_sample_size=100000, seed=0,
+                 max_tombstone_fraction=0.2, retrain_growth=4.0):
+        self.nlist = nlist              # None picks ~sqrt(N) cells at training time
+        self.nprobe = nprobe            # Cells scanned per query: higher means better recall, slower
+        self.pq_m = pq_m                # None stores and scans exact float32 vectors only
+        self.rerank = rerank            # Shortlist size re-ranked exactly when PQ is on
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample_size = train_sample_size
+        self.seed = seed
+        self.max_tombstone_fraction = max_tombstone_fraction  # Compact once this share of rows is replaced
+        self.retrain_growth = retrain_growth  # Retrain once live rows reach this multiple of the trained size; None never
+
+        self._lock = threading.RLock()
+        self._staging = FaceGallery()   # Exact storage until there is enough data to train
+        self.centroids = None
+        self.quantizer = None
+        self.lists = []
+        self.high_water = 0
+        self._trained_size = 0
+        self._tombstones = 0
+
+    def __len__(self):
+        with self._lock:
+            if self.centroids is None:
+                return len(self._staging)
+            return sum(inverted.count for inverted in self.lists)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, data):
+        """Learn the coarse centroids (and PQ codebooks) and redistribute stored rows"""
+        with self._lock:
+            ids, matrix, _ = self.live_rows()
+            data = np.asarray(data, dtype=np.float32)
+            rng = np.random.default_rng(self.seed)
+            if len(data) > self.train_sample_size:
+                data = data[rng.choice(len(data), size=self.train_sample_size, replace=False)]
+
+            nlist = self.nlist or max(1, int(np.sqrt(max(len(ids), len(data)))))
+            self.centroids = kmeans(data, nlist, self.kmeans_iterations, self.seed)
+            if self.pq_m:
+                self.quantizer = ProductQuantizer(self.pq_m)
+                self.quantizer.train(data, self.kmeans_iterations, self.seed)
+
+            self.lists = [_InvertedList(pq_m=self.pq_m) for _ in range(len(self.centroids))]
+            self._staging.clear()
+            self._insert(ids, matrix)
+            self._trained_size = len(ids)
+            self._tombstones = 0
+
+    def _insert(self, ids, matrix):
+        """Assign rows to their nearest cells"""
+        if len(ids) == 0:
+            return
+        matrix = np.asarray(matrix, dtype=np.float32)
+        labels = _nearest(matrix, self.centroids)
+        norms = np.einsum('ij,ij->i', matrix, matrix)
+        codes = self.quantizer.encode(matrix) if self.quantizer else None
+
+        order = np.argsort(labels, kind='stable')
+        boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+        for group in np.split(order, boundaries):
+            self.lists[labels[group[0]]].append(
+                ids[group], matrix[group], norms[group], codes[group] if codes is not None else None)
+
+    def load_base(self, ids, matrix, norms, high_water, state=None):
+        """Build the index from a snapshot's arrays
+
+        With the trained state saved by index_state() the cells are
+        slices of the given (memory-mapped) arrays and nothing is
+        retrained. Without it, small galleries are mapped as exact
+        staging and larger ones are trained once.
+        """
+        with self._lock:
+            self._staging = FaceGallery()
+            self.centroids = None
+            self.quantizer = None
+            self.lists = []
+            self.high_water = 0
+            self._trained_size = 0
+            self._tombstones = 0
+
+            if self._accepts(state, len(ids)):
+                self._load_trained(ids, matrix, norms, state)
+                self.high_water = int(high_water)
+            elif len(ids) < self.min_train_size:
+                self._staging.load_base(ids, matrix, norms, high_water)
+                self.high_water = int(high_water)
+            else:
+                self.add_many(np.asarray(ids), np.asarray(matrix), high_water=high_water)
+
+    def _accepts(self, state, count):
+        """Whether a saved trained state matches this index's configuration and rows"""
+        if not state or state.get('kind') != 'ivf' or state.get('pq_m') != self.pq_m:
+            return False
+        arrays = state['arrays']
+        if len(arrays['ivf_labels']) != count or (self.pq_m and len(arrays['pq_codes']) != count):
+            return False
+        return self.nlist is None or self.nlist == len(arrays['ivf_centroids'])
+
+    def _load_trained(self, ids, matrix, norms, state):
+        arrays = state['arrays']
+        self.centroids = np.asarray(arrays['ivf_centroids'], dtype=np.float32)
+        if self.pq_m:
+            self.quantizer = ProductQuantizer(self.pq_m)
+            self.quantizer.codebooks = np.asarray(arrays['pq_codebooks'], dtype=np.float32)
+        labels = np.asarray(arrays['ivf_labels'])
+        codes = arrays.get('pq_codes')
+        # Norms are copied so replaced rows can be tombstoned without touching the snapshot
+        norms = np.array(norms, dtype=np.float32)
+
+        if np.any(labels[1:] < labels[:-1]):
+            # Not grouped by cell (not written by index_state): group in memory
+            order = np.argsort(labels, kind='stable')
+            ids, matrix, norms, labels = ids[order], matrix[order], norms[order], labels[order]
+            codes = codes[order] if codes is not None else None
+
+        bounds = np.searchsorted(labels, np.arange(len(self.centroids) + 1))
+        self.lists = [_InvertedList.over(ids[start:end], matrix[start:end], norms[start:end],
+                                         codes[start:end] if codes is not None else None)
+                      for start, end in zip(bounds[:-1], bounds[1:])]
+        self._trained_size = len(ids)
+        self._tombstones = int(np.count_nonzero(~np.isfinite(norms)))
+
+    def index_state(self):
+        """(ids, matrix, state) for a snapshot that reloads without retraining
+
+        Rows are grouped by cell and `state` holds the centroids, PQ
+        codebooks and codes, and each row's cell; it is None while the
+        index is untrained.
+        """
+        with self._lock:
+            if self.centroids is None:
+                return self._staging.index_state()
+            parts = []
+            for cell, inverted in enumerate(self.lists):
+                live = np.isfinite(inverted.norms[:inverted.count])
+                parts.append((inverted.ids[:inverted.count][live], inverted.vectors[:inverted.count][live],
+                              np.full(int(live.sum()), cell, dtype=np.int32),
+                              inverted.codes[:inverted.count][live] if self.quantizer else None))
+            arrays = {
+                'ivf_centroids': self.centroids,
+                'ivf_labels': np.concatenate([part[2] for part in parts]),
+            }
+            if self.quantizer:
+                arrays['pq_codebooks'] = self.quantizer.codebooks
+                arrays['pq_codes'] = np.concatenate([part[3] for part in parts])
+            ids = np.concatenate([part[0] for part in parts])
+            matrix = np.concatenate([part[1] for part in parts])
+        return ids, matrix, {'kind': 'ivf', 'pq_m': self.pq_m, 'arrays': arrays}
+
+    def add_many(self, user_ids, encodings, high_water=None):
+        """Add or replace encodings; trains automatically once min_train_size rows exist"""
+        if len(user_ids) == 0:
+            if high_water is not None:
+                self.high_water = max(self.high_water, int(high_water))
+            return
+
+        new_ids = np.asarray(user_ids, dtype=np.int64)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            if self.centroids is None:
+                self._staging.add_many(new_ids, block, high_water=high_water)
+                self.high_water = self._staging.high_water
+                if len(self._staging) >= self.min_train_size:
+                    self.train(self._staging.live_rows()[1])
+                return
+
+            for inverted in self.lists:
+                if inverted.count:
+                    norms = inverted.norms[:inverted.count]
+                    replaced = np.isin(inverted.ids[:inverted.count], new_ids) & np.isfinite(norms)
+                    norms[replaced] = np.inf
+                    self._tombstones += int(replaced.sum())
+            self._insert(new_ids, block)
+            if high_water is None:
+                high_water = int(new_ids.max())
+            self.high_water = max(self.high_water, int(high_water))
+            self._maintain()
+
+    def _maintain(self):
+        """Retrain once the gallery outgrew its cells; compact once too many rows are tombstoned"""
+        total = sum(inverted.count for inverted in self.lists)
+        live = total - self._tombstones
+        if self.retrain_growth and live >= self.retrain_growth * max(self._trained_size, self.min_train_size):
+            self.train(self.live_rows()[1])
+        elif self._tombstones > self.max_tombstone_fraction * total:
+            for inverted in self.lists:
+                inverted.compact()
+            self._tombstones = 0
+
+    def add(self, user_id, encoding, high_water=None):
+        """Add or replace a single user's encoding"""
+        self.add_many([user_id], [encoding], high_water=high_water)
+
+    catch_up = FaceGallery.catch_up
+
+    def live_rows(self):
+        """Return (ids, matrix, norms) for rows that have not been replaced"""
+        with self._lock:
+            if self.centroids is None:
+                return self._staging.live_rows()
+            filled = [inverted for inverted in self.lists if inverted.count]
+            if not filled:
+                return self._staging.live_rows()
+            ids = np.concatenate([inverted.ids[:inverted.count] for inverted in filled])
+            matrix = np.concatenate([inverted.vectors[:inverted.count] for inverted in filled])
+            norms = np.concatenate([inverted.norms[:inverted.count] for inverted in filled])
+        live = np.isfinite(norms)
+        return ids[live], matrix[live], norms[live]
+
+    def _shortlist(self, query, nprobe):
+        """Return (ids, vectors, squared distances) of candidates from the probed cells"""
+        centroid_distances = _squared_distances(query[None, :], self.centroids)[0]
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        cells = [self.lists[cell] for cell in probed if self.lists[cell].count]
+        if not cells:
+            return None
+
+        ids = np.concatenate([cell.ids[:cell.count] for cell in cells])
+        norms = np.concatenate([cell.norms[:cell.count] for cell in cells])
+
+        if self.quantizer is not None and len(ids) > self.rerank:
+            # Score the probed cells on PQ codes, then fetch vectors only for the shortlist
+            codes = np.concatenate([cell.codes[:cell.count] for cell in cells])
+            table = self.quantizer.lookup_table(query)
+            approximate = self.quantizer.approximate_distances(table, codes)
+            approximate[~np.isfinite(norms)] = np.inf
+            keep = np.sort(np.argpartition(approximate, self.rerank - 1)[:self.rerank])
+
+            offsets = np.cumsum([0] + [cell.count for cell in cells])
+            owners = np.searchsorted(offsets, keep, side='right') - 1
+            vectors = np.stack([cells[owner].vectors[row - offsets[owner]] for owner, row in zip(owners, keep)])
+            ids, norms = ids[keep], norms[keep]
+        else:
+            vectors = np.concatenate([cell.vectors[:cell.count] for cell in cells])
+
+        squared = norms - 2.0 * (vectors @ query) + np.dot(query, query)
+        return ids, vectors, squared
+
+    def match(self, face_encoding, tolerance=0.6, nprobe=None):
+        """Return (user_id, distance) of the closest candidate within tolerance, or None"""
+        query = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            if self.centroids is None:
+                return self._staging.match(face_encoding, tolerance=tolerance)
+
+            shortlist = self._shortlist(query, nprobe or self.nprobe)
+            if shortlist is None:
+                return None
+            ids, vectors, squared = shortlist
+            best = int(np.argmin(squared))
+            if not np.isfinite(squared[best]):
+                return None
+            user_id, stored = int(ids[best]), vectors[best]
+
+        # Exact re-check of the winner against the tolerance, as in FaceGallery.match
+        distance = float(np.linalg.norm(stored.astype(np.float64) - np.asarray(face_encoding, dtype=np.float64)))
+        if distance <= tolerance:
+            return user_id, distance
+        return None
+
+    def match_many(self, face_encodings, tolerance=0.6, nprobe=None):
+        """Match a batch of queries; probed cells differ per query, so this loops"""
+        with self._lock:
+            if self.centroids is None:
+                return self._staging.match_many(face_encodings, tolerance=tolerance)
+        return [self.match(encoding, tolerance=tolerance, nprobe=nprobe) for encoding in face_encodings]
+
+
+def create_gallery(backend='exact', **options):
+    """Create a matcher backend: 'exact' (FaceGallery) or 'ivf' (IVFIndex)"""
+    if backend == 'exact':
+        return FaceGallery(**options)
+    if backend == 'ivf':
+        return IVFIndex(**options)
+    raise ValueError(f"Unknown face matcher backend: {backend}")
+
+
+# IVFIndex options that can be set as FACE_MATCHER_<NAME> environment variables
+IVF_ENV_OPTIONS = ('nlist', 'nprobe', 'pq_m', 'rerank', 'min_train_size')
+
+
+def create_gallery_from_env(environ=None):
+    """create_gallery() for the FACE_MATCHER backend, tuned by its FACE_MATCHER_* variables"""
+    environ = os.environ if environ is None else environ
+    backend = environ.get('FACE_MATCHER', 'exact')
+    options = {}
+    if backend == 'ivf':
+        for name in IVF_ENV_OPTIONS:
+            value = environ.get(f'FACE_MATCHER_{name.upper()}')
+            if value:
+                options[name] = int(value)
+    return create_gallery(backend, **options)
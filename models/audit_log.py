@@ -0,0 +1,212 @@
+"""
+Asynchronous, batched writer for login_attempts rows.
+
+Request threads hand rows to AuditLogWriter.submit(), which only puts
+them on a bounded in-memory queue. A background thread drains the queue
+and writes rows with executemany in a single transaction, either once
+`batch_size` rows are waiting or every `flush_interval_ms`, whichever
+comes first. Pending rows are flushed on close() and at interpreter exit.
+
+When the queue is full, `overflow='block'` waits up to `block_timeout`
+seconds for space before dropping the row, and `overflow='drop'` drops it
+straight away. Either way the request thread is never stalled for long
+by audit logging.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+# Imported first so its atexit hook runs after ours: writers flush before pools close
+from models import connection_pool  # noqa: F401
+from models import metrics
+
+_writers = []
+_writers_lock = threading.Lock()
+
+
+def utc_timestamp():
+    """Current UTC time in the format SQLite's CURRENT_TIMESTAMP uses"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class AuditLogWriter:
+    """Background sink that batches INSERTs into one table"""
+
+    def __init__(self, pool, insert_sql, max_queue=10000, batch_size=200,
+                 flush_interval_ms=50, overflow='block', block_timeout=0.05):
+        if overflow not in ('block', 'drop'):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.pool = pool
+        self.insert_sql = insert_sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+        with _writers_lock:
+            _writers.append(self)
+
+    def _ensure_thread(self):
+        """Start the writer thread, again in a forked child if needed"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """Queue one row of INSERT parameters; returns False if it was dropped"""
+        if self._closed:
+            self._count('dropped')
+            return False
+
+        self._ensure_thread()
+        try:
+            if self.overflow == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('queued')
+        return True
+
+    def _count(self, counter, amount=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _collect(self):
+        """Wait for the next batch: up to batch_size rows or one flush interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Insert a batch in one transaction"""
+        try:
+            with BATCH_SECONDS.time():
+                conn = self.pool.connect()
+                try:
+                    conn.executemany(self.insert_sql, batch)
+                    conn.commit()
+                finally:
+                    conn.close()
+            self._count('flushed', len(batch))
+            self._count('batches')
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"Error writing {len(batch)} audit log rows: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while not (self._closed and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _drain(self):
+        """Write everything still queued from the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def flush(self, timeout=5.0):
+        """Block until every row queued so far has been written"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._drain()
+            return
+
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def close(self, timeout=5.0):
+        """Stop accepting rows, flush what is queued and stop the thread"""
+        self._closed = True
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            thread.join(timeout)
+        self._drain()
+
+    def stats(self):
+        """Counters for queued, flushed and dropped rows"""
+        return {
+            'queued': self.queued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'pending': self._queue.qsize(),
+        }
+
+
+def close_all_writers():
+    """Flush and stop every writer; registered to run at interpreter exit"""
+    with _writers_lock:
+        writers = list(_writers)
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_all_writers)
+
+
+BATCH_SECONDS = metrics.histogram('audit_log_batch_seconds', 'Time to write one batch of audit rows')
+
+
+def _row_counts():
+    """Audit rows by state, summed per database across writers"""
+    with _writers_lock:
+        writers = list(_writers)
+    counts = {}
+    for writer in writers:
+        for state in ('queued', 'flushed', 'dropped', 'failed'):
+            key = (writer.pool.db_path, state)
+            counts[key] = counts.get(key, 0) + getattr(writer, state)
+    return counts
+
+
+metrics.callback('audit_log_rows_total', 'Audit log rows by state', _row_counts, ('db', 'state'), kind='counter')
@@ -0,0 +1,288 @@
+"""
+Pooled, tuned SQLite connections.
+
+Every pool connection is opened once with a memory-mapped I/O window, a
+larger page cache and a prepared-statement cache, then reused across
+requests and threads. WAL journaling (with synchronous=NORMAL) is
+opt-in through SQLITE_JOURNAL_MODE=WAL: the journal mode is stored in
+the database file itself, so enabling it converts the file for good.
+
+pool.connect() hands out a PooledConnection: it behaves like a
+sqlite3.Connection, but close() returns it to the pool (rolling back
+anything left uncommitted, as a real close would) instead of closing it.
+Existing `conn = ...; ...; conn.close()` code therefore keeps working
+unchanged.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from models import metrics
+
+DEFAULT_PRAGMAS = {
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,  # Negative means KiB, so ~16MB of page cache
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# Persistent per database file, so never switched on implicitly (e.g. for the repo's tracked DBs)
+JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE')
+if JOURNAL_MODE:
+    DEFAULT_PRAGMAS['journal_mode'] = JOURNAL_MODE
+    if JOURNAL_MODE.upper() == 'WAL':
+        # Durable across application crashes in WAL mode; only an OS crash can lose the last commits
+        DEFAULT_PRAGMAS['synchronous'] = 'NORMAL'
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within the timeout"""
+
+
+class PooledConnection:
+    """Proxy around a pooled sqlite3.Connection whose close() releases it"""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a released connection")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._connection is not None:
+            if exc_type is None:
+                self._connection.commit()
+        self.close()
+
+    def close(self):
+        """Return the connection to the pool"""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.release(connection)
+
+    def __del__(self):
+        # A handler that raised before close() must not leak its connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded pool of tuned SQLite connections to one database file"""
+
+    def __init__(self, db_path, max_size=8, timeout=10.0, pragmas=None,
+                 cached_statements=256, health_check_interval=30.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self.health_check_interval = health_check_interval
+
+        self._condition = threading.Condition(threading.RLock())
+        self._idle = []  # Stack of (connection, last_used); LIFO keeps hot statement caches in use
+        self._open = 0
+        self._closed = False
+
+        self.created = 0
+        self.discarded = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _create(self):
+        """Open and configure a new connection"""
+        connection = sqlite3.connect(self.db_path, check_same_thread=False,
+                                     cached_statements=self.cached_statements,
+                                     timeout=self.pragmas['busy_timeout'] / 1000.0)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        with self._condition:
+            self.created += 1
+        return connection
+
+    def _is_healthy(self, connection):
+        """Cheap liveness probe for a connection that sat idle for a while"""
+        try:
+            connection.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+        with self._condition:
+            self._open -= 1
+            self.discarded += 1
+            self._condition.notify()
+
+    def acquire(self):
+        """Take a raw connection from the pool, opening one if allowed"""
+        start = time.perf_counter()
+        waited = False
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError(f"Connection pool for {self.db_path} is closed")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    connection, last_used = None, None
+                    break
+
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._open >= self.max_size:
+                        raise PoolExhaustedError(
+                            f"No free connection to {self.db_path} after {self.timeout}s")
+
+            self.acquired += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start
+
+        if connection is None:
+            try:
+                return self._create()
+            except Exception:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(connection):
+            self._discard(connection)
+            return self.acquire()
+        return connection
+
+    def release(self, connection):
+        """Give a raw connection back to the pool"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            self._discard(connection)
+            return
+
+        with self._condition:
+            if self._closed:
+                self._open -= 1
+                connection.close()
+                return
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def connect(self):
+        """Drop-in replacement for sqlite3.connect(db_path)"""
+        return PooledConnection(self, self.acquire())
+
+    def prime(self, count=None):
+        """Open up to count connections ahead of traffic; returns how many are idle afterwards"""
+        count = min(count or self.max_size, self.max_size)
+        connections = []
+        try:
+            # Holding them all at once forces new connections instead of reusing one
+            for _ in range(count):
+                connection = self.acquire()
+                connection.execute('SELECT 1').fetchone()
+                connections.append(connection)
+        finally:
+            for connection in connections:
+                self.release(connection)
+        with self._condition:
+            return len(self._idle)
+
+    def close(self):
+        """Close idle connections and refuse new checkouts; busy ones close on release"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            connection.close()
+
+    def stats(self):
+        """Counters describing pool usage"""
+        with self._condition:
+            return {
+                'db_path': self.db_path,
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'created': self.created,
+                'discarded': self.discarded,
+                'acquired': self.acquired,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+            }
+
+
+def get_pool(db_path, **options):
+    """Return the shared pool for db_path, creating it on first use"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(db_path, **options)
+            _pools[db_path] = pool
+        return pool
+
+
+def connect(db_path):
+    """Pooled equivalent of sqlite3.connect(db_path)"""
+    return get_pool(db_path).connect()
+
+
+def close_all_pools():
+    """Close every shared pool; registered to run at interpreter exit"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
+
+
+def _pool_stat(*fields):
+    """Scrape-time reader of one stats() field per shared pool, labelled by db (and state)"""
+    def collect():
+        with _pools_lock:
+            pools = list(_pools.values())
+        values = {}
+        for pool in pools:
+            stats = pool.stats()
+            for field in fields:
+                key = (pool.db_path, field) if len(fields) > 1 else (pool.db_path,)
+                values[key] = stats[field]
+        return values
+    return collect
+
+
+metrics.callback('db_pool_wait_seconds_total', 'Time spent waiting for a free pooled connection',
+                 _pool_stat('wait_seconds'), ('db',), kind='counter')
+metrics.callback('db_pool_waits_total', 'Connection checkouts that had to wait',
+                 _pool_stat('waits'), ('db',), kind='counter')
+metrics.callback('db_pool_connections', 'Pooled connections by state',
+                 _pool_stat('in_use', 'idle'), ('db', 'state'))
@@ -1,17 +1,44 @@
 import sqlite3
 import hashlib
-import pickle
 import os
 from datetime import datetime
+from models import connection_pool, metrics
+from models.audit_log import AuditLogWriter, utc_timestamp
+from models.face_gallery import FaceGallery
+from models import gallery_snapshot
+from models.encoding_codec import encode_encoding, decode_encoding, decode_valid
 
 class Database:
-    def __init__(self, db_path='database/users.db'):
+    def __init__(self, db_path='database/users.db', snapshot_path=None, gallery=None):
         self.db_path = db_path
+        self.pool = connection_pool.get_pool(db_path)
+        self.audit_log = AuditLogWriter(self.pool, '''
+            INSERT INTO login_attempts (username, attempt_type, success, ip_address, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''')
+        self.snapshot_path = snapshot_path
+        # Any matcher with the FaceGallery interface, e.g. models.ann_index.IVFIndex
+        self.gallery = gallery if gallery is not None else FaceGallery()
         self.init_database()
+        
+        # Map the on-disk snapshot so only newer enrollments come from SQLite
+        if snapshot_path:
+            gallery_snapshot.load_into_gallery(self.gallery, snapshot_path)
     
     def get_connection(self):
-        """Get database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get a pooled database connection; close() returns it to the pool"""
+        return self.pool.connect()
+    
+    def prime(self, connections=4):
+        """Open pooled connections and read the users table once so its pages are cached"""
+        self.pool.prime(connections)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Summing a column reads every row without materializing the table
+        cursor.execute('SELECT COUNT(*), SUM(LENGTH(face_encoding)) FROM users')
+        users = cursor.fetchone()[0]
+        conn.close()
+        return users
     
     def init_database(self):
         """Initialize database with required tables"""
@@ -59,7 +86,7 @@ class Database:
             cursor = conn.cursor()
             
             password_hash = self.hash_password(password)
-            face_blob = pickle.dumps(face_encoding) if face_encoding is not None else None
+            face_blob = encode_encoding(face_encoding)
             
             cursor.execute('''
                 INSERT INTO users (username, password_hash, first_name, last_name, gender, face_encoding)
@@ -69,6 +96,10 @@ class Database:
             conn.commit()
             user_id = cursor.lastrowid
             conn.close()
+            
+            # Keep the in-memory gallery in sync with the new enrollment
+            if face_encoding is not None:
+                self.sync_gallery()
             return user_id
         except sqlite3.IntegrityError:
             return None  # Username already exists
@@ -103,7 +134,7 @@ class Database:
         conn.close()
         
         if result:
-            face_encoding = pickle.loads(result[5]) if result[5] else None
+            face_encoding = decode_encoding(result[5])
             return {
                 'id': result[0],
                 'username': result[1],
@@ -116,65 +147,112 @@ class Database:
             }
         return None
     
-    def get_user_by_face(self, face_encoding):
-        """Get user by face encoding (for face recognition login)"""
+    def sync_gallery(self):
+        """Load encodings enrolled since the gallery was last synced"""
+        with metrics.span('gallery_sync'):
+            self._sync_gallery()
+    
+    def _sync_gallery(self):
+        self.gallery.catch_up(self._fetch_enrolled)
+    
+    def _fetch_enrolled(self, high_water):
+        """(marks, user_ids, encodings, high_water, row_count) of encodings stored after high_water"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT id, username, first_name, last_name, gender, face_encoding, created_at, last_login
-            FROM users WHERE face_encoding IS NOT NULL
-        ''')
+            SELECT id, face_encoding FROM users
+            WHERE face_encoding IS NOT NULL AND id > ?
+            ORDER BY id
+        ''', (high_water,))
         
         results = cursor.fetchall()
         conn.close()
         
         if not results:
-            return None
+            return [], [], [], high_water, 0
+        positions, encodings = decode_valid([result[1] for result in results])
+        # Rows are marked by their user id, which is also the high-water mark
+        user_ids = [results[position][0] for position in positions]
+        return user_ids, user_ids, encodings, results[-1][0], len(results)
+    
+    def save_gallery_snapshot(self, snapshot_path=None):
+        """Write the current gallery to disk for fast startup of other workers"""
+        snapshot_path = snapshot_path or self.snapshot_path
+        self.sync_gallery()
         
-        # Compare face encodings
-        import face_recognition
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, username FROM users WHERE face_encoding IS NOT NULL')
+        usernames = dict(cursor.fetchall())
+        conn.close()
         
-        for result in results:
-            stored_encoding = pickle.loads(result[5])
-            if face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)[0]:
-                return {
-                    'id': result[0],
-                    'username': result[1],
-                    'first_name': result[2],
-                    'last_name': result[3],
-                    'gender': result[4],
-                    'face_encoding': stored_encoding,
-                    'created_at': result[6],
-                    'last_login': result[7]
-                }
-        return None
+        return gallery_snapshot.save_gallery(self.gallery, snapshot_path, usernames)
     
-    def update_last_login(self, username):
-        """Update user's last login timestamp"""
+    def get_user_by_id(self, user_id):
+        """Get user by id"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?
-        ''', (username,))
+            SELECT id, username, first_name, last_name, gender, face_encoding, created_at, last_login
+            FROM users WHERE id = ?
+        ''', (user_id,))
         
-        conn.commit()
+        result = cursor.fetchone()
         conn.close()
+        
+        if result:
+            face_encoding = decode_encoding(result[5])
+            return {
+                'id': result[0],
+                'username': result[1],
+                'first_name': result[2],
+                'last_name': result[3],
+                'gender': result[4],
+                'face_encoding': face_encoding,
+                'created_at': result[6],
+                'last_login': result[7]
+            }
+        return None
     
-    def log_login_attempt(self, username, attempt_type, success, ip_address=None):
-        """Log login attempt for security tracking"""
+    def get_user_by_face(self, face_encoding, tolerance=0.6):
+        """Get user by face encoding (for face recognition login)"""
+        # Pick up any users enrolled since the last lookup, e.g. by another worker
+        self.sync_gallery()
+        
+        with metrics.span('match'):
+            match = self.gallery.match(face_encoding, tolerance=tolerance)
+        if match is None:
+            return None
+        
+        user_id, _ = match
+        with metrics.span('user_fetch'):
+            return self.get_user_by_id(user_id)
+    
+    def match_faces(self, face_encodings, tolerance=0.6):
+        """Match a batch of face encodings in one pass; returns (user_id, distance) or None for each"""
+        self.sync_gallery()
+        with metrics.span('match'):
+            return self.gallery.match_many(face_encodings, tolerance=tolerance)
+    
+    def update_last_login(self, username):
+        """Update user's last login timestamp"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            INSERT INTO login_attempts (username, attempt_type, success, ip_address)
-            VALUES (?, ?, ?, ?)
-        ''', (username, attempt_type, success, ip_address))
+            UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?
+        ''', (username,))
         
         conn.commit()
         conn.close()
     
+    def log_login_attempt(self, username, attempt_type, success, ip_address=None):
+        """Log login attempt for security tracking (written asynchronously in batches)"""
+        with metrics.span('audit_submit'):
+            self.audit_log.submit((username, attempt_type, success, ip_address, utc_timestamp()))
+    
     def get_all_users(self):
         """Get all users (for admin purposes)"""
         conn = self.get_connection()
@@ -1,17 +1,27 @@
 import sqlite3
 import hashlib
-import pickle
 import os
 from datetime import datetime
+from models import connection_pool
+from models.audit_log import AuditLogWriter, utc_timestamp
+from models.lazy_import import lazy_import
+
+# The codec pulls in numpy; accounts without a face never load it
+encoding_codec = lazy_import('models.encoding_codec')
 
 class Database:
     def __init__(self, db_path='database/users.db'):
         self.db_path = db_path
+        self.pool = connection_pool.get_pool(db_path)
+        self.audit_log = AuditLogWriter(self.pool, '''
+            INSERT INTO login_attempts (username, attempt_type, success, ip_address, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''')
         self.init_database()
     
     def get_connection(self):
-        """Get database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get a pooled database connection; close() returns it to the pool"""
+        return self.pool.connect()
     
     def init_database(self):
         """Initialize database with required tables"""
@@ -59,7 +69,7 @@ class Database:
             cursor = conn.cursor()
             
             password_hash = self.hash_password(password)
-            face_blob = pickle.dumps(face_encoding) if face_encoding is not None else None
+            face_blob = encoding_codec.encode_encoding(face_encoding) if face_encoding is not None else None
             
             cursor.execute('''
                 INSERT INTO users (username, password_hash, first_name, last_name, gender, face_encoding)
@@ -103,7 +113,7 @@ class Database:
         conn.close()
         
         if result:
-            face_encoding = pickle.loads(result[5]) if result[5] else None
+            face_encoding = encoding_codec.decode_encoding(result[5]) if result[5] else None
             return {
                 'id': result[0],
                 'username': result[1],
@@ -129,17 +139,8 @@ class Database:
         conn.close()
     
     def log_login_attempt(self, username, attempt_type, success, ip_address=None):
-        """Log login attempt for security tracking"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO login_attempts (username, attempt_type, success, ip_address)
-            VALUES (?, ?, ?, ?)
-        ''', (username, attempt_type, success, ip_address))
-        
-        conn.commit()
-        conn.close()
+        """Log login attempt for security tracking (written asynchronously in batches)"""
+        self.audit_log.submit((username, attempt_type, success, ip_address, utc_timestamp()))
     
     def username_exists(self, username):
         """Check if username already exists"""
@@ -0,0 +1,143 @@
+"""
+Content-addressed LRU cache of frame -> face analysis results.
+
+Clients resubmit the same JPEG (double clicks, network retries, the
+FaceAuth helper retrying), and every copy used to pay for detection and
+encoding again. Results are keyed by a BLAKE2b digest of the uploaded
+bytes -- the base64 data URL or raw JPEG body, or the decoded pixels when
+only those are at hand -- plus any known face boxes, and are bounded by
+entry count, total bytes and age.
+
+Besides encodings, the deterministic failures "no face" and "multiple
+faces" are cached too, since re-running detection on the same bytes
+gives the same answer. Transient errors (busy, timeouts, decode
+failures) never are.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from models.face_recognition import analysis_outcome
+
+CACHEABLE_OUTCOMES = ('encoded', 'no_face', 'multiple_faces')
+
+# Rough per-entry bookkeeping cost on top of the encoding itself
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def frame_key(data, boxes=None, detector=None):
+    """Digest of a frame given as a data URL, raw image bytes or an image array
+
+    Known boxes and the detector backend are part of the key, since both can
+    change the result for the same pixels.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, str):
+        digest.update(b's')
+        digest.update(data.encode())
+    elif isinstance(data, np.ndarray):
+        data = np.ascontiguousarray(data)
+        digest.update(f'a{data.shape}{data.dtype.str}'.encode())
+        digest.update(memoryview(data).cast('B'))
+    else:
+        digest.update(b'b')
+        digest.update(data)
+    if boxes is not None:
+        digest.update(repr([tuple(int(value) for value in box) for box in boxes]).encode())
+    if detector is not None:
+        digest.update(f'd{detector}'.encode())
+    return digest.digest()
+
+
+class EncodingCache:
+    """Thread-safe LRU of (encoding, error, face_box) results with TTL and byte limit"""
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached result for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, result):
+        """Store a result if its outcome is deterministic; returns whether it was stored"""
+        encoding, error, _ = result
+        if analysis_outcome(error) not in CACHEABLE_OUTCOMES:
+            return False
+
+        if encoding is not None:
+            # Shared between requests from now on
+            encoding.flags.writeable = False
+        size = ENTRY_OVERHEAD_BYTES + len(key) + (encoding.nbytes if encoding is not None else 0)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, result)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def get_or_compute(self, key, compute):
+        """Cached result for key, computing and storing it on a miss"""
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
@@ -0,0 +1,114 @@
+"""
+Compact binary storage format for face encodings.
+
+An encoded face is one version byte followed by 128 little-endian float32
+values (513 bytes), replacing ~1.2KB pickle BLOBs. Decoding is a
+zero-copy np.frombuffer view, and many rows can be decoded with a single
+frombuffer call over their concatenated bytes.
+
+Rows written by older versions hold pickled numpy arrays. They are still
+readable through a restricted unpickler that only reconstructs numpy
+arrays (whatever pickle protocol wrote them), until migrate_encodings.py
+has converted the database.
+"""
+
+import io
+import pickle
+import numpy as np
+
+from models.face_gallery import ENCODING_SIZE
+
+ENCODING_FORMAT_VERSION = 1
+ENCODING_DTYPE = np.dtype('<f4')
+ENCODED_SIZE = 1 + ENCODING_SIZE * ENCODING_DTYPE.itemsize
+
+PICKLE_PROTOCOL_PREFIX = 0x80
+# Protocols 0 and 1 have no prefix; a pickled array starts with a GLOBAL opcode for numpy
+TEXT_PICKLE_PREFIX = b'cnumpy'
+
+# Globals a pickled numpy array needs, across pickle protocols 0-5 and numpy 1.x and 2.x module layouts
+_LEGACY_PICKLE_GLOBALS = {
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', 'scalar'),
+    # Protocols 0-2 store the array bytes as a latin-1 string re-encoded on load
+    ('_codecs', 'encode'),
+    # Protocol 5 rebuilds arrays from a pickle buffer
+    ('numpy.core.numeric', '_frombuffer'),
+    ('numpy._core.numeric', '_frombuffer'),
+}
+
+
+class _NumpyOnlyUnpickler(pickle.Unpickler):
+    """Unpickler that refuses anything but plain numpy arrays"""
+
+    def find_class(self, module, name):
+        if (module, name) in _LEGACY_PICKLE_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Refusing to unpickle {module}.{name} from a face encoding")
+
+
+def encode_encoding(face_encoding):
+    """Serialize a 128-d face encoding to the versioned binary format"""
+    if face_encoding is None:
+        return None
+    values = np.asarray(face_encoding, dtype=ENCODING_DTYPE).reshape(ENCODING_SIZE)
+    return bytes((ENCODING_FORMAT_VERSION,)) + values.tobytes()
+
+
+def is_legacy_blob(blob):
+    """True if the blob is a pickled encoding written by an older version"""
+    return bool(blob) and (blob[0] == PICKLE_PROTOCOL_PREFIX or bytes(blob[:len(TEXT_PICKLE_PREFIX)]) == TEXT_PICKLE_PREFIX)
+
+
+def decode_encoding(blob):
+    """Deserialize a stored face encoding, returning None for empty blobs"""
+    if not blob:
+        return None
+
+    if blob[0] == ENCODING_FORMAT_VERSION and len(blob) == ENCODED_SIZE:
+        return np.frombuffer(blob, dtype=ENCODING_DTYPE, offset=1)
+
+    if is_legacy_blob(blob):
+        return np.asarray(_NumpyOnlyUnpickler(io.BytesIO(blob)).load(), dtype=ENCODING_DTYPE)
+
+    raise ValueError(f"Unsupported face encoding format (version byte {blob[0]}, {len(blob)} bytes)")
+
+
+def decode_many(blobs):
+    """Deserialize a sequence of stored encodings into an N x 128 float32 array"""
+    if not blobs:
+        return np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+
+    if all(len(blob) == ENCODED_SIZE and blob[0] == ENCODING_FORMAT_VERSION for blob in blobs):
+        # One frombuffer over the joined rows, then drop the version byte column
+        rows = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), ENCODED_SIZE)
+        return rows[:, 1:].copy().view(ENCODING_DTYPE)
+
+    return np.stack([decode_encoding(blob) for blob in blobs])
+
+
+def decode_valid(blobs):
+    """Like decode_many, but skips rows that cannot be decoded
+
+    Returns (positions, matrix) where positions are the indices into
+    `blobs` of the decoded rows.
+    """
+    try:
+        return list(range(len(blobs))), decode_many(blobs)
+    except Exception:
+        pass
+
+    positions, encodings = [], []
+    for position, blob in enumerate(blobs):
+        try:
+            encodings.append(decode_encoding(blob))
+            positions.append(position)
+        except Exception as e:
+            print(f"Error decoding stored face encoding: {e}")
+    if not encodings:
+        return [], np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+    return positions, np.stack(encodings)
@@ -0,0 +1,137 @@
+"""
+Server-side store for in-progress face enrollments.
+
+Registration captures used to travel in the signed cookie session as
+lists of Python floats, growing it by ~2.5KB per capture and re-sending
+it with every request. Instead, each enrollment lives here under an
+opaque capture id -- the only thing the session keeps -- as a running
+mean and variance (Welford's algorithm) in float32, so adding a capture
+and reading the final template are both O(1) regardless of how many
+frames were captured.
+
+Enrollments that are not completed within the TTL expire; the store is
+per process, so multi-process deployments need sticky sessions (or a
+single worker) for registration.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from models.face_gallery import ENCODING_SIZE
+
+
+class Enrollment:
+    """Running statistics of the captures of one registration"""
+
+    __slots__ = ('count', 'mean', 'm2', 'completed', 'touched')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros(ENCODING_SIZE, dtype=np.float32)
+        self.m2 = np.zeros(ENCODING_SIZE, dtype=np.float32)
+        self.completed = False
+        self.touched = time.monotonic()
+
+    def add(self, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32)
+        self.count += 1
+        delta = encoding - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (encoding - self.mean)
+
+    @property
+    def variance(self):
+        """Per-dimension sample variance of the captures (zeros until there are two)"""
+        if self.count < 2:
+            return np.zeros(ENCODING_SIZE, dtype=np.float32)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def spread(self):
+        """Mean per-dimension standard deviation; large values mean inconsistent captures"""
+        return float(np.sqrt(self.variance).mean())
+
+
+class EnrollmentStore:
+    """Thread-safe map of capture id -> Enrollment with idle expiry"""
+
+    def __init__(self, ttl=900.0, max_enrollments=10000):
+        self.ttl = ttl
+        self.max_enrollments = max_enrollments
+        self._enrollments = OrderedDict()  # least recently touched first
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.completed = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._enrollments)
+
+    def create(self):
+        """Start a new enrollment and return its capture id"""
+        capture_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire(time.monotonic())
+            while len(self._enrollments) >= self.max_enrollments:
+                self._enrollments.popitem(last=False)
+                self.expired += 1
+            self._enrollments[capture_id] = Enrollment()
+            self.started += 1
+        return capture_id
+
+    def get(self, capture_id):
+        """The live enrollment for capture_id, or None if unknown or expired"""
+        if not capture_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            enrollment = self._enrollments.get(capture_id)
+            if enrollment is not None:
+                enrollment.touched = now
+                self._enrollments.move_to_end(capture_id)
+            return enrollment
+
+    def add(self, capture_id, encoding):
+        """Fold one capture into an enrollment; returns the enrollment or None if it expired"""
+        enrollment = self.get(capture_id)
+        if enrollment is None:
+            return None
+        with self._lock:
+            enrollment.add(encoding)
+        return enrollment
+
+    def complete(self, capture_id):
+        """Mark an enrollment as ready for registration"""
+        enrollment = self.get(capture_id)
+        if enrollment is not None and not enrollment.completed:
+            enrollment.completed = True
+            self.completed += 1
+        return enrollment
+
+    def discard(self, capture_id):
+        with self._lock:
+            self._enrollments.pop(capture_id, None)
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        while self._enrollments:
+            capture_id, enrollment = next(iter(self._enrollments.items()))
+            if enrollment.touched > cutoff:
+                break
+            del self._enrollments[capture_id]
+            self.expired += 1
+
+    def stats(self):
+        return {
+            'active': len(self._enrollments),
+            'started': self.started,
+            'completed': self.completed,
+            'expired': self.expired,
+            'ttl': self.ttl,
+        }
@@ -0,0 +1,222 @@
+import threading
+import numpy as np
+
+ENCODING_SIZE = 128
+
+
+class FaceGallery:
+    """In-memory matrix of enrolled face encodings for vectorized matching
+
+    The gallery has two segments: an optional read-only base (usually a
+    memory-mapped snapshot shared between workers) and a growable delta
+    holding encodings added since. Both are float32 N x 128 matrices with
+    parallel id arrays.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.RLock()
+        self._base_matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._base_norms = np.empty(0, dtype=np.float32)
+        self._base_ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((initial_capacity, ENCODING_SIZE), dtype=np.float32)
+        self._norms = np.empty(initial_capacity, dtype=np.float32)
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._count = 0
+        self.high_water = 0  # Largest row id loaded so far, used for catch-up queries
+
+    def __len__(self):
+        return len(self._base_ids) + self._count
+
+    def _segments(self):
+        """Yield (matrix, norms, ids) for the base and delta segments"""
+        if len(self._base_ids):
+            yield self._base_matrix, self._base_norms, self._base_ids
+        if self._count:
+            yield self._matrix[:self._count], self._norms[:self._count], self._ids[:self._count]
+
+    @property
+    def ids(self):
+        """Ids of enrolled users, parallel to the encoding matrix rows"""
+        with self._lock:
+            return np.concatenate([ids for _, _, ids in self._segments()] or [self._ids[:0]])
+
+    @property
+    def matrix(self):
+        """N x 128 float32 array of the enrolled encodings"""
+        with self._lock:
+            return np.concatenate([matrix for matrix, _, _ in self._segments()] or [self._matrix[:0]])
+
+    def live_rows(self):
+        """Return (ids, matrix, norms) for rows that have not been replaced"""
+        with self._lock:
+            segments = list(self._segments())
+            if not segments:
+                return self._ids[:0], self._matrix[:0], self._norms[:0]
+            ids = np.concatenate([s[2] for s in segments])
+            matrix = np.concatenate([s[0] for s in segments])
+            norms = np.concatenate([s[1] for s in segments])
+        live = np.isfinite(norms)
+        return ids[live], matrix[live], norms[live]
+
+    def load_base(self, ids, matrix, norms, high_water, state=None):
+        """Use the given arrays (e.g. a memory-mapped snapshot) as the base segment
+
+        `state` is a trained index's saved state; an exact gallery has none
+        and ignores it.
+        """
+        with self._lock:
+            self._base_matrix = matrix
+            # Norms are copied so replaced rows can be tombstoned without touching the snapshot
+            self._base_norms = np.array(norms, dtype=np.float32)
+            self._base_ids = ids
+            self._count = 0
+            self.high_water = int(high_water)
+
+    def index_state(self):
+        """(ids, matrix, state) to snapshot; an exact gallery has no trained state"""
+        ids, matrix, _ = self.live_rows()
+        return ids, matrix, None
+
+    def _reserve(self, extra):
+        """Grow the delta arrays so that `extra` more rows fit"""
+        needed = self._count + extra
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+
+        new_capacity = max(needed, capacity * 2)
+        matrix = np.empty((new_capacity, ENCODING_SIZE), dtype=np.float32)
+        norms = np.empty(new_capacity, dtype=np.float32)
+        ids = np.empty(new_capacity, dtype=np.int64)
+        matrix[:self._count] = self._matrix[:self._count]
+        norms[:self._count] = self._norms[:self._count]
+        ids[:self._count] = self._ids[:self._count]
+        self._matrix, self._norms, self._ids = matrix, norms, ids
+
+    def add(self, user_id, encoding, high_water=None):
+        """Add or replace a single user's encoding"""
+        self.add_many([user_id], [encoding], high_water=high_water)
+
+    def add_many(self, user_ids, encodings, high_water=None):
+        """Add or replace several users' encodings in one copy
+
+        `high_water` defaults to the largest id added, which suits tables
+        where encodings are only ever written on INSERT.
+        """
+        if len(user_ids) == 0:
+            if high_water is not None:
+                self.high_water = max(self.high_water, int(high_water))
+            return
+
+        new_ids = np.asarray(user_ids, dtype=np.int64)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            # Tombstone earlier encodings of the same users; an infinite norm never wins argmin
+            for _, norms, ids in self._segments():
+                norms[np.isin(ids, new_ids)] = np.inf
+
+            self._reserve(len(block))
+            start, end = self._count, self._count + len(block)
+            self._matrix[start:end] = block
+            self._norms[start:end] = np.einsum('ij,ij->i', block, block)
+            self._ids[start:end] = new_ids
+            self._count = end
+            if high_water is None:
+                high_water = int(new_ids.max())
+            self.high_water = max(self.high_water, int(high_water))
+
+    def catch_up(self, fetch):
+        """Add the rows enrolled after the high-water mark
+
+        `fetch(high_water)` returns (marks, user_ids, encodings,
+        new_high_water, row_count): the mark (row id or sequence number)
+        of each decoded row, the rows, the mark of the last row read and
+        how many rows were read. The query runs outside the lock, so
+        matches never wait on SQLite; under the lock only rows past the
+        current mark are added, so concurrent syncs never add a row twice.
+        Returns the number of rows fetched.
+        """
+        marks, user_ids, encodings, high_water, row_count = fetch(self.high_water)
+        if not row_count:
+            return 0
+
+        marks = np.asarray(marks, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            fresh = marks > self.high_water
+            self.add_many(user_ids[fresh], block[fresh], high_water=high_water)
+        return row_count
+
+    def clear(self):
+        """Remove every encoding from the gallery"""
+        with self._lock:
+            self.load_base(self._base_ids[:0], self._base_matrix[:0], self._base_norms[:0], 0)
+
+    def _closest(self, query):
+        """Return (user_id, row) of the closest encoding, or None when empty"""
+        best = None
+        best_squared = np.inf
+        query_norm = np.dot(query, query)
+        for matrix, norms, ids in self._segments():
+            # |a - q|^2 = |a|^2 - 2 a.q + |q|^2, so one mat-vec covers the whole segment
+            squared = norms - 2.0 * (matrix @ query) + query_norm
+            row = int(np.argmin(squared))
+            if squared[row] < best_squared:
+                best_squared = squared[row]
+                best = (int(ids[row]), matrix[row])
+        return best
+
+    def distances(self, face_encoding):
+        """Euclidean distance from the query to every enrolled encoding"""
+        query = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            parts = [norms - 2.0 * (matrix @ query) + np.dot(query, query)
+                     for matrix, norms, _ in self._segments()]
+        if not parts:
+            return np.empty(0, dtype=np.float32)
+        return np.sqrt(np.maximum(np.concatenate(parts), 0.0))
+
+    def match(self, face_encoding, tolerance=0.6):
+        """Return (user_id, distance) of the closest encoding within tolerance, or None"""
+        query = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            best = self._closest(query)
+        if best is None:
+            return None
+
+        # Re-check the winner in float64 so the threshold matches face_recognition.face_distance
+        user_id, stored = best
+        distance = float(np.linalg.norm(stored.astype(np.float64) - np.asarray(face_encoding, dtype=np.float64)))
+        if distance <= tolerance:
+            return user_id, distance
+        return None
+
+    def match_many(self, face_encodings, tolerance=0.6):
+        """Match a batch of queries with one matrix-matrix product per segment
+
+        Returns a list with (user_id, distance) or None for every query.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if len(queries) == 0:
+            return []
+
+        best_squared = np.full(len(queries), np.inf, dtype=np.float32)
+        best_ids = np.zeros(len(queries), dtype=np.int64)
+        best_rows = np.zeros((len(queries), ENCODING_SIZE), dtype=np.float32)
+        query_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+        with self._lock:
+            for matrix, norms, ids in self._segments():
+                squared = norms[None, :] - 2.0 * (queries @ matrix.T) + query_norms
+                rows = np.argmin(squared, axis=1)
+                candidate = squared[np.arange(len(queries)), rows]
+                better = candidate < best_squared
+                best_squared[better] = candidate[better]
+                best_ids[better] = ids[rows[better]]
+                best_rows[better] = matrix[rows[better]]
+
+        # Re-check each winner in float64, as in match()
+        distances = np.linalg.norm(best_rows.astype(np.float64) - np.asarray(face_encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE), axis=1)
+        return [(int(best_ids[i]), float(distances[i]))
+                if np.isfinite(best_squared[i]) and distances[i] <= tolerance else None
+                for i in range(len(queries))]
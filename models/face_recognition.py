@@ -1,99 +1,528 @@
-import cv2
-import face_recognition
+import abc
 import numpy as np
 import os
 import base64
-from PIL import Image
 import io
+import threading
+import time
+from models import metrics
+from models.frame_grabber import FrameGrabber
+from models.lazy_import import lazy_import
+
+# The vision stack loads on first use (or lazy_import.preload()), not at import
+cv2 = lazy_import('cv2')
+face_recognition = lazy_import('face_recognition')
+Image = lazy_import('PIL.Image')
+
+# Width the HOG detector runs at; its cost grows with pixel count, so it sees a
+# downscaled copy while encodings are still computed on the full-resolution frame
+DEFAULT_DETECTION_WIDTH = 320
+
+# Client-side face crops are FACE_CROP_SIZE pixels square and pad the face box by
+# FACE_CROP_MARGIN of its size on every side, so the box inside a crop is known
+FACE_CROP_SIZE = 200
+FACE_CROP_MARGIN = 0.25
+
+def face_crop_box(crop_size=FACE_CROP_SIZE, margin=FACE_CROP_MARGIN):
+    """Face box implied by the crop geometry, as (top, right, bottom, left)"""
+    pad = int(round(crop_size * margin / (1 + 2 * margin)))
+    return (pad, crop_size - pad, crop_size - pad, pad)
+
+# Frame scoring for best-frame selection: sharpness saturates at SHARPNESS_REFERENCE
+# (Laplacian variance, log scale) and face size once the face spans this much of the frame height
+SHARPNESS_REFERENCE = 500.0
+FACE_HEIGHT_REFERENCE = 0.4
+
+NO_FACE_MESSAGE = "No face detected in the image"
+MULTIPLE_FACES_MESSAGE = "Multiple faces detected. Please ensure only one face is visible"
+
+def locate_faces(image_array, detection_width=DEFAULT_DETECTION_WIDTH, model='hog'):
+    """Find face boxes with the named detector backend, in full-resolution coordinates"""
+    with metrics.span('detect'):
+        return get_detector(model, detection_width).detect(image_array)
+
+def _locate_faces(image_array, detection_width, model):
+    height, width = image_array.shape[:2]
+    if not detection_width or width <= detection_width:
+        return face_recognition.face_locations(image_array, model=model)
+    
+    scale = detection_width / width
+    small = cv2.resize(image_array, (detection_width, max(1, round(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    small_locations = face_recognition.face_locations(small, model=model)
+    
+    # Map (top, right, bottom, left) back to the original frame, clipped to its bounds
+    return [(max(0, int(round(top / scale))),
+             min(width, int(round(right / scale))),
+             min(height, int(round(bottom / scale))),
+             max(0, int(round(left / scale))))
+            for (top, right, bottom, left) in small_locations]
+
+class FaceDetector(abc.ABC):
+    """Detector backend: detect() returns (top, right, bottom, left) boxes in full-resolution coordinates"""
+    name = None
+    
+    def __init__(self, detection_width=DEFAULT_DETECTION_WIDTH):
+        self.detection_width = detection_width
+    
+    @abc.abstractmethod
+    def detect(self, image_array):
+        """Boxes of the faces in a BGR frame"""
+
+class DlibDetector(FaceDetector):
+    """face_recognition.face_locations (HOG or CNN) on a downscaled copy"""
+    
+    def __init__(self, detection_width=DEFAULT_DETECTION_WIDTH, model='hog'):
+        super().__init__(detection_width)
+        self.name = model
+        self.model = model
+    
+    def detect(self, image_array):
+        return _locate_faces(image_array, self.detection_width, self.model)
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade on a downscaled grayscale copy: fast, but more misses and false positives"""
+    name = 'haar'
+    
+    def __init__(self, detection_width=DEFAULT_DETECTION_WIDTH, scale_factor=1.1, min_neighbors=5):
+        super().__init__(detection_width)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        # CascadeClassifier is not safe to share between threads
+        self._local = threading.local()
+    
+    @property
+    def classifier(self):
+        classifier = getattr(self._local, 'classifier', None)
+        if classifier is None:
+            classifier = self._local.classifier = cv2.CascadeClassifier(haar_cascade_path())
+        return classifier
+    
+    def detect(self, image_array):
+        height, width = image_array.shape[:2]
+        scale = min(self.detection_width / width, 1.0) if self.detection_width else 1.0
+        gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY) if image_array.ndim == 3 else image_array
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = self.classifier.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors, minSize=(24, 24))
+        return [(max(0, int(y / scale)), min(width, int((x + w) / scale)),
+                 min(height, int((y + h) / scale)), max(0, int(x / scale)))
+                for (x, y, w, h) in faces]
+
+class CascadeDetector(FaceDetector):
+    """Haar rejects or localizes first; HOG confirms each candidate inside an expanded ROI
+    
+    Frames where Haar finds nothing cost only the Haar pass, and HOG runs on
+    a small crop around each candidate instead of the whole frame. Faces
+    Haar misses are missed here too; benchmarks/detector_backends.py
+    measures how often.
+    """
+    name = 'cascade'
+    
+    def __init__(self, detection_width=DEFAULT_DETECTION_WIDTH, roi_margin=0.5, roi_width=160):
+        super().__init__(detection_width)
+        self.haar = HaarDetector(detection_width)
+        self.roi_margin = roi_margin
+        self.roi_width = roi_width
+    
+    def detect(self, image_array):
+        height, width = image_array.shape[:2]
+        boxes = []
+        for top, right, bottom, left in self.haar.detect(image_array):
+            pad_y, pad_x = int((bottom - top) * self.roi_margin), int((right - left) * self.roi_margin)
+            y0, x0 = max(top - pad_y, 0), max(left - pad_x, 0)
+            roi = image_array[y0:min(bottom + pad_y, height), x0:min(right + pad_x, width)]
+            for (t, r, b, l) in _locate_faces(roi, self.roi_width, 'hog'):
+                box = (t + y0, r + x0, b + y0, l + x0)
+                # Overlapping candidates can confirm the same face twice
+                if not any(_overlaps(box, kept) for kept in boxes):
+                    boxes.append(box)
+        return boxes
+
+def _overlaps(a, b):
+    """Whether the centre of box a lies inside box b"""
+    cy, cx = (a[0] + a[2]) / 2, (a[1] + a[3]) / 2
+    return b[0] <= cy <= b[2] and b[3] <= cx <= b[1]
+
+def haar_cascade_path():
+    """Frontal face Haar cascade shipped with OpenCV"""
+    return cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+DETECTOR_BACKENDS = {
+    'hog': lambda width: DlibDetector(width, 'hog'),
+    'cnn': lambda width: DlibDetector(width, 'cnn'),
+    'haar': HaarDetector,
+    'cascade': CascadeDetector,
+}
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+def get_detector(name='hog', detection_width=DEFAULT_DETECTION_WIDTH):
+    """Shared detector instance for a backend name ('hog', 'cnn', 'haar' or 'cascade')"""
+    if isinstance(name, FaceDetector):
+        return name
+    key = (name, detection_width)
+    detector = _detectors.get(key)
+    if detector is None:
+        if name not in DETECTOR_BACKENDS:
+            raise ValueError(f"Unknown face detector '{name}'; expected one of {', '.join(DETECTOR_BACKENDS)}")
+        with _detectors_lock:
+            detector = _detectors.setdefault(key, DETECTOR_BACKENDS[name](detection_width))
+    return detector
+
+def analysis_outcome(error):
+    """Label for the face_analyses_total counter from an (encoding, error) result"""
+    if not error:
+        return 'encoded'
+    if error == NO_FACE_MESSAGE:
+        return 'no_face'
+    if error == MULTIPLE_FACES_MESSAGE:
+        return 'multiple_faces'
+    return 'failed'
+
+_UNSET = object()
+
+class FaceAnalysis:
+    """Single-pass analysis of one frame
+
+    Detection runs once and every derived result (crop, quality verdict,
+    sharpness, liveness, encoding) is computed lazily, at most once, the
+    first time it is read.
+    """
+    __slots__ = ('image', 'detection_width', 'detector', '_boxes', '_face_crop', '_quality',
+                 '_sharpness', '_liveness', '_pose', '_frame_score', '_encoding')
+    
+    def __init__(self, image_array, detection_width=DEFAULT_DETECTION_WIDTH, boxes=None, detector='hog'):
+        self.image = image_array
+        self.detection_width = detection_width
+        self.detector = detector
+        # Known boxes (e.g. from a trusted client face crop) skip detection entirely
+        self._boxes = list(boxes) if boxes is not None else _UNSET
+        self._face_crop = _UNSET
+        self._quality = _UNSET
+        self._sharpness = _UNSET
+        self._liveness = _UNSET
+        self._pose = _UNSET
+        self._frame_score = _UNSET
+        self._encoding = _UNSET
+    
+    @property
+    def boxes(self):
+        """Face boxes as (top, right, bottom, left) in full-resolution coordinates"""
+        if self._boxes is _UNSET:
+            self._boxes = locate_faces(self.image, self.detection_width, self.detector)
+        return self._boxes
+    
+    @property
+    def face_box(self):
+        """The face box when exactly one face was found, otherwise None"""
+        boxes = self.boxes
+        return boxes[0] if len(boxes) == 1 else None
+    
+    @property
+    def face_crop(self):
+        """View of the image inside the single face box, or None"""
+        if self._face_crop is _UNSET:
+            box = self.face_box
+            if box is None:
+                self._face_crop = None
+            else:
+                top, right, bottom, left = box
+                self._face_crop = self.image[top:bottom, left:right]
+        return self._face_crop
+    
+    @property
+    def quality(self):
+        """(is_valid, message) verdict on resolution, face count and face size"""
+        if self._quality is _UNSET:
+            self._quality = self._check_quality()
+        return self._quality
+    
+    def _check_quality(self):
+        # Check image dimensions
+        height, width = self.image.shape[:2]
+        if height < 100 or width < 100:
+            return False, "Image resolution too low"
+        
+        if not self.boxes:
+            return False, "No face detected"
+        
+        if len(self.boxes) > 1:
+            return False, "Multiple faces detected"
+        
+        # Check face size
+        top, right, bottom, left = self.face_box
+        face_height = bottom - top
+        face_width = right - left
+        
+        if face_height < 50 or face_width < 50:
+            return False, "Face too small in image"
+        
+        # Check if face takes reasonable portion of image
+        face_area_ratio = (face_height * face_width) / (height * width)
+        if face_area_ratio < 0.1:
+            return False, "Face too small relative to image"
+        
+        return True, "Face quality is good"
+    
+    @property
+    def sharpness(self):
+        """Laplacian variance of the face region (whole frame if there is no single face)"""
+        if self._sharpness is _UNSET:
+            region = self.face_crop if self.face_crop is not None and self.face_crop.size else self.image
+            gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else region
+            self._sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        return self._sharpness
+    
+    @property
+    def liveness(self):
+        """(is_live, message) from the sharpness of the face region"""
+        if self._liveness is _UNSET:
+            # If variance is too low, image might be blurry or a photo
+            if self.sharpness < 100:
+                self._liveness = (False, "Image appears to be blurry or not a live person")
+            else:
+                self._liveness = (True, "Liveness check passed")
+        return self._liveness
+    
+    @property
+    def pose(self):
+        """(yaw, roll) of the single face from 5-point landmarks, or None
+        
+        yaw is the nose offset from the eye midpoint in inter-eye distances
+        (0 when frontal); roll is the tilt of the eye line in degrees.
+        """
+        if self._pose is _UNSET:
+            self._pose = None
+            if self.face_box is not None:
+                landmarks = face_recognition.face_landmarks(self.image, [self.face_box], model='small')
+                if landmarks:
+                    points = landmarks[0]
+                    left_eye = np.mean(points['left_eye'], axis=0)
+                    right_eye = np.mean(points['right_eye'], axis=0)
+                    nose = np.mean(points['nose_tip'], axis=0)
+                    eye_line = right_eye - left_eye
+                    eye_distance = float(np.hypot(*eye_line)) or 1.0
+                    yaw = float(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+                    roll = float(np.degrees(np.arctan2(eye_line[1], eye_line[0])))
+                    if abs(roll) > 90:
+                        # Eye order depends on the landmark model; normalise to a small tilt
+                        roll -= 180 if roll > 0 else -180
+                    self._pose = (yaw, roll)
+        return self._pose
+    
+    @property
+    def frame_score(self):
+        """0..1 suitability for enrollment from face size, face sharpness and pose; 0 without a single face"""
+        if self._frame_score is _UNSET:
+            self._frame_score = self._score_frame()
+        return self._frame_score
+    
+    def _score_frame(self):
+        box = self.face_box
+        if box is None:
+            return 0.0
+        top, right, bottom, left = box
+        size = min((bottom - top) / (FACE_HEIGHT_REFERENCE * self.image.shape[0]), 1.0)
+        sharpness = min(np.log1p(self.sharpness) / np.log1p(SHARPNESS_REFERENCE), 1.0)
+        pose = self.pose
+        if pose is None:
+            return 0.0
+        yaw, roll = pose
+        frontal = max(0.0, 1.0 - 2 * abs(yaw)) * max(0.0, 1.0 - abs(roll) / 45)
+        return float(size * sharpness * frontal)
+    
+    @property
+    def encoding(self):
+        """(encoding, error) for the single detected face"""
+        if self._encoding is _UNSET:
+            self._encoding = self._encode()
+            metrics.FACE_ANALYSES.inc(outcome=analysis_outcome(self._encoding[1]))
+        return self._encoding
+    
+    def _encode(self):
+        if not self.boxes:
+            return None, NO_FACE_MESSAGE
+        
+        if len(self.boxes) > 1:
+            return None, MULTIPLE_FACES_MESSAGE
+        
+        # Get face encoding from the full-resolution pixels
+        with metrics.span('encode'):
+            face_encodings = face_recognition.face_encodings(self.image, self.boxes)
+        
+        if face_encodings:
+            return face_encodings[0], None
+        return None, "Could not extract face features"
 
 class FaceRecognitionSystem:
-    def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    def __init__(self, detection_width=DEFAULT_DETECTION_WIDTH, cache=None, detector='hog'):
+        self._face_cascade = None
         self.face_encodings = []
         self.face_names = []
+        self.detection_width = detection_width
+        self.detector = detector  # default backend; analyze() and extract_face() can override it per call
+        self.cache = cache  # optional EncodingCache for repeated uploads
+        self.preview_fps = 0.0
     
-    def capture_face_from_camera(self):
-        """Capture face from webcam"""
-        cap = cv2.VideoCapture(0)
+    @property
+    def face_cascade(self):
+        """Haar cascade for the live camera preview, loaded on first use"""
+        if self._face_cascade is None:
+            self._face_cascade = cv2.CascadeClassifier(haar_cascade_path())
+        return self._face_cascade
+    
+    def preview_faces(self, frame, detection_width=DEFAULT_DETECTION_WIDTH):
+        """Fast Haar-cascade face boxes for live preview, as (top, right, bottom, left)"""
+        scale = min(detection_width / frame.shape[1], 1.0)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        return [(int(y / scale), int((x + w) / scale), int((y + h) / scale), int(x / scale))
+                for (x, y, w, h) in faces]
+    
+    def capture_face_from_camera(self, camera=0, preview_every=2):
+        """Capture face from webcam
         
-        if not cap.isOpened():
-            return None, "Camera not accessible"
+        A background thread keeps only the newest camera frame. The preview overlay
+        uses the Haar cascade on every preview_every-th frame; the HOG detector only
+        runs on the frame captured with SPACE.
+        """
+        image, _, error = self.capture_face_with_boxes(camera, preview_every)
+        return image, error
+    
+    def capture_face_with_boxes(self, camera=0, preview_every=2):
+        """Like capture_face_from_camera, but returns (image, face_boxes, error)
         
-        print("Position your face in front of the camera and press SPACE to capture, ESC to cancel")
+        The boxes are the ones the HOG detector found on the captured frame, so
+        analyze(image, boxes) does not detect the same frame again.
+        """
+        grabber = FrameGrabber(camera)
+        if not grabber.start():
+            return None, None, "Camera not accessible"
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Convert to RGB for face_recognition
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Find faces in the frame
-            face_locations = face_recognition.face_locations(rgb_frame)
-            
-            # Draw rectangles around faces
-            for (top, right, bottom, left) in face_locations:
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                cv2.putText(frame, "Face detected - Press SPACE to capture", 
-                           (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-            
-            cv2.imshow('Face Capture - Press SPACE to capture, ESC to cancel', frame)
-            
-            key = cv2.waitKey(1) & 0xFF
-            if key == 32:  # SPACE key
-                if face_locations:
-                    cap.release()
-                    cv2.destroyAllWindows()
-                    return rgb_frame, None
-                else:
-                    print("No face detected. Please position your face properly.")
-            elif key == 27:  # ESC key
-                break
+        print("Position your face in front of the camera and press SPACE to capture, ESC to cancel")
         
-        cap.release()
-        cv2.destroyAllWindows()
-        return None, "Capture cancelled"
-    
-    def extract_face_encoding(self, image_array):
-        """Extract face encoding from image array"""
+        sequence = 0
+        preview_frames = 0
+        preview_boxes = []
+        fps = 0.0
+        last_time = time.perf_counter()
+        result = (None, None, "Capture cancelled")
         try:
-            # Find face locations
-            face_locations = face_recognition.face_locations(image_array)
-            
-            if not face_locations:
-                return None, "No face detected in the image"
-            
-            if len(face_locations) > 1:
-                return None, "Multiple faces detected. Please ensure only one face is visible"
-            
-            # Get face encoding
-            face_encodings = face_recognition.face_encodings(image_array, face_locations)
-            
-            if face_encodings:
-                return face_encodings[0], None
-            else:
-                return None, "Could not extract face features"
+            while True:
+                frame, sequence = grabber.read(after=sequence)
+                if frame is None:
+                    if grabber.failed:
+                        break
+                    continue
                 
-        except Exception as e:
-            return None, f"Error processing image: {str(e)}"
+                # Cheap detection for the overlay, reused between refreshes
+                if preview_frames % preview_every == 0:
+                    preview_boxes = self.preview_faces(frame)
+                preview_frames += 1
+                
+                now = time.perf_counter()
+                fps = 0.9 * fps + 0.1 / max(now - last_time, 1e-6) if fps else 1 / max(now - last_time, 1e-6)
+                last_time = now
+                
+                display = frame.copy()
+                for (top, right, bottom, left) in preview_boxes:
+                    cv2.rectangle(display, (left, top), (right, bottom), (0, 255, 0), 2)
+                    cv2.putText(display, "Face detected - Press SPACE to capture", 
+                               (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                cv2.putText(display, f"{fps:.1f} FPS", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+                
+                cv2.imshow('Face Capture - Press SPACE to capture, ESC to cancel', display)
+                
+                key = cv2.waitKey(1) & 0xFF
+                if key == 32:  # SPACE key
+                    # Convert to RGB for face_recognition; the full detector only runs on this frame
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    boxes = locate_faces(rgb_frame, self.detection_width)
+                    if boxes:
+                        result = (rgb_frame, boxes, None)
+                        break
+                    print("No face detected. Please position your face properly.")
+                elif key == 27:  # ESC key
+                    break
+        finally:
+            grabber.stop()
+            cv2.destroyAllWindows()
+        
+        self.preview_fps = fps
+        print(f"Preview: {fps:.1f} FPS (camera delivered {grabber.camera_fps:.1f} FPS)")
+        return result
     
-    def extract_face_encoding_from_base64(self, base64_image):
-        """Extract face encoding from base64 image"""
-        try:
-            # Decode base64 image
+    def decode_base64_image(self, base64_image):
+        """Decode a base64 data URL into an image array"""
+        with metrics.span('base64_decode'):
             image_data = base64.b64decode(base64_image.split(',')[1])
+        
+        with metrics.span('image_decode'):
             image = Image.open(io.BytesIO(image_data))
             image_array = np.array(image)
             
             # Convert BGR to RGB if necessary
             if len(image_array.shape) == 3 and image_array.shape[2] == 3:
                 image_array = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            
-            return self.extract_face_encoding(image_array)
-            
+        
+        return image_array
+    
+    def decode_image_bytes(self, image_bytes):
+        """Decode an uploaded JPEG/PNG body straight into one image array"""
+        # cv2.imdecode yields the same channel order decode_base64_image produces after
+        # its swap, so encodings from binary uploads match those enrolled via base64
+        with metrics.span('image_decode'):
+            image_array = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image_array is None:
+            raise ValueError("Unsupported or corrupt image data")
+        return image_array
+    
+    def analyze(self, image, boxes=None, detector=None):
+        """Analyze a frame once; accepts an image array or a base64 data URL"""
+        if isinstance(image, str):
+            image = self.decode_base64_image(image)
+        return FaceAnalysis(image, self.detection_width, boxes, detector or self.detector)
+    
+    def extract_face(self, image_array, boxes=None, detector=None, analysis=None):
+        """Extract (encoding, error, face_box); face_box is None unless detection ran
+        
+        Pass the `analysis` from analyze() to reuse its detection for the encoding.
+        """
+        try:
+            analysis = analysis or self.analyze(image_array, boxes, detector)
+            encoding, error = analysis.encoding
+            return encoding, error, (analysis.face_box if boxes is None else None)
         except Exception as e:
-            return None, f"Error processing base64 image: {str(e)}"
+            return None, f"Error processing image: {str(e)}", None
+    
+    def extract_face_encoding(self, image_array, boxes=None, analysis=None):
+        """Extract face encoding from image array (or from a shared analysis)"""
+        encoding, error, _ = self.extract_face(image_array, boxes, analysis=analysis)
+        return encoding, error
+    
+    def extract_face_encoding_from_base64(self, base64_image):
+        """Extract face encoding from base64 image (memoized when a cache is set)"""
+        if self.cache is None:
+            encoding, error, _ = self._extract_from_base64(base64_image)
+            return encoding, error
+        
+        from models.encoding_cache import frame_key
+        encoding, error, _ = self.cache.get_or_compute(frame_key(base64_image),
+                                                      lambda: self._extract_from_base64(base64_image))
+        return encoding, error
+    
+    def _extract_from_base64(self, base64_image):
+        try:
+            image_array = self.decode_base64_image(base64_image)
+        except Exception as e:
+            return None, f"Error processing base64 image: {str(e)}", None
+        
+        return self.extract_face(image_array)
     
     def compare_faces(self, known_encoding, unknown_encoding, tolerance=0.6):
         """Compare two face encodings"""
@@ -120,38 +549,10 @@ class FaceRecognitionSystem:
             print(f"Error saving image: {e}")
             return None
     
-    def validate_face_quality(self, image_array):
-        """Validate if the face image is of good quality"""
+    def validate_face_quality(self, image_array, analysis=None):
+        """Validate if the face image is of good quality (reusing a shared analysis if given)"""
         try:
-            # Check image dimensions
-            height, width = image_array.shape[:2]
-            if height < 100 or width < 100:
-                return False, "Image resolution too low"
-            
-            # Find face locations
-            face_locations = face_recognition.face_locations(image_array)
-            
-            if not face_locations:
-                return False, "No face detected"
-            
-            if len(face_locations) > 1:
-                return False, "Multiple faces detected"
-            
-            # Check face size
-            top, right, bottom, left = face_locations[0]
-            face_height = bottom - top
-            face_width = right - left
-            
-            if face_height < 50 or face_width < 50:
-                return False, "Face too small in image"
-            
-            # Check if face takes reasonable portion of image
-            face_area_ratio = (face_height * face_width) / (height * width)
-            if face_area_ratio < 0.1:
-                return False, "Face too small relative to image"
-            
-            return True, "Face quality is good"
-            
+            return (analysis or self.analyze(image_array)).quality
         except Exception as e:
             return False, f"Error validating face: {str(e)}"
     
@@ -162,20 +563,29 @@ class FaceRecognitionSystem:
         
         for i in range(count):
             print(f"Capturing face {i+1} of {count}")
-            image, error = self.capture_face_from_camera()
+            image, boxes, error = self.capture_face_with_boxes()
             
             if error:
                 return None, None, error
             
+            # The capture already located the face; one analysis over its boxes serves both checks
+            analysis = self.analyze(image, boxes)
+            
             # Validate face quality
-            is_valid, message = self.validate_face_quality(image)
+            try:
+                is_valid, message = analysis.quality
+            except Exception as e:
+                is_valid, message = False, f"Error validating face: {str(e)}"
             if not is_valid:
                 print(f"Poor quality image: {message}. Please try again.")
                 i -= 1  # Retry this capture
                 continue
             
             # Extract encoding
-            encoding, error = self.extract_face_encoding(image)
+            try:
+                encoding, error = analysis.encoding
+            except Exception as e:
+                encoding, error = None, f"Error processing image: {str(e)}"
             if error:
                 print(f"Error extracting face: {error}. Please try again.")
                 i -= 1  # Retry this capture
@@ -193,23 +603,18 @@ class FaceRecognitionSystem:
         
         return None, None, "Failed to capture any valid faces"
     
-    def detect_liveness(self, image_array):
-        """Basic liveness detection (can be enhanced)"""
+    def detect_liveness(self, image_array, analysis=None):
+        """Basic liveness detection (can be enhanced)
+        
+        With a shared analysis the sharpness (Laplacian variance) is measured on
+        its face region. Without one no detector runs: the whole frame is judged.
+        Additional checks can be added to FaceAnalysis.liveness,
+        e.g., eye blink detection, head movement, etc.
+        """
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-            
-            # Calculate image sharpness using Laplacian variance
-            laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-            
-            # If variance is too low, image might be blurry or a photo
-            if laplacian_var < 100:
-                return False, "Image appears to be blurry or not a live person"
-            
-            # Additional checks can be added here
-            # e.g., eye blink detection, head movement, etc.
-            
-            return True, "Liveness check passed"
-            
+            if analysis is None:
+                # No boxes means no detection pass; sharpness falls back to the whole frame
+                analysis = FaceAnalysis(image_array, self.detection_width, boxes=[], detector=self.detector)
+            return analysis.liveness
         except Exception as e:
             return False, f"Liveness detection error: {str(e)}"
@@ -0,0 +1,114 @@
+"""
+Cheap face tracking for continuous video login.
+
+Running the HOG detector on every frame of a stream is the dominant cost
+of video login. FaceTracker detects on every Nth frame only and follows
+the face box in between with normalized cross-correlation template
+matching on a downscaled grayscale copy, which costs well under a
+millisecond for a webcam frame. Tracking is dropped (and the next frame
+detects again) when the match gets weak, e.g. the face left the frame.
+
+The tracker also counts how many consecutive frames the box has stayed
+put, so callers can wait for a steady face before paying for an encode.
+"""
+
+from models.face_recognition import DEFAULT_DETECTION_WIDTH, locate_faces
+from models.lazy_import import lazy_import
+
+cv2 = lazy_import('cv2')
+
+
+class FaceTracker:
+    """Follow a single face box across the frames of one stream"""
+
+    def __init__(self, detect_every=5, detection_width=DEFAULT_DETECTION_WIDTH,
+                 min_similarity=0.6, max_shift=0.08, search_margin=0.5, detector='hog'):
+        self.detect_every = max(int(detect_every), 1)
+        self.detection_width = detection_width
+        self.detector = detector
+        self.min_similarity = min_similarity
+        self.max_shift = max_shift  # box centre movement, in box widths, that still counts as steady
+        self.search_margin = search_margin
+
+        self.box = None
+        self.stable_frames = 0
+        self._template = None
+        self._since_detection = 0
+
+        self.frames = 0
+        self.detections = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def update(self, image):
+        """Box of the single face in this frame as (top, right, bottom, left), or None"""
+        self.frames += 1
+        scale = min(self.detection_width / image.shape[1], 1.0)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        previous = self.box
+        if self.box is None or self._since_detection + 1 >= self.detect_every:
+            box = self._detect(image)
+        else:
+            box = self._track(gray, scale)
+
+        if box is None:
+            self.box, self._template, self.stable_frames = None, None, 0
+            return None
+
+        self._remember(gray, scale, box)
+        if previous is not None and self._shift(previous, box) <= self.max_shift:
+            self.stable_frames += 1
+        else:
+            self.stable_frames = 0
+        return box
+
+    def _detect(self, image):
+        self.detections += 1
+        self._since_detection = 0
+        boxes = locate_faces(image, self.detection_width, self.detector)
+        return boxes[0] if len(boxes) == 1 else None
+
+    def _track(self, gray, scale):
+        self._since_detection += 1
+        top, right, bottom, left = (int(round(value * scale)) for value in self.box)
+        width, height = right - left, bottom - top
+        pad_x, pad_y = int(width * self.search_margin), int(height * self.search_margin)
+        y0, x0 = max(top - pad_y, 0), max(left - pad_x, 0)
+        window = gray[y0:bottom + pad_y, x0:right + pad_x]
+        if window.shape[0] < self._template.shape[0] or window.shape[1] < self._template.shape[1]:
+            self.lost += 1
+            return None
+
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, similarity, _, (x, y) = cv2.minMaxLoc(scores)
+        if similarity < self.min_similarity:
+            self.lost += 1
+            return None
+
+        self.tracked += 1
+        dy, dx = (y0 + y - top) / scale, (x0 + x - left) / scale
+        full_height, full_width = (int(round(side / scale)) for side in gray.shape[:2])
+        t, r, b, l = self.box
+        return (int(max(t + dy, 0)), int(min(r + dx, full_width)),
+                int(min(b + dy, full_height)), int(max(l + dx, 0)))
+
+    def _remember(self, gray, scale, box):
+        top, right, bottom, left = (int(round(value * scale)) for value in box)
+        template = gray[max(top, 0):bottom, max(left, 0):right]
+        self.box = box
+        self._template = template if template.size else None
+        if self._template is None:
+            self.box = None
+
+    @staticmethod
+    def _shift(previous, box):
+        width = max(box[1] - box[3], 1)
+        dy = (box[0] + box[2] - previous[0] - previous[2]) / 2
+        dx = (box[1] + box[3] - previous[1] - previous[3]) / 2
+        return (dx * dx + dy * dy) ** 0.5 / width
+
+    def stats(self):
+        return {'frames': self.frames, 'detections': self.detections, 'tracked': self.tracked, 'lost': self.lost}
@@ -0,0 +1,223 @@
+"""
+Fixed-length image feature vectors and vectorized matching for app_simple_ai.
+
+The simple matcher compares colour statistics, structure and colour
+histograms of a 128x128 face image. Features used to be a dict of
+scalars and lists, stored as JSON and compared user by user. Here they
+are one float32 vector:
+
+    [0:6]    avg_r, avg_g, avg_b, std_r, std_g, std_b
+    [6:11]   brightness, contrast, center_avg, center_std, edge_density
+    [11:35]  r, g, b 8-bin histograms, each centred and scaled to unit norm
+    [35:38]  1.0 where that histogram is not constant, else 0.0
+
+With centred unit-norm histograms the Pearson correlation np.corrcoef
+computed is a dot product, and the flags stand in for its NaN on
+constant histograms. FeatureGallery.scores() therefore gives the same
+weighted score as the per-user loop, for every enrolled user at once.
+
+Legacy rows may lack some features, which the old loop skipped: a
+missing scalar is stored as NaN and a missing histogram as an invalid
+one, and neither counts towards that user's score or weight.
+"""
+
+import json
+import threading
+
+import numpy as np
+
+IMAGE_SIZE = 128
+HISTOGRAM_BINS = 8
+
+COLOR = slice(0, 6)
+STRUCTURE = slice(6, 11)
+HISTOGRAMS = slice(11, 11 + 3 * HISTOGRAM_BINS)
+HISTOGRAM_VALID = slice(HISTOGRAMS.stop, HISTOGRAMS.stop + 3)
+FEATURE_SIZE = HISTOGRAM_VALID.stop
+
+COLOR_WEIGHT = 0.1
+STRUCTURE_WEIGHT = 0.15
+HISTOGRAM_WEIGHT = 0.1
+# Colour and structure features always count; a histogram only when its correlation is defined
+FIXED_WEIGHT = (COLOR.stop - COLOR.start) * COLOR_WEIGHT + (STRUCTURE.stop - STRUCTURE.start) * STRUCTURE_WEIGHT
+
+SCALAR_FEATURES = ('avg_r', 'avg_g', 'avg_b', 'std_r', 'std_g', 'std_b',
+                   'brightness', 'contrast', 'center_avg', 'center_std', 'edge_density')
+HISTOGRAM_FEATURES = ('hist_r', 'hist_g', 'hist_b')
+
+FEATURES_FORMAT_VERSION = 1
+ENCODED_SIZE = 1 + FEATURE_SIZE * 4
+
+
+def _histogram_row(histogram):
+    """Centred, unit-norm histogram and whether its correlation is defined (never for a missing one)"""
+    if histogram is None:
+        return np.zeros(HISTOGRAM_BINS), 0.0
+    centred = np.asarray(histogram, dtype=np.float64) - np.mean(histogram)
+    norm = np.linalg.norm(centred)
+    if norm == 0:
+        return np.zeros(HISTOGRAM_BINS), 0.0
+    return centred / norm, 1.0
+
+
+def _vector(scalars, histograms):
+    vector = np.empty(FEATURE_SIZE, dtype=np.float32)
+    vector[COLOR.start:STRUCTURE.stop] = scalars
+    for channel, histogram in enumerate(histograms):
+        row, valid = _histogram_row(histogram)
+        start = HISTOGRAMS.start + channel * HISTOGRAM_BINS
+        vector[start:start + HISTOGRAM_BINS] = row
+        vector[HISTOGRAM_VALID.start + channel] = valid
+    return vector
+
+
+def feature_vector(image):
+    """Feature vector of a 128x128 RGB image (PIL image or uint8 array)"""
+    img_array = np.asarray(image)
+    channels = img_array.reshape(-1, 3)
+    gray = np.mean(img_array, axis=2)
+    center_region = img_array[32:96, 32:96]
+    edges = np.abs(np.diff(gray, axis=0)).sum() + np.abs(np.diff(gray, axis=1)).sum()
+
+    scalars = np.concatenate([
+        channels.mean(axis=0),
+        channels.std(axis=0),
+        [np.mean(gray), np.std(gray), np.mean(center_region), np.std(center_region),
+         edges / (IMAGE_SIZE * IMAGE_SIZE)],
+    ])
+    histograms = [np.histogram(img_array[:, :, channel], bins=HISTOGRAM_BINS)[0] for channel in range(3)]
+    return _vector(scalars, histograms)
+
+
+def features_to_vector(features):
+    """Feature vector from the legacy dict of scalars and histogram lists; missing features are skipped"""
+    return _vector([features.get(name, np.nan) for name in SCALAR_FEATURES],
+                   [features.get(name) for name in HISTOGRAM_FEATURES])
+
+
+def encode_features(vector):
+    """Serialize a feature vector to the versioned binary format"""
+    values = np.asarray(vector, dtype=np.float32).reshape(FEATURE_SIZE)
+    return bytes((FEATURES_FORMAT_VERSION,)) + values.tobytes()
+
+
+def decode_features(value):
+    """Feature vector from a stored value: the binary format or a legacy JSON dict"""
+    if isinstance(value, bytes) and len(value) == ENCODED_SIZE and value[0] == FEATURES_FORMAT_VERSION:
+        return np.frombuffer(value, dtype=np.float32, offset=1)
+    if isinstance(value, bytes):
+        value = value.decode()
+    return features_to_vector(json.loads(value))
+
+
+class FeatureGallery:
+    """In-memory matrix of enrolled feature vectors for vectorized matching
+
+    Vectors are stored feature-major (FEATURE_SIZE x N float32), so each
+    feature of every user is one contiguous row and scoring is a few
+    whole-row operations plus one small matrix product.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.RLock()
+        self._columns = np.empty((FEATURE_SIZE, initial_capacity), dtype=np.float32)
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._rows = {}  # user_id -> column, so re-enrolling a user overwrites their vector
+        self._count = 0
+        self._partial = False  # Whether any stored vector lacks a scalar feature (NaN)
+        self.high_water = 0  # Last face_enrollments.seq loaded, used for catch-up queries
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def ids(self):
+        with self._lock:
+            return self._ids[:self._count].copy()
+
+    @property
+    def matrix(self):
+        """N x FEATURE_SIZE float32 array of the enrolled vectors"""
+        with self._lock:
+            return self._columns[:, :self._count].T.copy()
+
+    def _reserve(self, extra):
+        needed = self._count + extra
+        capacity = self._columns.shape[1]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        columns = np.empty((FEATURE_SIZE, new_capacity), dtype=np.float32)
+        ids = np.empty(new_capacity, dtype=np.int64)
+        columns[:, :self._count] = self._columns[:, :self._count]
+        ids[:self._count] = self._ids[:self._count]
+        self._columns, self._ids = columns, ids
+
+    def add_many(self, user_ids, vectors, high_water=None):
+        """Add or replace several users' feature vectors"""
+        block = np.asarray(vectors, dtype=np.float32).reshape(-1, FEATURE_SIZE)
+        with self._lock:
+            self._reserve(len(block))
+            positions = np.empty(len(block), dtype=np.int64)
+            for index, user_id in enumerate(user_ids):
+                position = self._rows.get(int(user_id))
+                if position is None:
+                    position = self._rows[int(user_id)] = self._count
+                    self._ids[position] = user_id
+                    self._count += 1
+                positions[index] = position
+            self._columns[:, positions] = block.T
+            self._partial = self._partial or bool(np.isnan(block[:, COLOR.start:STRUCTURE.stop]).any())
+            if high_water is not None:
+                self.high_water = max(self.high_water, int(high_water))
+
+    def add(self, user_id, vector, high_water=None):
+        self.add_many([user_id], [vector], high_water=high_water)
+
+    def scores(self, vector):
+        """(ids, scores): the weighted similarity of the query to every enrolled user"""
+        query = np.asarray(vector, dtype=np.float32).reshape(FEATURE_SIZE)
+        # Block-diagonal 3 x 24 query, so one product correlates all three histograms of every user
+        histogram_query = np.zeros((3, 3 * HISTOGRAM_BINS), dtype=np.float32)
+        for channel in range(3):
+            bins = slice(channel * HISTOGRAM_BINS, (channel + 1) * HISTOGRAM_BINS)
+            histogram_query[channel, bins] = query[HISTOGRAMS][bins]
+
+        with self._lock:
+            columns = self._columns[:, :self._count]
+            ids = self._ids[:self._count].copy()
+
+            # fmax drops NaN, so a missing scalar adds nothing to the score
+            color_sims = np.fmax(0, 1 - np.abs(columns[COLOR] - query[COLOR, None]) / 255).sum(axis=0)
+
+            structure = columns[STRUCTURE]
+            scale = np.maximum(np.maximum(structure, query[STRUCTURE, None]), 1)
+            structure_sims = np.fmax(0, 1 - np.abs(structure - query[STRUCTURE, None]) / scale).sum(axis=0)
+
+            correlations = histogram_query @ columns[HISTOGRAMS]
+            defined = columns[HISTOGRAM_VALID] * query[HISTOGRAM_VALID, None]
+
+            # ...nor to the weight; vectors with every scalar share the fixed weight
+            weight = FIXED_WEIGHT
+            if self._partial:
+                present = np.isfinite(columns[COLOR.start:STRUCTURE.stop])
+                weight = present[COLOR].sum(axis=0) * COLOR_WEIGHT + present[STRUCTURE].sum(axis=0) * STRUCTURE_WEIGHT
+
+        # np.corrcoef clips to [-1, 1]; a negative correlation only adds weight
+        histogram_sims = (np.clip(correlations, 0, 1) * defined).sum(axis=0)
+        total = (color_sims * COLOR_WEIGHT + structure_sims * STRUCTURE_WEIGHT
+                 + histogram_sims * HISTOGRAM_WEIGHT)
+        weight = weight + defined.sum(axis=0) * HISTOGRAM_WEIGHT
+        # A user with no comparable feature scores 0, as in the old loop
+        return ids, np.divide(total, weight, out=np.zeros_like(total), where=weight > 0)
+
+    def match(self, vector, tolerance=0.7):
+        """(user_id, similarity) of the most similar user above tolerance, or None"""
+        ids, scores = self.scores(vector)
+        if not len(ids):
+            return None
+        best = scores.max()
+        if not best > tolerance:
+            return None
+        # Ties go to the lowest user id, as in the old scan over the users table
+        return int(ids[scores == best].min()), float(best)
@@ -0,0 +1,90 @@
+"""
+Background camera reader that always holds the newest frame.
+
+cv2.VideoCapture buffers frames internally; a loop that does detection
+or drawing between cap.read() calls falls behind and keeps reading stale
+frames. FrameGrabber reads on its own thread as fast as the camera
+delivers and keeps only the latest frame, so the consumer always sees
+the current image and never blocks the camera.
+
+    with FrameGrabber(0) as grabber:
+        frame, sequence = grabber.read()
+"""
+
+import threading
+import time
+
+from models.lazy_import import lazy_import
+
+cv2 = lazy_import('cv2')
+
+
+class FrameGrabber:
+    """Reads a cv2.VideoCapture source on a daemon thread, keeping only the latest frame"""
+
+    def __init__(self, source=0):
+        self.source = source
+        self._capture = None
+        self._thread = None
+        self._running = False
+        self._condition = threading.Condition()
+        self._frame = None
+        self._sequence = 0
+        self._started_at = None
+        self.failed = False
+
+    def start(self):
+        """Open the camera and start reading; returns False if it could not be opened"""
+        self._capture = cv2.VideoCapture(self.source)
+        if not self._capture.isOpened():
+            self._capture.release()
+            self._capture = None
+            return False
+        self._running = True
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='frame-grabber', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        while self._running:
+            ok, frame = self._capture.read()
+            with self._condition:
+                if not ok:
+                    self.failed = True
+                    self._running = False
+                else:
+                    self._frame = frame
+                    self._sequence += 1
+                self._condition.notify_all()
+
+    def read(self, after=0, timeout=1.0):
+        """(frame, sequence) of the newest frame with a sequence above `after`, or (None, after) on timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > after or not self._running, timeout)
+            if self._sequence > after:
+                return self._frame, self._sequence
+            return None, after
+
+    @property
+    def camera_fps(self):
+        """Frames per second delivered by the camera since start"""
+        if not self._started_at:
+            return 0.0
+        return self._sequence / max(time.monotonic() - self._started_at, 1e-6)
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,92 @@
+"""
+Length-prefixed frame streams and best-frame selection.
+
+A burst of camera frames travels in one request body as a sequence of
+
+    4-byte big-endian length | JPEG/PNG bytes
+
+records (content type application/x-face-frames). The server reads the
+body incrementally, so a chunked upload is processed while it arrives and
+a plain one never has to be split into a multipart form.
+"""
+
+import heapq
+import itertools
+import struct
+
+CONTENT_TYPE = 'application/x-face-frames'
+
+FRAME_HEADER = struct.Struct('>I')
+DEFAULT_MAX_FRAMES = 30
+DEFAULT_MAX_FRAME_BYTES = 4 * 1024 * 1024
+
+
+def _read_exact(stream, size):
+    """Read exactly size bytes; fewer only at end of stream"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def iter_frames(stream, max_frames=DEFAULT_MAX_FRAMES, max_frame_bytes=DEFAULT_MAX_FRAME_BYTES):
+    """Yield the image bytes of each frame in a length-prefixed stream
+
+    Raises ValueError for truncated or oversized frames and streams with
+    more than max_frames frames.
+    """
+    for count in itertools.count():
+        header = _read_exact(stream, FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("Truncated frame header")
+        if count >= max_frames:
+            raise ValueError(f"More than {max_frames} frames")
+
+        (size,) = FRAME_HEADER.unpack(header)
+        if size == 0 or size > max_frame_bytes:
+            raise ValueError(f"Invalid frame size {size}")
+        data = _read_exact(stream, size)
+        if len(data) < size:
+            raise ValueError("Truncated frame")
+        yield data
+
+
+def pack_frames(frames):
+    """Length-prefixed stream of image byte strings (the client side, for tests and benchmarks)"""
+    return b''.join(FRAME_HEADER.pack(len(frame)) + frame for frame in frames)
+
+
+class BestFrames:
+    """Keep the k highest-scoring items of a stream"""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []  # (score, sequence, item); the worst kept item is at the top
+        self._sequence = itertools.count()
+        self.offered = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, score, item):
+        """Offer an item; returns whether it is currently among the best k"""
+        self.offered += 1
+        entry = (score, next(self._sequence), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def best(self):
+        """[(score, item)] best first"""
+        return [(score, item) for score, _, item in sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))]
@@ -0,0 +1,385 @@
+"""
+Versioned on-disk snapshot of a FaceGallery.
+
+A snapshot directory holds one subdirectory per published version and a
+CURRENT file naming the live one. Each version directory holds:
+    header.json     format version, generation, row count, checksum and rowid high-water mark
+    encodings.f32   raw little-endian float32 N x 128 matrix
+    norms.f32       raw little-endian float32 squared norms, one per row
+    ids.i64         raw little-endian int64 user ids, parallel to the matrix rows
+    usernames.json  JSON list of usernames, parallel to the matrix rows
+    <name>.npy      optional trained index arrays (e.g. IVF centroids and
+                    cell labels), listed in the header, so an index
+                    reloads without retraining
+
+A writer fills a fresh directory and then replaces CURRENT with one
+atomic rename, so readers in any process see either the old version or
+the new one, never a mix of files from both. Version directories are
+never modified after they are published.
+
+Workers np.memmap the raw files instead of unpickling SQLite BLOBs, so
+startup costs a few milliseconds and every worker shares the page cache.
+Rows enrolled after the snapshot was written are caught up from SQLite
+using the high-water mark.
+
+Usage:
+    python -m models.gallery_snapshot <sqlite_db> <snapshot_dir>    build a snapshot (FACE_MATCHER=ivf
+                                                                    also saves a trained IVF index, with
+                                                                    the apps' FACE_MATCHER_* settings)
+    python -m models.gallery_snapshot <snapshot_dir>                verify and summarize one
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from models.face_gallery import ENCODING_SIZE, FaceGallery
+from models.ann_index import create_gallery_from_env
+from models.encoding_codec import decode_valid
+from models import connection_pool
+
+SNAPSHOT_VERSION = 2
+CURRENT_FILE = 'CURRENT'
+HEADER_FILE = 'header.json'
+ENCODINGS_FILE = 'encodings.f32'
+NORMS_FILE = 'norms.f32'
+IDS_FILE = 'ids.i64'
+USERNAMES_FILE = 'usernames.json'
+
+ENCODING_DTYPE = np.dtype('<f4')
+ID_DTYPE = np.dtype('<i8')
+
+# Superseded versions are deleted only once there are more than RETAINED_VERSIONS of them and
+# they are older than RETAIN_SECONDS: a reader may have just resolved CURRENT to one, or a slower
+# concurrent writer may be about to publish it
+RETAINED_VERSIONS = 2
+RETAIN_SECONDS = 60
+BUILDING_PREFIX = '.building-'
+STALE_BUILD_SECONDS = 3600
+
+
+def _checksum(*chunks):
+    """CRC32 over the raw bytes of the given arrays or byte strings"""
+    crc = 0
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            # A flat byte view also works for empty galleries, where memoryview.cast() refuses
+            chunk = np.ascontiguousarray(chunk).reshape(-1).view(np.uint8)
+        crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _write_file(path, data):
+    """Write bytes to path and flush them to disk"""
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temporary file and rename"""
+    # Unique per writer, so concurrent writers never rename each other's files
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    _write_file(tmp_path, data)
+    os.replace(tmp_path, path)
+
+
+def current_version(snapshot_dir):
+    """Path of the published version directory, or None when nothing was published"""
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), 'r') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(snapshot_dir, name) if name else None
+
+
+def write_snapshot(snapshot_dir, ids, matrix, high_water, usernames=None, state=None):
+    """Write a snapshot of the given ids and encodings and publish it as the current version
+
+    `state` is a trained index's state from index_state(): a dict with
+    'kind', 'pq_m' and an 'arrays' dict of arrays saved as .npy files.
+    """
+    ids = np.ascontiguousarray(ids, dtype=ID_DTYPE)
+    matrix = np.ascontiguousarray(matrix, dtype=ENCODING_DTYPE).reshape(-1, ENCODING_SIZE)
+    norms = np.einsum('ij,ij->i', matrix, matrix).astype(ENCODING_DTYPE)
+    if usernames is None:
+        usernames = [''] * len(ids)
+    if len(usernames) != len(ids):
+        raise ValueError(f"{len(usernames)} usernames for {len(ids)} snapshot rows")
+    usernames_bytes = json.dumps(list(usernames)).encode('utf-8')
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    generation = time.time_ns()
+    building = tempfile.mkdtemp(prefix=BUILDING_PREFIX, dir=snapshot_dir)
+    try:
+        _write_file(os.path.join(building, ENCODINGS_FILE), matrix.tobytes())
+        _write_file(os.path.join(building, NORMS_FILE), norms.tobytes())
+        _write_file(os.path.join(building, IDS_FILE), ids.tobytes())
+        _write_file(os.path.join(building, USERNAMES_FILE), usernames_bytes)
+        state_arrays = _write_state(building, state)
+
+        header = {
+            'version': SNAPSHOT_VERSION,
+            'generation': generation,
+            'dim': ENCODING_SIZE,
+            'dtype': ENCODING_DTYPE.str,
+            'count': len(ids),
+            'high_water': int(high_water),
+            'checksum': _checksum(matrix, norms, ids, usernames_bytes, *state_arrays),
+            'created_at': datetime.now().isoformat()
+        }
+        if state is not None:
+            header['index'] = {'kind': state['kind'], 'pq_m': state['pq_m'], 'arrays': sorted(state['arrays'])}
+        _write_file(os.path.join(building, HEADER_FILE), json.dumps(header, indent=2).encode('utf-8'))
+
+        # Zero-padded generation first, so version names sort oldest to newest
+        name = f'{generation:020d}{os.path.basename(building)[len(BUILDING_PREFIX) - 1:]}'
+        os.rename(building, os.path.join(snapshot_dir, name))
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    _write_atomic(os.path.join(snapshot_dir, CURRENT_FILE), name.encode('utf-8'))
+    _remove_old_versions(snapshot_dir)
+    return header
+
+
+def _write_state(version_dir, state):
+    """Save a trained index's arrays as .npy files; returns them in checksum order"""
+    if state is None:
+        return []
+    arrays = []
+    for name in sorted(state['arrays']):
+        array = np.ascontiguousarray(state['arrays'][name])
+        with open(os.path.join(version_dir, f'{name}.npy'), 'wb') as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        arrays.append(array)
+    return arrays
+
+
+def save_gallery(gallery, snapshot_dir, usernames=None):
+    """Snapshot a gallery's live rows, with its trained index state when it has one
+
+    `usernames` maps user ids to usernames for the sidecar.
+    """
+    # Read the mark first: rows added meanwhile are simply caught up again later
+    high_water = gallery.high_water
+    ids, matrix, state = gallery.index_state()
+    names = [usernames.get(int(user_id), '') for user_id in ids] if usernames else None
+    return write_snapshot(snapshot_dir, ids, matrix, high_water, names, state)
+
+
+def _remove_old_versions(snapshot_dir):
+    """Delete long-superseded versions, and builds abandoned by crashed writers"""
+    current = os.path.basename(current_version(snapshot_dir) or '')
+    now = time.time()
+    versions = []
+    for entry in os.scandir(snapshot_dir):
+        if not entry.is_dir():
+            continue
+        age = now - entry.stat().st_mtime
+        if entry.name.startswith(BUILDING_PREFIX):
+            if age > STALE_BUILD_SECONDS:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.name != current:
+            versions.append((entry.name, age))
+
+    # Mapped files stay readable after their directory is removed; on Windows removal just fails
+    for name, age in sorted(versions)[:-RETAINED_VERSIONS]:
+        if age > RETAIN_SECONDS:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def read_header(snapshot_dir):
+    """Read and validate the current version's header, returning None if unusable"""
+    version_dir = current_version(snapshot_dir)
+    if version_dir is None:
+        return None
+    return _read_version_header(version_dir)
+
+
+def _read_version_header(version_dir):
+    header_path = os.path.join(version_dir, HEADER_FILE)
+    try:
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading snapshot header: {e}")
+        return None
+
+    if header.get('version') != SNAPSHOT_VERSION or header.get('dim') != ENCODING_SIZE:
+        print(f"Ignoring snapshot with unsupported format: {header_path}")
+        return None
+
+    count = header['count']
+    expected_sizes = {
+        ENCODINGS_FILE: count * ENCODING_SIZE * ENCODING_DTYPE.itemsize,
+        NORMS_FILE: count * ENCODING_DTYPE.itemsize,
+        IDS_FILE: count * ID_DTYPE.itemsize,
+    }
+    for filename, size in expected_sizes.items():
+        path = os.path.join(version_dir, filename)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            print(f"Ignoring snapshot with missing or truncated file: {path}")
+            return None
+
+    return header
+
+
+def map_snapshot(snapshot_dir, verify=True):
+    """Memory-map the current snapshot, returning (header, ids, matrix, norms) or None
+
+    Every file comes from the one version directory CURRENT named when it
+    was read, so the arrays always belong together. verify=True recomputes
+    the checksum, which reads every page once (and so also warms the page
+    cache); pass False only when the files are known to be intact.
+    """
+    mapped = _map_version(snapshot_dir, verify)
+    return mapped[:4] if mapped is not None else None
+
+
+def _map_version(snapshot_dir, verify):
+    """(header, ids, matrix, norms, state) of the current version, or None"""
+    version_dir = current_version(snapshot_dir)
+    if version_dir is None:
+        return None
+    header = _read_version_header(version_dir)
+    if header is None:
+        return None
+
+    count = header['count']
+    if count == 0:
+        ids = np.empty(0, dtype=ID_DTYPE)
+        matrix = np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+        norms = np.empty(0, dtype=ENCODING_DTYPE)
+    else:
+        matrix = np.memmap(os.path.join(version_dir, ENCODINGS_FILE), dtype=ENCODING_DTYPE,
+                           mode='r', shape=(count, ENCODING_SIZE))
+        norms = np.memmap(os.path.join(version_dir, NORMS_FILE), dtype=ENCODING_DTYPE,
+                          mode='r', shape=(count,))
+        ids = np.memmap(os.path.join(version_dir, IDS_FILE), dtype=ID_DTYPE, mode='r', shape=(count,))
+
+    state = None
+    try:
+        if 'index' in header:
+            index = header['index']
+            state = {'kind': index['kind'], 'pq_m': index['pq_m'],
+                     'arrays': {name: np.load(os.path.join(version_dir, f'{name}.npy'), mmap_mode='r')
+                                for name in index['arrays']}}
+        if verify:
+            with open(os.path.join(version_dir, USERNAMES_FILE), 'rb') as f:
+                usernames_bytes = f.read()
+    except (OSError, ValueError) as e:
+        print(f"Error reading snapshot files: {e}")
+        return None
+
+    if verify:
+        state_arrays = [state['arrays'][name] for name in sorted(state['arrays'])] if state else []
+        if _checksum(matrix, norms, ids, usernames_bytes, *state_arrays) != header['checksum']:
+            print(f"Ignoring snapshot with bad checksum: {version_dir}")
+            return None
+
+    return header, ids, matrix, norms, state
+
+
+def load_usernames(snapshot_dir):
+    """Usernames of the current snapshot, parallel to its ids, or None if unreadable"""
+    version_dir = current_version(snapshot_dir)
+    if version_dir is None:
+        return None
+    try:
+        with open(os.path.join(version_dir, USERNAMES_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading snapshot usernames: {e}")
+        return None
+
+
+def load_into_gallery(gallery, snapshot_dir, verify=True):
+    """Map a snapshot as the gallery's base segment; returns True on success"""
+    mapped = _map_version(snapshot_dir, verify)
+    if mapped is None:
+        return False
+
+    header, ids, matrix, norms, state = mapped
+    gallery.load_base(ids, matrix, norms, header['high_water'], state=state)
+    return True
+
+
+def build_from_database(db_path, snapshot_dir, high_water_query='SELECT COALESCE(MAX(id), 0) FROM users',
+                        gallery=None):
+    """Write a snapshot of every encoding stored in a users table
+
+    `high_water_query` returns the mark that later catch-up queries start
+    from; by default that is the largest user id. When `gallery` is
+    given (e.g. an IVFIndex) the encodings are loaded into it in one go,
+    so an index trains once, and its trained state is saved too.
+    """
+    conn = connection_pool.connect(db_path)
+    cursor = conn.cursor()
+
+    # Read the mark first: rows written meanwhile are simply caught up again later
+    cursor.execute(high_water_query)
+    high_water = cursor.fetchone()[0]
+
+    cursor.execute('''
+        SELECT id, username, face_encoding FROM users
+        WHERE face_encoding IS NOT NULL ORDER BY id
+    ''')
+
+    rows_gallery = FaceGallery()
+    usernames = {}
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        positions, encodings = decode_valid([row[2] for row in rows])
+        rows_gallery.add_many([rows[position][0] for position in positions], encodings)
+        usernames.update((rows[position][0], rows[position][1]) for position in positions)
+    conn.close()
+
+    ids, matrix, norms = rows_gallery.live_rows()
+    if gallery is None:
+        gallery = rows_gallery
+    gallery.load_base(ids, matrix, norms, high_water)
+    return save_gallery(gallery, snapshot_dir, usernames)
+
+
+def describe(snapshot_dir):
+    """One-line summary of the current snapshot after verifying its checksum, or None if unusable"""
+    mapped = map_snapshot(snapshot_dir)
+    if mapped is None:
+        return None
+    header, ids, _, _ = mapped
+    usernames = load_usernames(snapshot_dir) or []
+    named = sum(1 for username in usernames if username)
+    return (f"{os.path.basename(current_version(snapshot_dir))}: {header['count']} encodings, "
+            f"{named} with usernames, high-water mark {header['high_water']}, "
+            f"written {header['created_at']}, checksum OK")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        summary = describe(sys.argv[1])
+        print(summary or f"No usable snapshot in {sys.argv[1]}")
+        sys.exit(0 if summary else 1)
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+
+    # Build the same matcher the apps use, so an IVF index is trained once here
+    header = build_from_database(sys.argv[1], sys.argv[2],
+                                 gallery=create_gallery_from_env())
+    print(f"Wrote {header['count']} encodings to {sys.argv[2]} (high-water mark {header['high_water']})")
@@ -0,0 +1,89 @@
+"""
+Deferred imports for the heavy vision stack.
+
+cv2 and face_recognition (dlib and its model files) dominate a worker's
+cold start, yet page views and password logins never touch them.
+lazy_import() returns a stand-in straight away and runs the real import
+on first attribute access, so the cost moves to the first face request --
+or to an explicit preload() during startup.
+
+    cv2 = lazy_import('cv2')
+    cv2.resize(...)  # imports cv2 here, once
+
+A missing package still fails at startup: the module is located (not
+executed) when the stand-in is created. importlib.util.LazyLoader is not
+used because it is not thread-safe before Python 3.12.
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+VISION_MODULES = ('cv2', 'face_recognition', 'PIL.Image')
+
+_modules = {}
+_lock = threading.Lock()
+_load_seconds = {}
+
+
+class LazyModule:
+    """Stands in for a module until an attribute is first used"""
+
+    def __init__(self, name):
+        if importlib.util.find_spec(name) is None:
+            raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        with _lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                _load_seconds[self._name] = time.perf_counter() - start
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self._module or self._load(), attr)
+        # Later lookups of the same name skip __getattr__
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'deferred'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """The module if it is already imported, otherwise a shared LazyModule for it"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        if name not in _modules:
+            _modules[name] = LazyModule(name)
+        return _modules[name]
+
+
+def loaded(name):
+    """Whether module name has really been imported in this process"""
+    return name in sys.modules
+
+
+def preload(names=VISION_MODULES):
+    """Import deferred modules now; returns {name: seconds} for the ones this call loaded"""
+    timings = {}
+    for name in names:
+        if loaded(name):
+            continue
+        start = time.perf_counter()
+        lazy_import(name)._load()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def load_times():
+    """{name: seconds} spent importing each deferred module so far"""
+    return dict(_load_seconds)
@@ -0,0 +1,252 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects updated under a lock,
+cheap enough to leave on in production: a timing span costs two
+perf_counter() calls and a bisect. Callback metrics read their value
+only when /metrics is scraped, e.g. the gallery size or connection-pool
+wait counters.
+
+    from models import metrics
+
+    with metrics.span('detect'):
+        boxes = locate_faces(image)
+
+    metrics.render()  # text/plain; version=0.0.4
+
+Metrics live in the process that records them; work done inside
+recognition worker processes is only visible through what the parent
+records when results come back.
+"""
+
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers a sub-millisecond gallery match up to a slow dlib encode
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        suffix = '' if self.name.endswith('_total') else '_total'
+        return [(self.name + suffix + _format_labels(self.labelnames, key), value)
+                for key, value in sorted(values.items())]
+
+
+class _Timer:
+    """Context manager observing its own duration into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                lines.append((self.name + '_bucket' + _format_labels(self.labelnames, key, ('le', _format_value(bound))),
+                              cumulative))
+            lines.append((self.name + '_sum' + _format_labels(self.labelnames, key), values[-1]))
+            lines.append((self.name + '_count' + _format_labels(self.labelnames, key), cumulative))
+        return lines
+
+
+class Callback:
+    """Gauge or counter whose value is read from a function at scrape time
+
+    The function returns a number, or a dict mapping label-value tuples to
+    numbers when labelnames are given.
+    """
+
+    def __init__(self, name, documentation, function, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        try:
+            values = self.function()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return []
+        if not self.labelnames:
+            values = {(): values}
+        return [(self.name + _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Registry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric, replace=False):
+        """Add a metric; an existing one with the same name is returned unless replace is set"""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not replace:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        with self._lock:
+            registered = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in registered:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name} {_format_value(value)}' for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name, documentation, function, labelnames=(), kind='gauge'):
+    """Register a scrape-time metric; re-registering a name replaces its function"""
+    return REGISTRY.register(Callback(name, documentation, function, labelnames, kind), replace=True)
+
+
+def render():
+    return REGISTRY.render()
+
+
+STAGE_SECONDS = histogram('face_login_stage_seconds', 'Time spent in each face login stage', ('stage',))
+FACE_ANALYSES = counter('face_analyses_total', 'Frames analysed, by outcome', ('outcome',))
+
+# Per-thread list of (stage, seconds) while a request is being traced, e.g. by the profiler
+_trace = threading.local()
+
+
+class _Span:
+    """Stage timer that also reports to the current thread's trace, if any"""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(seconds, stage=self.stage)
+        stages = getattr(_trace, 'stages', None)
+        if stages is not None:
+            stages.append((self.stage, seconds))
+
+
+def span(stage):
+    """Time a block of code as one stage of face login"""
+    return _Span(stage)
+
+
+def start_trace():
+    """Start collecting the stages timed on this thread"""
+    _trace.stages = []
+
+
+def stop_trace():
+    """Stop collecting and return this thread's (stage, seconds) list"""
+    stages = getattr(_trace, 'stages', None)
+    _trace.stages = None
+    return stages or []
@@ -0,0 +1,114 @@
+"""
+Micro-batching of concurrent recognition requests.
+
+When many kiosks log in at once, each request would otherwise encode its
+frame and scan the gallery on its own. MicroBatcher collects requests
+that arrive within a short window (or until `max_batch` are waiting),
+hands them to `process_batch` together, and fans the results back out
+to the waiting request threads. With a FaceGallery, the whole batch is
+matched with one matrix-matrix distance computation.
+
+The batcher records a histogram of batch sizes and the queueing delay
+each request paid while waiting for its batch, so the window can be
+tuned against throughput.
+"""
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Groups concurrent submissions into batches processed by one function"""
+
+    def __init__(self, process_batch, window_ms=10, max_batch=16, timeout=10.0, latency_samples=2048):
+        self.process_batch = process_batch  # list of items -> list of results, same order
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.batch_sizes = collections.Counter()
+        self.queue_delays = collections.deque(maxlen=latency_samples)
+        self.submitted = 0
+        self.failed = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                    self._thread.start()
+
+    def submit(self, item):
+        """Queue one item and block until its batch has been processed"""
+        self._ensure_thread()
+        future = Future()
+        with self._lock:
+            self.submitted += 1
+        self._queue.put((item, future, time.monotonic()))
+        return future.result(timeout=self.timeout)
+
+    def _collect(self):
+        """Take the first waiting item, then anything arriving within the window"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            with self._lock:
+                self.batch_sizes[len(batch)] += 1
+                self.queue_delays.extend(started - enqueued for _, _, enqueued in batch)
+
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Batch-size histogram and added queueing latency"""
+        with self._lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+            delays = np.array(self.queue_delays) * 1000
+            submitted, failed = self.submitted, self.failed
+        batches = sum(sizes.values())
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'submitted': submitted,
+            'failed': failed,
+            'batches': batches,
+            'mean_batch_size': sum(size * count for size, count in sizes.items()) / batches if batches else 0.0,
+            'batch_size_histogram': sizes,
+            'queue_delay_ms': {
+                'mean': float(delays.mean()) if len(delays) else 0.0,
+                'p50': float(np.percentile(delays, 50)) if len(delays) else 0.0,
+                'p95': float(np.percentile(delays, 95)) if len(delays) else 0.0,
+                'p99': float(np.percentile(delays, 99)) if len(delays) else 0.0,
+            },
+        }
@@ -0,0 +1,223 @@
+"""
+On-demand sampling profiler for individual requests.
+
+Latency outliers on /face-login only appear under real traffic, so the
+profiler is armed at runtime (PROFILE_* environment variables or the
+/admin/profiler endpoint) to profile every Nth request and/or requests
+carrying a trigger header. While a profiled request runs, one sampler
+thread reads its Python stack every few milliseconds through
+sys._current_frames(); nothing is installed on the request thread
+itself, so profiled requests run close to full speed.
+
+Each profile is written as a pair of files in the output directory:
+
+    <time>-<seq>-<endpoint>.collapsed   flamegraph.pl / speedscope input
+    <time>-<seq>-<endpoint>.json        route, status, duration, stage timings
+
+The oldest profiles are deleted once the directory exceeds max_bytes.
+
+When disarmed the request hooks only read the `armed` attribute.
+
+Stage timings come from metrics.span() on the request thread; work done
+on the micro-batcher thread or in recognition worker processes shows up
+as time spent waiting for their result.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from models import metrics
+
+DEFAULT_INTERVAL = 0.002
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+class Profile:
+    """Samples collected for one request thread"""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label.replace(';', ':')
+
+
+def collapse_stack(frame):
+    """Root-first, semicolon-separated stack of a frame, as used by collapsed-stack tools"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class RequestProfiler:
+    """Selects requests to profile and samples their threads"""
+
+    def __init__(self, output_dir='profiles', max_bytes=DEFAULT_MAX_BYTES, interval=DEFAULT_INTERVAL):
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        self.interval = interval
+
+        self.armed = False
+        self.every = 0
+        self.header = None
+        self.endpoints = None
+
+        self._lock = threading.Lock()
+        self._active = {}  # thread id -> Profile
+        self._sampler = None
+        self._seen = 0
+        self._sequence = 0
+
+        self.written = 0
+        self.deleted = 0
+
+    def arm(self, every=0, header=None, endpoints=None):
+        """Profile every Nth request (0 = none) and requests carrying the header, optionally only some endpoints"""
+        with self._lock:
+            self.every = max(int(every or 0), 0)
+            self.header = header or None
+            self.endpoints = set(endpoints) if endpoints else None
+            self._seen = 0
+            self.armed = bool(self.every or self.header)
+
+    def disarm(self):
+        with self._lock:
+            self.armed = False
+
+    def should_profile(self, endpoint, headers):
+        """Whether this request is selected; call only while armed"""
+        if self.endpoints is not None and endpoint not in self.endpoints:
+            return False
+        if self.header and self.header in headers:
+            return True
+        if not self.every:
+            return False
+        with self._lock:
+            self._seen += 1
+            return self._seen % self.every == 0
+
+    def start(self):
+        """Begin sampling the calling thread"""
+        profile = Profile(threading.get_ident())
+        metrics.start_trace()
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+        return profile
+
+    def cancel(self, profile):
+        """Stop sampling without writing anything"""
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        metrics.stop_trace()
+
+    def finish(self, profile, endpoint, method, status):
+        """Stop sampling and write the profile; returns the path of the collapsed stacks or None"""
+        duration = time.perf_counter() - profile.started
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+            self._sequence += 1
+            sequence = self._sequence
+        stages = metrics.stop_trace()
+
+        name = '{}-{:06d}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), sequence,
+                                     re.sub(r'[^A-Za-z0-9_.]', '_', endpoint or 'unmatched'))
+        meta = {
+            'endpoint': endpoint,
+            'method': method,
+            'status': status,
+            'duration_ms': 1000 * duration,
+            'interval_ms': 1000 * self.interval,
+            'samples': profile.samples,
+            'stages_ms': [[stage, 1000 * seconds] for stage, seconds in stages],
+        }
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, name + '.collapsed')
+            with open(path, 'w') as f:
+                for stack, count in profile.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(os.path.join(self.output_dir, name + '.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+            self.written += 1
+            self._enforce_limit()
+            return path
+        except OSError as e:
+            print(f"Error writing profile {name}: {e}")
+            return None
+
+    def _sample(self):
+        """Sampler thread: record the stack of every active request thread until none are left"""
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for thread_id, profile in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[collapse_stack(frame)] += 1
+                    profile.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _enforce_limit(self):
+        """Delete the oldest profiles until the directory fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.output_dir):
+            if entry.is_file() and entry.name.endswith(('.collapsed', '.json')):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+                self.deleted += 1
+            except OSError:
+                continue
+            total -= size
+
+    def status(self):
+        return {
+            'armed': self.armed,
+            'every': self.every,
+            'header': self.header,
+            'endpoints': sorted(self.endpoints) if self.endpoints else None,
+            'output_dir': self.output_dir,
+            'max_bytes': self.max_bytes,
+            'interval_ms': 1000 * self.interval,
+            'active': len(self._active),
+            'written': self.written,
+            'deleted': self.deleted,
+        }
+
+
+def from_environment(environ=os.environ):
+    """Profiler configured (and armed, if PROFILE_EVERY or PROFILE_HEADER is set) from the environment"""
+    profiler = RequestProfiler(
+        output_dir=environ.get('PROFILE_DIR', 'profiles'),
+        max_bytes=int(float(environ.get('PROFILE_MAX_MB', '100')) * 1024 * 1024),
+        interval=float(environ.get('PROFILE_INTERVAL_MS', '2')) / 1000)
+    endpoints = [name for name in environ.get('PROFILE_ENDPOINTS', '').split(',') if name]
+    profiler.arm(every=int(environ.get('PROFILE_EVERY', '0')), header=environ.get('PROFILE_HEADER'),
+                 endpoints=endpoints)
+    return profiler
@@ -0,0 +1,349 @@
+"""
+Process-pool executor for face detection and encoding.
+
+dlib detection and encoding hold the GIL for most of their runtime, so
+running them on Flask's request threads serializes face logins and lets
+one slow frame block a thread. RecognitionExecutor instead keeps a pool
+of pre-warmed worker processes, each importing face_recognition and
+loading its models once.
+
+Decoded frames are handed over through a fixed set of shared-memory
+slots rather than pickled: the request thread copies the pixels into a
+free slot and sends only (task id, slot, shape, dtype, known boxes,
+detector backend) to a worker. The number of slots is the queue depth;
+when all are busy, new requests wait briefly and are then rejected. Callers block on the result
+with a per-task deadline.
+
+Workers use the 'spawn' start method, so the Flask process never forks
+while its threads hold locks.
+"""
+
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models import metrics
+
+DEFAULT_MAX_FRAME_BYTES = 1280 * 960 * 3
+
+BUSY_MESSAGE = "Face recognition is busy. Please try again."
+TIMEOUT_MESSAGE = "Face recognition timed out. Please try again."
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when no shared-memory slot became free in time"""
+
+
+def _attach_shared_memory(name):
+    """Attach to a segment created by the parent process"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned workers share the parent's resource tracker,
+        # so the duplicate registration is harmless and the parent still unlinks
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(slot_names, tasks, results, detection_width):
+    """Worker process: load the models once, then encode frames from shared memory"""
+    from models.face_recognition import FaceAnalysis
+
+    slots = [_attach_shared_memory(name) for name in slot_names]
+
+    # Warm up the detector so the first real frame does not pay for model setup
+    FaceAnalysis(np.zeros((240, 320, 3), dtype=np.uint8), detection_width).boxes
+    results.put(('ready', os.getpid(), None, 0.0, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        task_id, slot, shape, dtype, boxes, detector = task
+        start = time.perf_counter()
+        face_box = None
+        try:
+            image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=slots[slot].buf)
+            analysis = FaceAnalysis(image, detection_width, boxes, detector)
+            encoding, error = analysis.encoding
+            if boxes is None:
+                face_box = analysis.face_box
+        except Exception as e:
+            encoding, error = None, f"Error processing image: {str(e)}"
+        results.put((task_id, encoding, error, time.perf_counter() - start, face_box))
+
+    for segment in slots:
+        segment.close()
+
+
+class RecognitionExecutor:
+    """Pool of worker processes computing face encodings"""
+
+    def __init__(self, workers=2, queue_depth=8, task_timeout=5.0, slot_wait=0.5,
+                 max_frame_bytes=DEFAULT_MAX_FRAME_BYTES, detection_width=None):
+        from models.face_recognition import DEFAULT_DETECTION_WIDTH
+
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.task_timeout = task_timeout
+        self.slot_wait = slot_wait
+        self.max_frame_bytes = max_frame_bytes
+        self.detection_width = detection_width if detection_width is not None else DEFAULT_DETECTION_WIDTH
+
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._task_ids = itertools.count(1)
+        self._pending = {}  # task_id -> (future, slot, submitted_at)
+        self._processes = []
+        self._slots = []
+        self._ready = set()
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.inline = 0
+        self.restarts = 0
+        self.worker_seconds = 0.0
+        self.roundtrip_seconds = 0.0
+
+    def start(self, wait_ready=0.0):
+        """Create the shared-memory slots and spawn the workers"""
+        with self._lock:
+            if self._started:
+                return
+            context = multiprocessing.get_context('spawn')
+            self._context = context
+            self._slots = [shared_memory.SharedMemory(create=True, size=self.max_frame_bytes)
+                           for _ in range(self.queue_depth)]
+            self._free_slots = queue.Queue()
+            for slot in range(self.queue_depth):
+                self._free_slots.put(slot)
+
+            self._tasks = context.Queue()
+            self._results = context.Queue()
+            self._processes = [self._spawn() for _ in range(self.workers)]
+            self._dispatcher = threading.Thread(target=self._dispatch, name='recognition-dispatcher', daemon=True)
+            self._dispatcher.start()
+            self._started = True
+            atexit.register(self.shutdown)
+
+        deadline = time.monotonic() + wait_ready
+        while len(self._ready) < self.workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _spawn(self):
+        process = self._context.Process(
+            target=_worker_main, name='recognition-worker', daemon=True,
+            args=([slot.name for slot in self._slots], self._tasks, self._results, self.detection_width))
+        process.start()
+        return process
+
+    def _check_workers(self):
+        """Replace workers that died, e.g. after a crash inside dlib"""
+        with self._lock:
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    self._ready.discard(process.pid)
+                    self._processes[index] = self._spawn()
+                    self.restarts += 1
+
+    def _dispatch(self):
+        """Deliver worker results to waiting futures and recycle their slots"""
+        from models.face_recognition import analysis_outcome
+
+        last_reclaim = time.monotonic()
+        while not self._closed:
+            if time.monotonic() - last_reclaim > 1.0:
+                self._reclaim_abandoned()
+                last_reclaim = time.monotonic()
+            try:
+                task_id, encoding, error, seconds, face_box = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if task_id == 'ready':
+                self._ready.add(encoding)
+                continue
+
+            with self._lock:
+                entry = self._pending.pop(task_id, None)
+            if entry is None:
+                continue
+
+            future, slot, submitted_at = entry
+            self._free_slots.put(slot)
+            roundtrip = time.monotonic() - submitted_at
+            with self._lock:
+                self.completed += 1
+                self.worker_seconds += seconds
+                self.roundtrip_seconds += roundtrip
+            # Stages inside the worker are not visible here; record the pool round trip instead
+            metrics.STAGE_SECONDS.observe(roundtrip, stage='recognition_pool')
+            metrics.FACE_ANALYSES.inc(outcome=analysis_outcome(error))
+            if not future.done():
+                future.set_result((encoding, error, face_box))
+
+    def _reclaim_abandoned(self):
+        """Free slots of tasks whose worker never answered (e.g. it crashed)"""
+        cutoff = time.monotonic() - 2 * self.task_timeout
+        with self._lock:
+            stale = [task_id for task_id, (_, _, submitted_at) in self._pending.items() if submitted_at < cutoff]
+            entries = [self._pending.pop(task_id) for task_id in stale]
+        for future, slot, _ in entries:
+            self._free_slots.put(slot)
+            if not future.done():
+                future.set_result((None, TIMEOUT_MESSAGE, None))
+
+    def submit(self, image_array, boxes=None, detector='hog'):
+        """Copy a frame into shared memory and queue it; returns a Future of (encoding, error, face_box)"""
+        if not self._started:
+            self.start()
+        self._check_workers()
+
+        try:
+            slot = self._free_slots.get(timeout=self.slot_wait)
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusyError(BUSY_MESSAGE)
+
+        image_array = np.ascontiguousarray(image_array)
+        view = np.ndarray(image_array.shape, dtype=image_array.dtype, buffer=self._slots[slot].buf)
+        view[...] = image_array
+
+        future = Future()
+        task_id = next(self._task_ids)
+        with self._lock:
+            self._pending[task_id] = (future, slot, time.monotonic())
+            self.submitted += 1
+        self._tasks.put((task_id, slot, image_array.shape, image_array.dtype.str, boxes, detector))
+        return future
+
+    def extract_face(self, image_array, boxes=None, detector='hog'):
+        """Drop-in for FaceRecognitionSystem.extract_face, run in a worker"""
+        if image_array.nbytes > self.max_frame_bytes:
+            # Too large for a slot: process inline rather than fail the login
+            from models.face_recognition import FaceAnalysis
+            with self._lock:
+                self.inline += 1
+            try:
+                analysis = FaceAnalysis(image_array, self.detection_width, boxes, detector)
+                encoding, error = analysis.encoding
+                return encoding, error, (analysis.face_box if boxes is None else None)
+            except Exception as e:
+                return None, f"Error processing image: {str(e)}", None
+
+        try:
+            future = self.submit(image_array, boxes, detector)
+        except ExecutorBusyError as e:
+            return None, str(e), None
+
+        try:
+            return future.result(timeout=self.task_timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            return None, TIMEOUT_MESSAGE, None
+
+    def extract_face_encoding(self, image_array, boxes=None, detector='hog'):
+        """Drop-in for FaceRecognitionSystem.extract_face_encoding, run in a worker"""
+        encoding, error, _ = self.extract_face(image_array, boxes, detector)
+        return encoding, error
+
+    def extract_many(self, image_arrays, boxes=None, detector='hog'):
+        """Encode several frames in parallel; returns a list of (encoding, error, face_box)"""
+        futures = []
+        for index, image_array in enumerate(image_arrays):
+            frame_boxes = boxes[index] if boxes is not None else None
+            if image_array.nbytes > self.max_frame_bytes:
+                futures.append(self.extract_face(image_array, frame_boxes, detector))
+                continue
+            try:
+                futures.append(self.submit(image_array, frame_boxes, detector))
+            except ExecutorBusyError as e:
+                futures.append((None, str(e), None))
+
+        deadline = time.monotonic() + self.task_timeout
+        results = []
+        for future in futures:
+            if not isinstance(future, Future):
+                results.append(future)
+                continue
+            try:
+                results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                results.append((None, TIMEOUT_MESSAGE, None))
+        return results
+
+    def warm_up(self, wait_ready=60.0, detector='hog'):
+        """Start the workers and have each encode a synthetic frame; raises RuntimeError on failure"""
+        from models.warmup import synthetic_frame
+
+        self.start(wait_ready=wait_ready)
+        if len(self._ready) < self.workers:
+            raise RuntimeError(f"Only {len(self._ready)} of {self.workers} recognition workers started")
+        # A known box makes every worker run the encoder, not just the detector it warmed itself
+        image, box = synthetic_frame()
+        for _, error, _ in self.extract_many([image] * self.workers, [[box]] * self.workers, detector):
+            if error:
+                raise RuntimeError(error)
+
+    def stats(self):
+        """Counters describing pool health and latency"""
+        with self._lock:
+            completed = max(self.completed, 1)
+            return {
+                'workers': self.workers,
+                'workers_alive': sum(1 for process in self._processes if process.is_alive()),
+                'workers_ready': len(self._ready),
+                'queue_depth': self.queue_depth,
+                'in_flight': len(self._pending),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'inline': self.inline,
+                'restarts': self.restarts,
+                'mean_worker_ms': 1000 * self.worker_seconds / completed,
+                'mean_roundtrip_ms': 1000 * self.roundtrip_seconds / completed,
+            }
+
+    def shutdown(self, timeout=2.0):
+        """Stop the workers and release the shared memory"""
+        with self._lock:
+            if not self._started or self._closed:
+                return
+            self._closed = True
+
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        for future, _, _ in list(self._pending.values()):
+            if not future.done():
+                future.set_result((None, BUSY_MESSAGE, None))
+        self._pending.clear()
+
+        for segment in self._slots:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
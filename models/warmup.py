@@ -0,0 +1,112 @@
+"""
+Startup warmup and readiness.
+
+The first face login after a deploy used to pay for everything at once:
+importing dlib and OpenCV, loading the detector and encoder model files,
+dlib's first allocations, opening SQLite connections onto cold pages and
+catching the gallery up. A Warmup runs those steps on a background
+thread as soon as a worker starts and reports ready only when all of
+them finished, so a load balancer polling /readyz never sends traffic to
+a cold worker. /healthz stays a plain liveness check.
+
+    warmup = Warmup()
+
+    @warmup.step('gallery')
+    def warm_gallery():
+        db.sync_gallery()
+
+    warmup.start()
+"""
+
+import io
+import threading
+import time
+
+import numpy as np
+
+from models.lazy_import import lazy_import
+
+Image = lazy_import('PIL.Image')
+
+
+class Warmup:
+    """Named startup steps, run once in registration order, and the readiness they lead to"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.steps = []
+        self.results = {}  # step name -> {'seconds': ..., 'error': ...}
+        self.state = 'pending' if enabled else 'ready'
+        self.seconds = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def step(self, name):
+        """Decorator registering a warmup step"""
+        def register(function):
+            self.steps.append((name, function))
+            return function
+        return register
+
+    def start(self):
+        """Run the steps on a background thread; later calls do nothing"""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self.state = 'running'
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Run every step, even after one fails; a failed step keeps the worker unready"""
+        self.state = 'running'
+        start = time.perf_counter()
+        failed = False
+        for name, function in self.steps:
+            step_start = time.perf_counter()
+            try:
+                function()
+                self.results[name] = {'seconds': round(time.perf_counter() - step_start, 3)}
+            except Exception as e:
+                failed = True
+                print(f"Warmup step '{name}' failed: {e}")
+                self.results[name] = {'seconds': round(time.perf_counter() - step_start, 3), 'error': str(e)}
+        self.seconds = time.perf_counter() - start
+        self.state = 'failed' if failed else 'ready'
+
+    def wait(self, timeout=None):
+        """Block until a started warmup finishes; returns whether the worker is ready"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        return {'state': self.state, 'seconds': round(self.seconds, 3), 'steps': dict(self.results)}
+
+
+def synthetic_frame(width=640, height=480):
+    """Deterministic face-like RGB frame and the (top, right, bottom, left) box of its face
+
+    Detectors may or may not accept the drawn face; encoding with the
+    returned box runs the landmark and encoder models either way.
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[...] = (40 + 120 * x / width).astype(np.uint8)[..., None]
+    cy, cx, ry, rx = height // 2, width // 2, height // 4, height // 5
+    image[((y - cy) / ry) ** 2 + ((x - cx) / rx) ** 2 <= 1] = (224, 172, 140)
+    for eye_x in (cx - rx // 2, cx + rx // 2):
+        image[((y - cy + ry // 4) / (ry // 10)) ** 2 + ((x - eye_x) / (rx // 5)) ** 2 <= 1] = (40, 30, 30)
+    image[(abs(y - cy - ry // 2) <= ry // 20) & (abs(x - cx) <= rx // 2)] = (150, 60, 60)
+    return image, (cy - ry, cx + rx, cy + ry, cx - rx)
+
+
+def jpeg_bytes(image_array, quality=90):
+    """JPEG encoding of an RGB frame, as a browser would upload it"""
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
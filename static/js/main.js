@@ -213,6 +213,10 @@ function removeLoadingState(button) {
 }
 
 // Camera and Face Recognition Utilities
+function canvasToBlob(canvas, type = 'image/jpeg', quality = 0.8) {
+    return new Promise(resolve => canvas.toBlob(resolve, type, quality));
+}
+
 class CameraManager {
     constructor() {
         this.stream = null;
@@ -255,6 +259,24 @@ class CameraManager {
         return this.canvas.toDataURL('image/jpeg', 0.8);
     }
     
+    drawFrame() {
+        if (!this.video || !this.canvas) {
+            return null;
+        }
+        
+        this.canvas.width = this.video.videoWidth;
+        this.canvas.height = this.video.videoHeight;
+        this.ctx.drawImage(this.video, 0, 0);
+        
+        return this.canvas;
+    }
+    
+    captureBlob(type = 'image/jpeg', quality = 0.8) {
+        // Binary JPEG for the /frame upload endpoints: no base64 inflation or JSON wrapping
+        const canvas = this.drawFrame();
+        return canvas ? canvasToBlob(canvas, type, quality) : Promise.resolve(null);
+    }
+    
     stop() {
         if (this.stream) {
             this.stream.getTracks().forEach(track => track.stop());
@@ -271,6 +293,187 @@ class CameraManager {
     }
 }
 
+// Client-side face cropping: once the face position is known, from the browser's
+// FaceDetector where available or else the box the server last detected, only a
+// fixed-size square around the face is uploaded instead of the whole frame
+class FaceCropper {
+    constructor({ enabled = false, size = 200, margin = 0.25, maxBoxAge = 2000 } = {}) {
+        this.enabled = enabled;
+        this.size = size;
+        this.margin = margin;
+        this.maxBoxAge = maxBoxAge;
+        this.lastBox = null;
+        this.lastBoxTime = 0;
+        this.canvas = document.createElement('canvas');
+        this.canvas.width = size;
+        this.canvas.height = size;
+        this.ctx = this.canvas.getContext('2d');
+        this.detector = enabled && 'FaceDetector' in window
+            ? new window.FaceDetector({ maxDetectedFaces: 1, fastMode: true })
+            : null;
+    }
+    
+    update(response) {
+        // A fresh server detection refreshes the box; a failed attempt falls back to a full frame
+        if (response.face_box) {
+            this.lastBox = response.face_box;
+            this.lastBoxTime = Date.now();
+        } else if (!response.success) {
+            this.lastBox = null;
+        }
+    }
+    
+    async estimateBox(canvas) {
+        // Face box as [top, right, bottom, left] in canvas pixels, or null
+        if (this.detector) {
+            try {
+                const faces = await this.detector.detect(canvas);
+                if (faces.length === 1) {
+                    const box = faces[0].boundingBox;
+                    return [box.top, box.right, box.bottom, box.left];
+                }
+            } catch (error) {
+                this.detector = null;
+            }
+        }
+        
+        if (this.lastBox && Date.now() - this.lastBoxTime < this.maxBoxAge) {
+            return this.lastBox;
+        }
+        return null;
+    }
+    
+    async crop(canvas) {
+        const box = this.enabled ? await this.estimateBox(canvas) : null;
+        if (!box) {
+            return null;
+        }
+        
+        // Square around the face padded by `margin` on every side; the server relies on
+        // this geometry, so crops that would leave the frame are not sent
+        const [top, right, bottom, left] = box;
+        const side = Math.round(Math.max(right - left, bottom - top) * (1 + 2 * this.margin));
+        const x = Math.round((left + right - side) / 2);
+        const y = Math.round((top + bottom - side) / 2);
+        if (x < 0 || y < 0 || x + side > canvas.width || y + side > canvas.height) {
+            return null;
+        }
+        
+        this.ctx.drawImage(canvas, x, y, side, side, 0, 0, this.size, this.size);
+        const blob = await canvasToBlob(this.canvas, 'image/jpeg', 0.9);
+        return { blob, crop: [x, y, side, side].join(',') };
+    }
+    
+    async frameUpload(canvas) {
+        // {blob, params} for the /frame endpoints: a face crop when possible, else the full frame
+        const face = await this.crop(canvas);
+        if (face) {
+            return { blob: face.blob, params: { crop: face.crop } };
+        }
+        return { blob: await canvasToBlob(canvas, 'image/jpeg', 0.8), params: {} };
+    }
+}
+
+// Frame bursts for the streaming endpoints: each JPEG is sent as a 4-byte big-endian
+// length followed by its bytes, all in one request body (application/x-face-frames)
+class FrameBurst {
+    constructor(cameraManager, { frames = 10, interval = 150, quality = 0.8 } = {}) {
+        this.cameraManager = cameraManager;
+        this.frames = frames;
+        this.interval = interval;
+        this.quality = quality;
+    }
+    
+    async capture(onFrame = null) {
+        const parts = [];
+        for (let i = 0; i < this.frames; i++) {
+            const blob = await this.cameraManager.captureBlob('image/jpeg', this.quality);
+            if (blob) {
+                const header = new DataView(new ArrayBuffer(4));
+                header.setUint32(0, blob.size);
+                parts.push(header.buffer, blob);
+                if (onFrame) {
+                    onFrame(i + 1, blob);
+                }
+            }
+            if (i < this.frames - 1) {
+                await new Promise(resolve => setTimeout(resolve, this.interval));
+            }
+        }
+        return new Blob(parts, { type: 'application/x-face-frames' });
+    }
+}
+
+// Continuous upload for /face-login/stream: frames are produced while the request is in
+// flight and stop as soon as the server answers. Browsers that cannot stream request
+// bodies (or connections without HTTP/2) fall back to one buffered burst.
+class FrameStreamer {
+    constructor(source, { maxFrames = 30, interval = 100, bufferedFrames = 8, quality = 0.8 } = {}) {
+        this.source = source;  // anything with captureBlob(type, quality), e.g. a CameraManager
+        this.maxFrames = maxFrames;
+        this.interval = interval;
+        this.bufferedFrames = bufferedFrames;
+        this.quality = quality;
+    }
+    
+    static get supportsRequestStreams() {
+        let duplexAccessed = false;
+        const hasContentType = new Request('', {
+            body: new ReadableStream(),
+            method: 'POST',
+            get duplex() {
+                duplexAccessed = true;
+                return 'half';
+            }
+        }).headers.has('Content-Type');
+        return duplexAccessed && !hasContentType;
+    }
+    
+    async post(url) {
+        if (FrameStreamer.supportsRequestStreams) {
+            try {
+                return await this.postStream(url);
+            } catch (error) {
+                console.warn('Streaming upload unavailable, sending a buffered burst:', error);
+            }
+        }
+        const burst = new FrameBurst(this.source, { frames: this.bufferedFrames, interval: this.interval, quality: this.quality });
+        return ApiClient.postFrame(url, await burst.capture());
+    }
+    
+    async postStream(url) {
+        let sent = 0;
+        let answered = false;
+        const body = new ReadableStream({
+            pull: async controller => {
+                if (answered || sent >= this.maxFrames) {
+                    controller.close();
+                    return;
+                }
+                if (sent > 0) {
+                    await new Promise(resolve => setTimeout(resolve, this.interval));
+                }
+                const blob = await this.source.captureBlob('image/jpeg', this.quality);
+                if (blob) {
+                    const header = new DataView(new ArrayBuffer(4));
+                    header.setUint32(0, blob.size);
+                    controller.enqueue(new Uint8Array(await new Blob([header.buffer, blob]).arrayBuffer()));
+                }
+                sent++;
+            }
+        });
+        
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/x-face-frames' },
+            body,
+            duplex: 'half'
+        });
+        answered = true;
+        return await response.json();
+    }
+}
+
 // Notification System
 class NotificationManager {
     static show(message, type = 'info', duration = 5000) {
@@ -344,6 +547,25 @@ class ApiClient {
         }
     }
     
+    static async postFrame(url, blob, params = {}) {
+        // Send an image Blob as the raw request body; extra fields go in the query string
+        const query = new URLSearchParams(params).toString();
+        try {
+            const response = await fetch(query ? `${url}?${query}` : url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': blob.type || 'image/jpeg',
+                },
+                body: blob
+            });
+            
+            return await response.json();
+        } catch (error) {
+            console.error('API request failed:', error);
+            throw new Error('Network error occurred');
+        }
+    }
+    
     static async get(url) {
         try {
             const response = await fetch(url);
@@ -466,7 +688,11 @@ window.addEventListener('unhandledrejection', function(e) {
 });
 
 // Expose utilities globally
+window.canvasToBlob = canvasToBlob;
 window.CameraManager = CameraManager;
+window.FaceCropper = FaceCropper;
+window.FrameBurst = FrameBurst;
+window.FrameStreamer = FrameStreamer;
 window.NotificationManager = NotificationManager;
 window.ApiClient = ApiClient;
 window.FormValidator = FormValidator;
@@ -0,0 +1,58 @@
+"""
+Tests for the IVF approximate matcher: tombstone compaction and
+reloading its trained state from a snapshot.
+"""
+
+import numpy as np
+
+from models import ann_index, gallery_snapshot
+from models.ann_index import IVFIndex
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).astype(np.float32)
+
+
+def test_ivf_compacts_tombstones():
+    """Replacing many users in a trained IVF index compacts the tombstoned rows"""
+    index = IVFIndex(nlist=4, min_train_size=100, retrain_growth=None)
+    encodings = random_encodings(200)
+    index.add_many(np.arange(1, 201), encodings)
+    assert index.is_trained
+
+    replacements = random_encodings(60, seed=1)
+    for user_id, encoding in zip(range(1, 61), replacements):
+        index.add(user_id, encoding)
+
+    assert len(index.live_rows()[0]) == 200
+    assert sum(inverted.count for inverted in index.lists) < 260
+    assert index.match(replacements[0])[0] == 1
+
+
+def test_trained_index_loads_without_retraining(tmp_path, monkeypatch):
+    """An IVF index saved with its trained state is rebuilt without k-means"""
+    index = IVFIndex(nlist=8, min_train_size=100)
+    encodings = random_encodings(300)
+    index.add_many(np.arange(1, 301), encodings)
+    header = gallery_snapshot.save_gallery(index, str(tmp_path))
+    assert header['index']['kind'] == 'ivf'
+
+    def fail(*args, **kwargs):
+        raise AssertionError('k-means ran while loading a trained snapshot')
+
+    monkeypatch.setattr(ann_index, 'kmeans', fail)
+    loaded = IVFIndex(nlist=8, min_train_size=100)
+    assert gallery_snapshot.load_into_gallery(loaded, str(tmp_path))
+    assert loaded.is_trained
+    assert len(loaded) == 300
+    for row in (0, 150, 299):
+        assert loaded.match(encodings[row]) == index.match(encodings[row])
+
+
+def test_gallery_options_from_environment():
+    """FACE_MATCHER picks the backend and FACE_MATCHER_* variables tune the IVF index"""
+    index = ann_index.create_gallery_from_env({'FACE_MATCHER': 'ivf', 'FACE_MATCHER_NPROBE': '16',
+                                               'FACE_MATCHER_PQ_M': '8', 'FACE_MATCHER_MIN_TRAIN_SIZE': '500'})
+    assert isinstance(index, IVFIndex)
+    assert (index.nprobe, index.pq_m, index.min_train_size, index.nlist) == (16, 8, 500, None)
+    assert not isinstance(ann_index.create_gallery_from_env({'FACE_MATCHER_NPROBE': '16'}), IVFIndex)
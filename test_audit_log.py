@@ -0,0 +1,67 @@
+"""
+Tests for the batched audit log writer.
+"""
+
+from models.audit_log import AuditLogWriter
+from models.connection_pool import ConnectionPool
+
+INSERT_SQL = 'INSERT INTO attempts (username, success) VALUES (?, ?)'
+
+
+def make_pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'audit.db'), max_size=2)
+    conn = pool.connect()
+    conn.execute('CREATE TABLE attempts (username TEXT, success BOOLEAN)')
+    conn.commit()
+    conn.close()
+    return pool
+
+
+def count_rows(pool):
+    conn = pool.connect()
+    count = conn.execute('SELECT COUNT(*) FROM attempts').fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_flush_writes_every_row(tmp_path):
+    """flush() returns once every submitted row is in the table, in batches"""
+    pool = make_pool(tmp_path)
+    writer = AuditLogWriter(pool, INSERT_SQL, batch_size=50, flush_interval_ms=10)
+    for row in range(500):
+        assert writer.submit((f'user{row}', row % 2 == 0))
+    writer.flush()
+
+    assert count_rows(pool) == 500
+    stats = writer.stats()
+    assert stats['flushed'] == 500
+    assert stats['pending'] == 0
+    assert stats['batches'] >= 10
+    writer.close()
+    pool.close()
+
+
+def test_close_drains_and_drops_later_rows(tmp_path):
+    """close() writes what is queued; rows submitted afterwards are dropped"""
+    pool = make_pool(tmp_path)
+    writer = AuditLogWriter(pool, INSERT_SQL, flush_interval_ms=10)
+    for row in range(20):
+        writer.submit((f'user{row}', True))
+    writer.close()
+
+    assert count_rows(pool) == 20
+    assert not writer.submit(('late', True))
+    assert writer.stats()['dropped'] == 1
+    pool.close()
+
+
+def test_failed_batches_are_counted(tmp_path):
+    """A batch that cannot be written is counted as failed, not retried forever"""
+    pool = make_pool(tmp_path)
+    writer = AuditLogWriter(pool, 'INSERT INTO missing_table VALUES (?, ?)', flush_interval_ms=10)
+    writer.submit(('user', True))
+    writer.flush()
+
+    assert writer.stats()['failed'] == 1
+    writer.close()
+    pool.close()
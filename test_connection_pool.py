@@ -0,0 +1,72 @@
+"""
+Tests for the SQLite connection pool: reuse, exhaustion and waiting for
+a released connection.
+"""
+
+import threading
+import time
+
+import pytest
+
+from models.connection_pool import ConnectionPool, PoolExhaustedError
+
+
+def test_connections_are_reused(tmp_path):
+    """Closing a pooled connection returns it for the next caller"""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=2)
+    conn = pool.connect()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.close()
+
+    conn = pool.connect()
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    conn.close()
+    assert pool.created == 1
+    assert pool.acquired == 2
+    pool.close()
+
+
+def test_exhausted_pool_times_out(tmp_path):
+    """With every connection checked out, acquire gives up after the timeout"""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=1, timeout=0.1)
+    held = pool.connect()
+
+    start = time.perf_counter()
+    with pytest.raises(PoolExhaustedError):
+        pool.connect()
+    assert time.perf_counter() - start >= 0.1
+
+    held.close()
+    pool.connect().close()
+    pool.close()
+
+
+def test_waiter_gets_released_connection(tmp_path):
+    """A caller waiting on a full pool gets the connection another thread releases"""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=1, timeout=5.0)
+    held = pool.connect()
+    timer = threading.Timer(0.05, held.close)
+    timer.start()
+
+    conn = pool.connect()
+    conn.close()
+    timer.join()
+    assert pool.created == 1
+    assert pool.waits == 1
+    pool.close()
+
+
+def test_rolled_back_on_release(tmp_path):
+    """Uncommitted writes are rolled back when a connection returns to the pool"""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=1)
+    conn = pool.connect()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    conn.close()
+
+    conn = pool.connect()
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    conn.close()
+    pool.close()
@@ -0,0 +1,121 @@
+"""
+Tests for the content-addressed encoding cache: keys, TTL expiry, the
+entry and byte budgets, and which results are cached.
+"""
+
+import time
+
+import numpy as np
+
+from models.encoding_cache import ENTRY_OVERHEAD_BYTES, EncodingCache, frame_key
+from models.face_recognition import MULTIPLE_FACES_MESSAGE, NO_FACE_MESSAGE
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).astype(np.float64)
+
+
+def encoded(encoding):
+    return (encoding, None, (0, 10, 10, 0))
+
+
+def test_frame_key_covers_boxes_and_detector():
+    """The same bytes with other boxes or another detector get another key"""
+    data = b'\xff\xd8jpeg bytes'
+    assert frame_key(data) == frame_key(data)
+    assert frame_key(data) != frame_key(data, boxes=[(0, 10, 10, 0)])
+    assert frame_key(data) != frame_key(data, detector='cnn')
+    assert frame_key('data:image/jpeg;base64,AAAA') != frame_key(b'data:image/jpeg;base64,AAAA')
+
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    assert frame_key(image) != frame_key(image.reshape(4, 12, 1))
+
+
+def test_hit_returns_stored_result():
+    """A second lookup is served from the cache and the encoding is read-only"""
+    cache = EncodingCache()
+    encoding = random_encodings(1)[0]
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return encoded(encoding)
+
+    first = cache.get_or_compute(b'key', compute)
+    second = cache.get_or_compute(b'key', compute)
+    assert len(calls) == 1
+    assert second is first
+    assert not second[0].flags.writeable
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl():
+    """An entry older than ttl is dropped on lookup and counted as expired"""
+    cache = EncodingCache(ttl=0.05)
+    cache.put(b'key', encoded(random_encodings(1)[0]))
+    assert cache.get(b'key') is not None
+
+    time.sleep(0.1)
+    assert cache.get(b'key') is None
+    assert len(cache) == 0
+    assert cache.bytes == 0
+    assert cache.stats()['expirations'] == 1
+
+
+def test_byte_budget_evicts_least_recently_used():
+    """Going over max_bytes evicts from the cold end until the cache fits"""
+    encodings = random_encodings(4)
+    entry_size = ENTRY_OVERHEAD_BYTES + 2 + encodings[0].nbytes
+    cache = EncodingCache(max_entries=100, max_bytes=3 * entry_size)
+    for index in range(3):
+        cache.put(b'k%d' % index, encoded(encodings[index]))
+    assert cache.bytes == 3 * entry_size
+
+    # Touch k0 so k1 is the coldest entry
+    cache.get(b'k0')
+    cache.put(b'k3', encoded(encodings[3]))
+    assert cache.get(b'k1') is None
+    assert all(cache.get(key) is not None for key in (b'k0', b'k2', b'k3'))
+    assert cache.bytes == 3 * entry_size
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entry_budget_evicts_oldest():
+    """max_entries bounds the entry count regardless of size"""
+    cache = EncodingCache(max_entries=2)
+    for index, encoding in enumerate(random_encodings(3)):
+        cache.put(b'k%d' % index, encoded(encoding))
+    assert len(cache) == 2
+    assert cache.get(b'k0') is None
+
+
+def test_replacing_a_key_keeps_byte_count():
+    """Storing a key twice accounts for its bytes once"""
+    cache = EncodingCache()
+    encodings = random_encodings(2)
+    cache.put(b'key', encoded(encodings[0]))
+    size = cache.bytes
+    cache.put(b'key', encoded(encodings[1]))
+    assert cache.bytes == size
+    assert len(cache) == 1
+
+
+def test_only_deterministic_results_are_cached():
+    """No-face and multiple-face verdicts are cached; other errors are not"""
+    cache = EncodingCache()
+    assert cache.put(b'none', (None, NO_FACE_MESSAGE, None))
+    assert cache.put(b'many', (None, MULTIPLE_FACES_MESSAGE, None))
+    assert not cache.put(b'busy', (None, "Face recognition is busy, please try again", None))
+    assert not cache.put(b'decode', (None, "Error processing image: cannot identify image file", None))
+    assert cache.get(b'none') == (None, NO_FACE_MESSAGE, None)
+    assert cache.get(b'busy') is None
+
+
+def test_errors_are_recomputed():
+    """get_or_compute runs compute again after a transient error"""
+    cache = EncodingCache()
+    results = [(None, "Error processing image: timeout", None), encoded(random_encodings(1)[0])]
+    assert cache.get_or_compute(b'key', lambda: results.pop(0))[1] is not None
+    assert cache.get_or_compute(b'key', lambda: results.pop(0))[1] is None
+    assert len(cache) == 1
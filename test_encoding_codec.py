@@ -0,0 +1,71 @@
+"""
+Tests for the face encoding codec: the binary format, legacy pickled
+encodings and refusal of anything but plain numpy arrays.
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from models.encoding_codec import (ENCODED_SIZE, decode_encoding, decode_many, decode_valid,
+                                   encode_encoding, is_legacy_blob)
+
+
+def sample_encoding(seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, 128)
+
+
+class Exploit:
+    def __reduce__(self):
+        return os.system, ('echo unpickled',)
+
+
+def test_round_trip():
+    """Encodings survive the binary format at float32 precision"""
+    encoding = sample_encoding()
+    blob = encode_encoding(encoding)
+    assert len(blob) == ENCODED_SIZE
+    assert not is_legacy_blob(blob)
+    np.testing.assert_allclose(decode_encoding(blob), encoding, rtol=1e-6, atol=1e-7)
+
+
+def test_empty_values():
+    """None encodes to None and empty blobs decode to None"""
+    assert encode_encoding(None) is None
+    assert decode_encoding(None) is None
+    assert decode_encoding(b'') is None
+    assert decode_many([]).shape == (0, 128)
+
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_legacy_pickles(protocol):
+    """Encodings pickled by older versions decode with every pickle protocol"""
+    encoding = sample_encoding(protocol)
+    blob = pickle.dumps(encoding, protocol=protocol)
+    assert is_legacy_blob(blob)
+    np.testing.assert_allclose(decode_encoding(blob), encoding.astype(np.float32))
+
+
+def test_refuses_untrusted_classes():
+    """A pickle that would call anything but numpy is refused, not executed"""
+    blob = pickle.dumps(Exploit(), protocol=2)
+    with pytest.raises(pickle.UnpicklingError):
+        decode_encoding(blob)
+
+
+def test_decode_many_mixed_formats():
+    """Binary and legacy rows decode together in order"""
+    encodings = [sample_encoding(seed) for seed in range(3)]
+    blobs = [encode_encoding(encodings[0]), pickle.dumps(encodings[1]), encode_encoding(encodings[2])]
+    np.testing.assert_allclose(decode_many(blobs), np.array(encodings, dtype=np.float32), rtol=1e-6, atol=1e-7)
+
+
+def test_decode_valid_skips_bad_rows():
+    """Unreadable rows are skipped and the positions of the others kept"""
+    blobs = [encode_encoding(sample_encoding(1)), pickle.dumps(Exploit()), b'\x07garbage',
+             encode_encoding(sample_encoding(2))]
+    positions, matrix = decode_valid(blobs)
+    assert positions == [0, 3]
+    assert matrix.shape == (2, 128)
@@ -0,0 +1,99 @@
+"""
+Tests for the server-side enrollment store: the running statistics,
+completion, expiry and the enrollment cap.
+"""
+
+import time
+
+import numpy as np
+
+from models.enrollment_store import Enrollment, EnrollmentStore
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).astype(np.float32)
+
+
+def test_running_mean_and_variance():
+    """Welford's mean and variance agree with numpy over all captures"""
+    encodings = random_encodings(50)
+    enrollment = Enrollment()
+    for encoding in encodings:
+        enrollment.add(encoding)
+
+    assert enrollment.count == 50
+    np.testing.assert_allclose(enrollment.mean, encodings.mean(axis=0), atol=1e-6)
+    np.testing.assert_allclose(enrollment.variance, encodings.var(axis=0, ddof=1), rtol=1e-4)
+    assert abs(enrollment.spread - np.sqrt(encodings.var(axis=0, ddof=1)).mean()) < 1e-5
+
+
+def test_single_capture_has_no_spread():
+    """One capture is its own mean, with zero variance"""
+    encoding = random_encodings(1)[0]
+    enrollment = Enrollment()
+    enrollment.add(encoding)
+    np.testing.assert_array_equal(enrollment.mean, encoding)
+    assert enrollment.spread == 0.0
+
+
+def test_add_and_complete():
+    """Captures fold into the enrollment named by the capture id"""
+    store = EnrollmentStore()
+    capture_id = store.create()
+    encodings = random_encodings(3)
+    for encoding in encodings:
+        enrollment = store.add(capture_id, encoding)
+    assert enrollment.count == 3
+    np.testing.assert_allclose(store.get(capture_id).mean, encodings.mean(axis=0), atol=1e-6)
+
+    assert store.complete(capture_id).completed
+    store.complete(capture_id)
+    assert store.stats()['completed'] == 1
+
+
+def test_unknown_and_discarded_ids():
+    """Unknown, empty and discarded capture ids have no enrollment"""
+    store = EnrollmentStore()
+    capture_id = store.create()
+    assert store.get(None) is None
+    assert store.add('not-an-id', random_encodings(1)[0]) is None
+
+    store.discard(capture_id)
+    assert store.get(capture_id) is None
+    assert len(store) == 0
+
+
+def test_idle_enrollments_expire():
+    """An enrollment not touched within ttl is dropped"""
+    store = EnrollmentStore(ttl=0.05)
+    capture_id = store.create()
+    store.add(capture_id, random_encodings(1)[0])
+
+    time.sleep(0.1)
+    assert store.add(capture_id, random_encodings(1)[0]) is None
+    assert store.stats()['expired'] == 1
+    assert len(store) == 0
+
+
+def test_touching_keeps_an_enrollment_alive():
+    """Each capture resets the idle clock"""
+    store = EnrollmentStore(ttl=0.15)
+    capture_id = store.create()
+    for encoding in random_encodings(4):
+        time.sleep(0.05)
+        assert store.add(capture_id, encoding) is not None
+    assert store.get(capture_id).count == 4
+
+
+def test_cap_evicts_least_recently_touched():
+    """Past max_enrollments the least recently touched enrollment goes first"""
+    store = EnrollmentStore(max_enrollments=2)
+    first = store.create()
+    second = store.create()
+    store.get(first)
+    third = store.create()
+
+    assert store.get(second) is None
+    assert store.get(first) is not None
+    assert store.get(third) is not None
+    assert store.stats()['expired'] == 1
@@ -0,0 +1,119 @@
+"""
+Tests for the in-memory face gallery: matching, catch-up syncs from
+SQLite and tombstones for replaced encodings.
+"""
+
+import threading
+
+import numpy as np
+
+from models.database import Database
+from models.encoding_codec import encode_encoding
+from models.face_gallery import FaceGallery
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).astype(np.float32)
+
+
+def test_match_and_miss():
+    """The closest encoding within tolerance wins; anything farther is no match"""
+    gallery = FaceGallery(initial_capacity=2)
+    encodings = random_encodings(10)
+    gallery.add_many(np.arange(1, 11), encodings)
+
+    user_id, distance = gallery.match(encodings[4])
+    assert user_id == 5
+    assert distance < 1e-6
+    assert gallery.match(encodings[4] + 1.0) is None
+    assert gallery.match_many([encodings[0], encodings[9]]) == [(1, gallery.match(encodings[0])[1]),
+                                                               (10, gallery.match(encodings[9])[1])]
+
+
+def test_replaced_encoding_is_tombstoned():
+    """Re-enrolling a user replaces their old encoding"""
+    gallery = FaceGallery()
+    old, new = random_encodings(2)
+    gallery.add(1, old)
+    gallery.add(1, new)
+
+    ids, matrix, _ = gallery.live_rows()
+    assert ids.tolist() == [1]
+    np.testing.assert_array_equal(matrix[0], new)
+    assert gallery.match(old, tolerance=0.01) is None
+    assert gallery.match(new)[0] == 1
+
+
+def test_concurrent_syncs_add_each_row_once(tmp_path):
+    """Concurrent catch-up syncs never append the same enrollment twice"""
+    db = Database(str(tmp_path / 'users.db'))
+    encodings = random_encodings(50)
+    conn = db.get_connection()
+    for row, encoding in enumerate(encodings):
+        conn.execute('INSERT INTO users (username, password_hash, first_name, last_name, gender, face_encoding) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (f'user{row}', 'x', 'First', 'Last', 'other',
+                                                   encode_encoding(encoding)))
+    conn.commit()
+    conn.close()
+
+    threads = [threading.Thread(target=db.sync_gallery) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(db.gallery) == 50
+    assert db.gallery.high_water == 50
+    assert db.get_user_by_face(encodings[7])['username'] == 'user7'
+
+
+def test_matches_do_not_wait_for_a_sync_query():
+    """A sync's query runs outside the gallery lock, so matches proceed meanwhile"""
+    gallery = FaceGallery()
+    encodings = random_encodings(3)
+    gallery.add_many([1, 2], encodings[:2])
+    querying, release = threading.Event(), threading.Event()
+
+    def fetch(high_water):
+        querying.set()
+        release.wait(5)
+        return [3], [3], encodings[2:], 3, 1
+
+    sync = threading.Thread(target=gallery.catch_up, args=(fetch,))
+    sync.start()
+    assert querying.wait(5)
+    matched = []
+    matcher = threading.Thread(target=lambda: matched.append(gallery.match(encodings[0])))
+    matcher.start()
+    matcher.join(1)
+    release.set()
+    sync.join()
+    assert matched and matched[0][0] == 1
+    assert gallery.match(encodings[2])[0] == 3
+
+
+def test_overlapping_syncs_skip_rows_already_added():
+    """Rows a concurrent sync already added are not appended again"""
+    gallery = FaceGallery()
+    encodings = random_encodings(4)
+    gallery.add_many([1, 2], encodings[:2])
+
+    def stale(high_water):
+        # As if the query ran before rows 1 and 2 were added by another sync
+        return [1, 2, 3, 4], [1, 2, 3, 4], encodings, 4, 4
+
+    assert gallery.catch_up(stale) == 4
+    assert len(gallery) == 4
+    assert gallery.high_water == 4
+
+
+def test_sync_picks_up_new_enrollments(tmp_path):
+    """Users created after the first sync are matched on the next lookup"""
+    db = Database(str(tmp_path / 'users.db'))
+    first, second = random_encodings(2)
+    db.create_user('alice', 'pw', 'Alice', 'A', 'other', first)
+    assert db.get_user_by_face(first)['username'] == 'alice'
+
+    db.create_user('bob', 'pw', 'Bob', 'B', 'other', second)
+    assert db.get_user_by_face(second)['username'] == 'bob'
+    assert len(db.gallery) == 2
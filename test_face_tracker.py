@@ -0,0 +1,106 @@
+"""
+Tests for the video-login face tracker, with the detector replaced by one
+that reports where the synthetic face was drawn.
+"""
+
+import numpy as np
+import pytest
+
+from models import face_tracker
+from models.face_tracker import FaceTracker
+
+FACE_SIZE = 120
+
+
+def textured(shape, seed):
+    """Smooth random texture, so template matching has something to lock on to"""
+    coarse = np.random.default_rng(seed).integers(0, 256, (shape[0] // 8 + 1, shape[1] // 8 + 1), dtype=np.uint8)
+    return np.kron(coarse, np.ones((8, 8), dtype=np.uint8))[:shape[0], :shape[1]]
+
+
+BACKGROUND = textured((480, 640), seed=0) // 4
+FACE = textured((FACE_SIZE, FACE_SIZE), seed=1)
+
+
+def frame_with_face(top, left, face=True):
+    gray = BACKGROUND.copy()
+    if face:
+        gray[top:top + FACE_SIZE, left:left + FACE_SIZE] = FACE
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    """Stub detector returning the boxes queued in detector.boxes (the last one repeats)"""
+    class Detector:
+        boxes = []
+        calls = 0
+
+    def locate_faces(image, detection_width, model):
+        Detector.calls += 1
+        return Detector.boxes.pop(0) if len(Detector.boxes) > 1 else Detector.boxes[0]
+
+    monkeypatch.setattr(face_tracker, 'locate_faces', locate_faces)
+    return Detector
+
+
+def box_at(top, left):
+    return (top, left + FACE_SIZE, top + FACE_SIZE, left)
+
+
+def test_detects_every_nth_frame(detector):
+    """The detector runs on every detect_every-th frame and tracking fills the rest"""
+    detector.boxes = [[box_at(100, 200)]]
+    tracker = FaceTracker(detect_every=5)
+    boxes = [tracker.update(frame_with_face(100, 200)) for _ in range(10)]
+
+    assert detector.calls == 2
+    assert tracker.stats() == {'frames': 10, 'detections': 2, 'tracked': 8, 'lost': 0}
+    for box in boxes:
+        assert max(abs(a - b) for a, b in zip(box, box_at(100, 200))) <= 2
+
+
+def test_follows_a_moving_face(detector):
+    """Tracked boxes follow the face between detections"""
+    detector.boxes = [[box_at(100, 200)]]
+    tracker = FaceTracker(detect_every=100)
+    tracker.update(frame_with_face(100, 200))
+
+    for step in range(1, 6):
+        top, left = 100 + 4 * step, 200 + 6 * step
+        box = tracker.update(frame_with_face(top, left))
+        assert max(abs(a - b) for a, b in zip(box, box_at(top, left))) <= 4
+    assert detector.calls == 1
+
+
+def test_lost_face_detects_again(detector):
+    """When the face leaves, tracking gives up and the next frame detects"""
+    detector.boxes = [[box_at(100, 200)], [], [box_at(100, 200)]]
+    tracker = FaceTracker(detect_every=100)
+    tracker.update(frame_with_face(100, 200))
+
+    assert tracker.update(frame_with_face(100, 200, face=False)) is None
+    assert tracker.lost == 1
+    assert tracker.update(frame_with_face(100, 200, face=False)) is None
+    assert tracker.update(frame_with_face(100, 200)) is not None
+    assert detector.calls == 3
+
+
+def test_stable_frames(detector):
+    """stable_frames counts frames the box stayed put and resets on a jump"""
+    detector.boxes = [[box_at(100, 200)], [box_at(100, 200)], [box_at(300, 450)]]
+    tracker = FaceTracker(detect_every=1)
+    tracker.update(frame_with_face(100, 200))
+    tracker.update(frame_with_face(100, 200))
+    assert tracker.stable_frames == 1
+
+    tracker.update(frame_with_face(300, 450))
+    assert tracker.stable_frames == 0
+
+
+def test_needs_exactly_one_face(detector):
+    """No face, or more than one, gives no box"""
+    detector.boxes = [[box_at(100, 200), box_at(300, 450)]]
+    tracker = FaceTracker()
+    assert tracker.update(frame_with_face(100, 200)) is None
+    assert tracker.box is None
@@ -0,0 +1,85 @@
+"""
+Tests for the vectorized simple-AI feature matcher against the old
+per-user calculate_similarity, kept verbatim in benchmarks/feature_matcher.py.
+"""
+
+import json
+
+import numpy as np
+
+from benchmarks.feature_matcher import calculate_similarity, face_images, noisy, reference_features
+from models.feature_gallery import (FeatureGallery, decode_features, encode_features, feature_vector,
+                                    features_to_vector)
+
+
+def legacy_json(features):
+    """Features as the old app stored them: a JSON dict of floats and lists"""
+    return json.dumps({name: value if isinstance(value, list) else float(value) for name, value in features.items()})
+
+
+def test_scores_match_reference():
+    """Every user's score matches the old loop, including constant histograms"""
+    rng = np.random.default_rng(0)
+    enrolled = face_images(40)
+    gallery = FeatureGallery(initial_capacity=8)
+    gallery.add_many(np.arange(1, 41), [feature_vector(image) for image in enrolled])
+    stored = [reference_features(image) for image in enrolled]
+
+    for query in [noisy(enrolled[index], rng) for index in (0, 17, 39)] + [enrolled[-1]]:
+        query_features = reference_features(query)
+        expected = [calculate_similarity(query_features, features) for features in stored]
+        ids, scores = gallery.scores(feature_vector(query))
+        assert ids.tolist() == list(range(1, 41))
+        np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+
+def test_match_picks_reference_best():
+    """match() returns the same user as the old best-score scan"""
+    rng = np.random.default_rng(1)
+    enrolled = face_images(30)
+    gallery = FeatureGallery()
+    gallery.add_many(np.arange(1, 31), [feature_vector(image) for image in enrolled])
+
+    query = noisy(enrolled[12], rng)
+    user_id, similarity = gallery.match(feature_vector(query), tolerance=0.7)
+    query_features = reference_features(query)
+    expected = [calculate_similarity(query_features, reference_features(image)) for image in enrolled]
+    assert user_id == int(np.argmax(expected)) + 1
+    assert abs(similarity - max(expected)) < 1e-5
+
+
+def test_legacy_rows_with_missing_features():
+    """Features missing from a legacy row are skipped, as the old loop did"""
+    rng = np.random.default_rng(2)
+    enrolled = face_images(12)
+    names = list(reference_features(enrolled[0]))
+    stored = []
+    for index, image in enumerate(enrolled):
+        features = reference_features(image)
+        if index % 2:
+            for name in rng.choice(names, index, replace=False):
+                del features[name]
+        stored.append(json.loads(legacy_json(features)))
+
+    gallery = FeatureGallery()
+    gallery.add_many(np.arange(1, 13), [decode_features(legacy_json(features).encode()) for features in stored])
+    query = noisy(enrolled[3], rng)
+    query_features = reference_features(query)
+    expected = [calculate_similarity(query_features, features) for features in stored]
+    _, scores = gallery.scores(feature_vector(query))
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+
+def test_row_without_features_scores_zero():
+    """A legacy row with no usable feature never matches"""
+    gallery = FeatureGallery()
+    gallery.add(1, features_to_vector({}))
+    _, scores = gallery.scores(feature_vector(face_images(2)[0]))
+    assert scores.tolist() == [0.0]
+    assert gallery.match(feature_vector(face_images(2)[0]), tolerance=0.0) is None
+
+
+def test_binary_round_trip():
+    """Feature vectors survive the binary storage format"""
+    vector = feature_vector(face_images(2)[0])
+    np.testing.assert_array_equal(decode_features(encode_features(vector)), vector)
@@ -0,0 +1,83 @@
+"""
+Tests for length-prefixed frame streams and best-frame selection.
+"""
+
+import io
+
+import pytest
+
+from models.frame_stream import FRAME_HEADER, BestFrames, iter_frames, pack_frames
+
+
+class TrickleStream(io.BytesIO):
+    """A stream that returns at most a few bytes per read, like a chunked upload"""
+
+    def read(self, size=-1):
+        return super().read(min(size, 3) if size >= 0 else 3)
+
+
+def test_round_trip():
+    """Frames packed by pack_frames come back unchanged and in order"""
+    frames = [b'\xff\xd8first', b'second' * 100, b'x']
+    assert list(iter_frames(io.BytesIO(pack_frames(frames)))) == frames
+    assert list(iter_frames(io.BytesIO(b''))) == []
+
+
+def test_short_reads_are_reassembled():
+    """Frames split across many small reads are read whole"""
+    frames = [b'a' * 10, b'b' * 17]
+    assert list(iter_frames(TrickleStream(pack_frames(frames)))) == frames
+
+
+def test_truncated_header():
+    """A stream ending inside a length prefix is rejected"""
+    data = pack_frames([b'frame']) + b'\x00\x00'
+    frames = iter_frames(io.BytesIO(data))
+    assert next(frames) == b'frame'
+    with pytest.raises(ValueError, match='Truncated frame header'):
+        next(frames)
+
+
+def test_truncated_frame():
+    """A stream ending inside a frame body is rejected"""
+    data = FRAME_HEADER.pack(100) + b'only part of it'
+    with pytest.raises(ValueError, match='Truncated frame'):
+        list(iter_frames(io.BytesIO(data)))
+
+
+def test_oversized_and_empty_frames():
+    """Frames over max_frame_bytes, and zero-length frames, are rejected before reading the body"""
+    with pytest.raises(ValueError, match='Invalid frame size 11'):
+        list(iter_frames(io.BytesIO(pack_frames([b'x' * 11])), max_frame_bytes=10))
+    with pytest.raises(ValueError, match='Invalid frame size 0'):
+        list(iter_frames(io.BytesIO(FRAME_HEADER.pack(0)), max_frame_bytes=10))
+    # A huge declared size fails on the header alone
+    with pytest.raises(ValueError):
+        list(iter_frames(io.BytesIO(FRAME_HEADER.pack(2 ** 32 - 1))))
+
+
+def test_too_many_frames():
+    """Streams with more than max_frames frames are rejected"""
+    assert len(list(iter_frames(io.BytesIO(pack_frames([b'f'] * 3)), max_frames=3))) == 3
+    with pytest.raises(ValueError, match='More than 3 frames'):
+        list(iter_frames(io.BytesIO(pack_frames([b'f'] * 4)), max_frames=3))
+
+
+def test_best_frames_keeps_top_k():
+    """Only the k highest scores are kept, best first"""
+    best = BestFrames(3)
+    scores = [0.2, 0.9, 0.1, 0.5, 0.7, 0.3]
+    kept = [best.add(score, f'frame{index}') for index, score in enumerate(scores)]
+
+    assert kept == [True, True, True, True, True, False]
+    assert best.best() == [(0.9, 'frame1'), (0.7, 'frame4'), (0.5, 'frame3')]
+    assert best.offered == 6
+    assert len(best) == 3
+
+
+def test_best_frames_ties_keep_earliest():
+    """Among equal scores the earlier frame is kept and listed first"""
+    best = BestFrames(2)
+    for index in range(4):
+        best.add(1.0, index)
+    assert best.best() == [(1.0, 0), (1.0, 1)]
@@ -0,0 +1,82 @@
+"""
+Tests for memory-mapped gallery snapshots: round trips, empty galleries
+and checksum verification.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from models import gallery_snapshot
+from models.face_gallery import FaceGallery
+
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).astype(np.float32)
+
+
+def test_round_trip(tmp_path):
+    """A saved gallery loads back with the same rows, usernames and high-water mark"""
+    gallery = FaceGallery()
+    encodings = random_encodings(20)
+    gallery.add_many(np.arange(1, 21), encodings)
+    gallery_snapshot.save_gallery(gallery, str(tmp_path), {user_id: f'user{user_id}' for user_id in range(1, 21)})
+
+    loaded = FaceGallery()
+    assert gallery_snapshot.load_into_gallery(loaded, str(tmp_path))
+    assert loaded.high_water == 20
+    np.testing.assert_array_equal(loaded.ids, np.arange(1, 21))
+    np.testing.assert_array_equal(loaded.matrix, encodings)
+    assert loaded.match(encodings[3])[0] == 4
+    assert gallery_snapshot.load_usernames(str(tmp_path))[3] == 'user4'
+
+
+def test_empty_gallery(tmp_path):
+    """An empty gallery snapshots and loads as empty"""
+    header = gallery_snapshot.save_gallery(FaceGallery(), str(tmp_path))
+    assert header['count'] == 0
+
+    loaded = FaceGallery()
+    loaded.add(99, random_encodings(1)[0])
+    assert gallery_snapshot.load_into_gallery(loaded, str(tmp_path))
+    assert len(loaded) == 0
+    assert loaded.match(random_encodings(1)[0]) is None
+
+
+def test_missing_snapshot(tmp_path):
+    """Loading from a directory with nothing published fails cleanly"""
+    assert not gallery_snapshot.load_into_gallery(FaceGallery(), str(tmp_path / 'missing'))
+
+
+def test_corrupt_snapshot_is_rejected(tmp_path):
+    """A snapshot whose files no longer match the checksum is not loaded"""
+    gallery = FaceGallery()
+    gallery.add_many(np.arange(1, 6), random_encodings(5))
+    gallery_snapshot.save_gallery(gallery, str(tmp_path))
+
+    path = os.path.join(gallery_snapshot.current_version(str(tmp_path)), gallery_snapshot.ENCODINGS_FILE)
+    with open(path, 'r+b') as f:
+        f.seek(16)
+        f.write(b'\xff\xff\xff\xff')
+    assert not gallery_snapshot.load_into_gallery(FaceGallery(), str(tmp_path))
+
+
+def test_new_version_replaces_current(tmp_path):
+    """Each save publishes a new version and loads see only the latest one"""
+    gallery = FaceGallery()
+    gallery.add_many([1, 2], random_encodings(2))
+    gallery_snapshot.save_gallery(gallery, str(tmp_path))
+    first = gallery_snapshot.current_version(str(tmp_path))
+
+    gallery.add(3, random_encodings(1, seed=1)[0])
+    gallery_snapshot.save_gallery(gallery, str(tmp_path))
+    assert gallery_snapshot.current_version(str(tmp_path)) != first
+    assert gallery_snapshot.read_header(str(tmp_path))['count'] == 3
+
+
+def test_usernames_must_match_rows(tmp_path):
+    """A usernames list of the wrong length is refused before anything is written"""
+    with pytest.raises(ValueError):
+        gallery_snapshot.write_snapshot(str(tmp_path), [1, 2], random_encodings(2), 2, usernames=['only-one'])
+    assert gallery_snapshot.current_version(str(tmp_path)) is None
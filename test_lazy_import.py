@@ -0,0 +1,63 @@
+"""
+Tests for deferred imports, using throwaway modules written to tmp_path.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+from models import lazy_import
+
+
+@pytest.fixture
+def probe(tmp_path, monkeypatch):
+    """Name of a fresh module that records in the environment when it is executed"""
+    name = f'lazy_probe_{tmp_path.name.replace("-", "_")}'
+    (tmp_path / f'{name}.py').write_text('import os\nos.environ["LAZY_PROBE_IMPORTED"] = "1"\nVALUE = 42\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delenv('LAZY_PROBE_IMPORTED', raising=False)
+    monkeypatch.setattr(lazy_import, '_modules', {})
+    monkeypatch.setattr(lazy_import, '_load_seconds', {})
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_import_waits_for_first_attribute(probe):
+    """The module runs on first attribute access, not when the stand-in is made"""
+    module = lazy_import.lazy_import(probe)
+    assert not lazy_import.loaded(probe)
+    assert 'LAZY_PROBE_IMPORTED' not in os.environ
+    assert 'deferred' in repr(module)
+
+    assert module.VALUE == 42
+    assert lazy_import.loaded(probe)
+    assert os.environ['LAZY_PROBE_IMPORTED'] == '1'
+    assert 'loaded' in repr(module)
+    assert probe in lazy_import.load_times()
+
+
+def test_stand_ins_are_shared(probe):
+    """Every lazy_import of a name returns the same stand-in until it is loaded"""
+    assert lazy_import.lazy_import(probe) is lazy_import.lazy_import(probe)
+
+
+def test_imported_module_is_returned_directly():
+    """An already imported module is returned as is"""
+    assert lazy_import.lazy_import('json') is json
+
+
+def test_missing_module_fails_at_once():
+    """A module that is not installed fails when the stand-in is made"""
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import.lazy_import('no_such_module_for_lazy_import')
+
+
+def test_preload(probe):
+    """preload() imports deferred modules and times only the ones it loaded"""
+    lazy_import.lazy_import(probe)
+    timings = lazy_import.preload((probe, 'json'))
+    assert list(timings) == [probe]
+    assert lazy_import.loaded(probe)
+    assert lazy_import.preload((probe,)) == {}
@@ -0,0 +1,62 @@
+"""
+Tests for the in-process metrics and their Prometheus text rendering.
+"""
+
+from models import metrics
+
+
+def render(*registered):
+    registry = metrics.Registry()
+    for metric in registered:
+        registry.register(metric)
+    return registry.render().splitlines()
+
+
+def test_histogram_rendering():
+    """Buckets are cumulative and inclusive of their bound, with _sum and _count"""
+    histogram = metrics.Histogram('test_seconds', 'Test latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, stage='detect')
+
+    assert render(histogram) == [
+        '# HELP test_seconds Test latency',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="detect",le="0.1"} 2',
+        'test_seconds_bucket{stage="detect",le="1.0"} 3',
+        'test_seconds_bucket{stage="detect",le="+Inf"} 4',
+        'test_seconds_sum{stage="detect"} 5.65',
+        'test_seconds_count{stage="detect"} 4',
+    ]
+
+
+def test_histogram_series_per_label():
+    """Each label value gets its own series, sorted by label"""
+    histogram = metrics.Histogram('test_seconds', 'Test latency', ('stage',), buckets=(1.0,))
+    histogram.observe(2.0, stage='match')
+    histogram.observe(0.5, stage='encode')
+
+    lines = render(histogram)
+    assert lines.index('test_seconds_count{stage="encode"} 1') < lines.index('test_seconds_count{stage="match"} 1')
+    assert 'test_seconds_bucket{stage="match",le="1.0"} 0' in lines
+
+
+def test_counter_and_callback():
+    """Counters render their totals and callbacks are read at render time"""
+    counter = metrics.Counter('test_total', 'Test events', ('outcome',))
+    counter.inc(outcome='ok')
+    counter.inc(2, outcome='ok')
+    size = [3]
+    gauge = metrics.Callback('test_size', 'Test size', lambda: size[0])
+    size[0] = 7
+
+    lines = render(counter, gauge)
+    assert 'test_total{outcome="ok"} 3' in lines
+    assert '# TYPE test_size gauge' in lines
+    assert 'test_size 7' in lines
+
+
+def test_label_values_are_escaped():
+    """Quotes, backslashes and newlines in label values are escaped"""
+    counter = metrics.Counter('test_total', 'Test events', ('path',))
+    counter.inc(path='a"b\\c\nd')
+    assert 'test_total{path="a\\"b\\\\c\\nd"} 1' in render(counter)
@@ -0,0 +1,86 @@
+"""
+Tests for the micro-batcher: grouping, result fan-out, timeouts and
+exceptions reaching every waiter.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pytest
+
+from models.micro_batcher import MicroBatcher
+
+
+def submit_all(batcher, items):
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        futures = [pool.submit(batcher.submit, item) for item in items]
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_concurrent_submissions_share_a_batch():
+    """Requests arriving within the window are processed together, results in order"""
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, window_ms=200, max_batch=16)
+    assert submit_all(batcher, list(range(8))) == [item * 2 for item in range(8)]
+    assert len(batches) < 8
+    assert sorted(item for batch in batches for item in batch) == list(range(8))
+
+    stats = batcher.stats()
+    assert stats['submitted'] == 8
+    assert stats['batches'] == len(batches)
+    assert sum(size * count for size, count in stats['batch_size_histogram'].items()) == 8
+
+
+def test_max_batch_caps_batch_size():
+    """No batch holds more than max_batch items"""
+    sizes = []
+
+    def process(items):
+        sizes.append(len(items))
+        return items
+
+    batcher = MicroBatcher(process, window_ms=200, max_batch=3)
+    assert submit_all(batcher, list(range(10))) == list(range(10))
+    assert max(sizes) <= 3
+    assert sum(sizes) == 10
+
+
+def test_submit_times_out():
+    """A waiter gives up after timeout while its batch is still running"""
+    release = threading.Event()
+
+    def process(items):
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(process, window_ms=1, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        batcher.submit('slow')
+    release.set()
+
+    # The batcher thread is still serving later requests
+    batcher.timeout = 5
+    assert batcher.submit('next') == 'next'
+
+
+def test_exception_reaches_every_waiter():
+    """A failing batch raises its exception in every request of that batch"""
+    first_batch = threading.Event()
+
+    def process(items):
+        if not first_batch.is_set():
+            first_batch.set()
+            raise RuntimeError('matcher failed')
+        return items
+
+    batcher = MicroBatcher(process, window_ms=200, max_batch=4)
+    results = submit_all(batcher, list(range(4)))
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()['failed'] == 4
+
+    assert batcher.submit('after') == 'after'
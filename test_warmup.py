@@ -0,0 +1,90 @@
+"""
+Tests for startup warmup and the readiness it reports.
+"""
+
+import threading
+
+import numpy as np
+
+from models.warmup import Warmup, synthetic_frame
+
+
+def test_steps_run_in_order_and_become_ready():
+    """Steps run once each, in registration order, and leave the worker ready"""
+    warmup = Warmup()
+    calls = []
+    for name in ('imports', 'models', 'gallery'):
+        warmup.step(name)(lambda name=name: calls.append(name))
+
+    assert warmup.state == 'pending'
+    assert not warmup.ready
+    warmup.start()
+    assert warmup.wait(5)
+    assert calls == ['imports', 'models', 'gallery']
+
+    status = warmup.status()
+    assert status['state'] == 'ready'
+    assert list(status['steps']) == ['imports', 'models', 'gallery']
+    assert all('error' not in result for result in status['steps'].values())
+
+
+def test_failed_step_keeps_worker_unready():
+    """A raising step ends in 'failed', but the later steps still run"""
+    warmup = Warmup()
+    calls = []
+
+    @warmup.step('models')
+    def load_models():
+        raise OSError('model file missing')
+
+    warmup.step('gallery')(lambda: calls.append('gallery'))
+    warmup.start()
+
+    assert not warmup.wait(5)
+    assert warmup.state == 'failed'
+    assert calls == ['gallery']
+    assert warmup.status()['steps']['models']['error'] == 'model file missing'
+
+
+def test_running_until_steps_finish():
+    """The worker reports 'running', not ready, while a step is still going"""
+    warmup = Warmup()
+    release = threading.Event()
+    warmup.step('slow')(lambda: release.wait(5))
+    warmup.start()
+
+    assert warmup.state == 'running'
+    assert not warmup.wait(0.05)
+    release.set()
+    assert warmup.wait(5)
+
+
+def test_start_is_idempotent():
+    """Starting twice runs the steps once"""
+    warmup = Warmup()
+    calls = []
+    warmup.step('once')(lambda: calls.append(1))
+    warmup.start()
+    warmup.start()
+    warmup.wait(5)
+    assert calls == [1]
+
+
+def test_disabled_is_ready_without_running():
+    """A disabled warmup is ready at once and never runs its steps"""
+    warmup = Warmup(enabled=False)
+    calls = []
+    warmup.step('skipped')(lambda: calls.append(1))
+    warmup.start()
+
+    assert warmup.ready
+    assert warmup.wait(0)
+    assert calls == []
+
+
+def test_synthetic_frame_box():
+    """The synthetic frame's box lies inside the frame and covers the drawn face"""
+    image, (top, right, bottom, left) = synthetic_frame(320, 240)
+    assert image.shape == (240, 320, 3)
+    assert 0 <= top < bottom <= 240 and 0 <= left < right <= 320
+    assert np.array_equal(image[(top + bottom) // 2 + 5, (left + right) // 2 - 20], [224, 172, 140])